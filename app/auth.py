@@ -32,6 +32,6 @@ def decode_access_token(token: str) -> Optional[TokenData]:
         email: str = payload.get("sub")
         if email is None:
             return None
-        return TokenData(email=email)
+        return TokenData(email=email, user_id=payload.get("uid"), exp=payload.get("exp"))
     except JWTError:
         return None
@@ -7,6 +7,140 @@ class Settings(BaseSettings):
     secret_key: str = "cambiar esta clave por env"
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 60
+
+    # Pools de conexiones. Cada worker abre a lo sumo la suma de los dos motores
+    # (por defecto 10 + 5): con varios workers, cuidar el max_connections de Postgres.
+    # Motor async: las peticiones HTTP
+    db_pool_size: int = 8
+    db_max_overflow: int = 2
+    # Motor sync: programador, alertas, revalidación del reporte, historial en streaming y admin
+    db_sync_pool_size: int = 3
+    db_sync_max_overflow: int = 2
+    db_pool_timeout: float = 30.0
+    db_pool_pre_ping: bool = True
+    db_pool_recycle: int = 1800  # segundos; evita conexiones cortadas por el servidor o un proxy
+
+    # Consulta de clima (Open-Meteo)
+    # URL de la API; en pruebas de carga apunta al servidor local de benchmarks/stub_open_meteo.py
+    open_meteo_url: str = "https://api.open-meteo.com/v1/forecast"
+    open_meteo_archive_url: str = "https://archive-api.open-meteo.com/v1/archive"
+    # "lotes": varias coordenadas por consulta, lotes en paralelo
+    # "async": una consulta por cantón, concurrentes con pool de conexiones compartido
+    # "secuencial": una consulta tras otra (modo de respaldo)
+    weather_fetch_mode: str = "lotes"
+    weather_max_concurrency: int = 10
+    weather_batch_size: int = 50
+    weather_connect_timeout: float = 5.0
+    weather_read_timeout: float = 20.0
+    # Reintentos ante timeouts, errores de conexión, 429 y 5xx (backoff exponencial con jitter).
+    # weather_retry_deadline_seconds acota el total de una consulta con sus reintentos.
+    weather_max_attempts: int = 3
+    weather_backoff_base_seconds: float = 0.5
+    weather_backoff_max_seconds: float = 8.0
+    weather_retry_deadline_seconds: float = 30.0
+    # Circuito: tras N fallas seguidas no se consulta Open-Meteo durante circuit_reset_seconds
+    weather_circuit_failures: int = 5
+    weather_circuit_reset_seconds: float = 60.0
+    # Si Open-Meteo no responde, se usan las últimas features guardadas de hasta N días atrás
+    weather_stale_max_days: int = 3
+
+    # Caché de respuestas de Open-Meteo (SQLite compartido entre workers)
+    weather_cache_enabled: bool = True
+    weather_cache_path: str = "./weather_cache.db"
+    weather_cache_ttl_seconds: int = 6 * 60 * 60
+    weather_cache_max_entries: int = 5000
+
+    # Features con ventanas móviles incrementales (solo se piden los días faltantes)
+    feature_store_enabled: bool = True
+
+    # Cálculo diario del reporte (uno solo entre todos los workers)
+    report_lock_timeout_seconds: int = 300
+    report_wait_poll_seconds: float = 0.5
+
+    # Zona horaria de los días del reporte (la de las fechas de Open-Meteo con timezone=auto),
+    # independiente de la del servidor
+    zona_horaria: str = "America/Guayaquil"
+
+    # Precálculo del reporte diario en segundo plano
+    scheduler_enabled: bool = True
+    scheduler_run_times: str = "00:05"  # horas HH:MM en zona_horaria, separadas por coma
+    scheduler_run_on_startup: bool = True
+    scheduler_retry_seconds: int = 300
+    scheduler_max_retries: int = 5
+
+    # Superficie de riesgo en grilla (raster float32 en disco)
+    grid_enabled: bool = True
+    grid_dir: str = "./grid"
+    grid_step: float = 0.05          # resolución del raster (grados)
+    grid_weather_step: float = 0.25  # resolución de las consultas de clima (grados)
+    grid_max_zoom: int = 3           # zoom con resolución completa; cada nivel menos agrupa 2x2
+
+    # Backfill de reportes históricos (python -m services.backfill): cada tramo es una
+    # consulta a la API de archivo con backfill_batch_size cantones y backfill_window_days días
+    backfill_processes: int = 2  # 0 = en el mismo proceso
+    backfill_window_days: int = 366
+    backfill_batch_size: int = 50
+    backfill_checkpoint_path: str = "./backfill_checkpoint.json"
+
+    # Registro de modelos: cada <version>.json de model_dir es una versión más
+    model_dir: str = "./modelos"
+    model_poll_seconds: int = 30
+
+    # Motor de inferencia: "auto" (NumPy para lotes pequeños, XGBoost para el resto),
+    # "numpy" o "xgboost" (Booster.inplace_predict, la referencia)
+    inference_engine: str = "auto"
+    numpy_engine_max_rows: int = 16
+
+    # /predict/batch: límite de filas por petición y tamaño de cada bloque de inferencia
+    predict_batch_max_rows: int = 200_000
+    predict_batch_chunk_rows: int = 8192
+    predict_batch_max_body_mb: int = 64
+
+    # Respuesta materializada de /riesgo-sismico
+    riesgo_cache_revalidate_seconds: int = 30
+    riesgo_cache_max_age: int = 300
+
+    # Hash de contraseñas en un pool de procesos (0 = en el mismo hilo).
+    # Con más de max_pending operaciones en curso, /login y /register responden 429
+    password_pool_workers: int = 2
+    password_pool_max_pending: int = 8
+    password_pool_timeout_seconds: float = 10.0
+    password_pool_nice: int = 10  # prioridad (nice) de los procesos del pool
+
+    # Caché token -> usuario en get_current_user (por worker)
+    user_cache_max_entries: int = 10000
+    user_cache_ttl_seconds: int = 60
+    # Incluir el id del usuario ("uid") en los tokens nuevos
+    token_include_user_id: bool = True
+
+    # Ids de ciudades en memoria para validar suscripciones
+    city_cache_ttl_seconds: int = 300
+
+    # Alertas a suscriptores cuando un cantón queda en riesgo ALTO (outbox + despachador)
+    alerts_enabled: bool = True
+    alert_backend: str = "log"  # "log" | "archivo"
+    alert_file_path: str = "./alertas.jsonl"
+    alert_batch_size: int = 1000
+    alert_workers: int = 2
+    alert_poll_seconds: float = 5.0
+    alert_max_attempts: int = 5
+    alert_claim_timeout_seconds: int = 300
+
+    # Logging (reemplaza los print): nivel y formato de las líneas
+    log_level: str = "INFO"
+    log_format: str = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+    # Métricas (GET /metrics, formato Prometheus) y trazas de etapas:
+    # las peticiones más lentas que slow_request_ms se registran con el detalle de sus etapas
+    metrics_enabled: bool = True
+    slow_request_ms: float = 1000.0
+    # Perfilado por muestreo a pedido (cabeceras X-Perfilar: 1 y X-Admin-Token)
+    profiler_enabled: bool = False
+    profiler_dir: str = "./perfiles"
+    profiler_interval_ms: float = 5.0
+
+    # Token para endpoints de operadores (cabecera X-Admin-Token). Vacío = deshabilitados
+    admin_token: str = ""
     model_config = SettingsConfigDict(env_file=".env")
 
 settings = Settings()
@@ -1,37 +1,114 @@
+import logging
 import os
+import time
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.exc import OperationalError, ProgrammingError, IntegrityError
 from sqlalchemy.orm import sessionmaker, declarative_base
+from .config import settings
+from services.metrics import metricas
+
+logger = logging.getLogger(__name__)
 
 # Leemos la variable de entorno DATABASE_URL
 url_entorno = os.getenv("DATABASE_URL")
 
-print("----------------------DEBUG----------------------------")
-if url_entorno:
-    print(f"VARIABLE ENCONTRADA: {url_entorno[:15]}...") 
-    print("BASE DE DATOS: PostgreSQL")
-else:
-    print("VARIABLE 'DATABASE_URL' NO DETECTADA O VACÍA")
-    print("BASE DE DATOS: SQLite")
-print("--------------------------------------------------")
-
 SQLALCHEMY_DATABASE_URL = url_entorno if url_entorno else "sqlite:///./quakepredict.db"
 
 if SQLALCHEMY_DATABASE_URL and SQLALCHEMY_DATABASE_URL.startswith("postgres://"):
     SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
+
+
+def url_async(url):
+    """Misma base de datos con el driver async: asyncpg (Postgres) o aiosqlite (SQLite)."""
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite")
+    # asyncpg no entiende sslmode (de psycopg2): usa ssl con los mismos valores
+    if "sslmode" in url.query:
+        url = url.update_query_dict({"ssl": url.query["sslmode"]}).difference_update_query(["sslmode"])
+    return url.set(drivername="postgresql+asyncpg")
+
+
+def opciones_pool(tamano, desborde):
+    return {
+        "pool_size": tamano,
+        "max_overflow": desborde,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+        "pool_recycle": settings.db_pool_recycle,
+    }
+
+
+# Motor sync: tareas en segundo plano (programador, alertas, migraciones) y servicios sync.
+# Motor async: las peticiones HTTP; cada una espera a la BD sin ocupar un hilo.
 if "sqlite" in SQLALCHEMY_DATABASE_URL:
     engine = create_engine(
-        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False},
+        **opciones_pool(settings.db_sync_pool_size, settings.db_sync_max_overflow)
     )
 else:
-    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL, **opciones_pool(settings.db_sync_pool_size, settings.db_sync_max_overflow)
+    )
+async_engine = create_async_engine(
+    url_async(SQLALCHEMY_DATABASE_URL), **opciones_pool(settings.db_pool_size, settings.db_max_overflow)
+)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
-def get_db():
+
+def estado_pools():
+    """Conexiones de cada pool para /metrics: tamaño, en uso, libres y de desborde."""
+    valores = {}
+    for motor, pool in (("sync", engine.pool), ("async", async_engine.sync_engine.pool)):
+        for estado, metodo in (("tamano", "size"), ("en_uso", "checkedout"), ("libres", "checkedin"),
+                               ("desborde", "overflow")):
+            if hasattr(pool, metodo):
+                # overflow() es negativo mientras el pool no está lleno
+                valores[(motor, estado)] = max(0, getattr(pool, metodo)())
+    return valores
+
+
+metricas.medidor(
+    "db_pool_conexiones", "Conexiones del pool de la BD por motor y estado", ("motor", "estado"), funcion=estado_pools
+)
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def get_sync_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+def create_tables(intentos=3):
+    """
+    create_all idempotente. Si varios workers arrancan a la vez, dos pueden
+    intentar crear la misma tabla; en ese caso se vuelve a intentar.
+    """
+    for intento in range(1, intentos + 1):
+        try:
+            Base.metadata.create_all(bind=engine)
+            return
+        except (OperationalError, ProgrammingError, IntegrityError):
+            if intento == intentos:
+                raise
+            time.sleep(0.5 * intento)
+
+
+def dialect_insert(table):
+    """INSERT del dialecto actual (soporta on_conflict_do_nothing / on_conflict_do_update)."""
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
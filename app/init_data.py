@@ -1,5 +1,10 @@
+import logging
+
 from sqlalchemy.orm import Session
 from .models import City
+from .database import dialect_insert
+
+logger = logging.getLogger(__name__)
 
 # Tu lista maestra de coordenadas
 CANTONES_MUESTRA = [
@@ -26,25 +31,17 @@ CANTONES_MUESTRA = [
 ]
 
 def init_cities(db: Session):
-    print("Verificando cantones...")
-    for data in CANTONES_MUESTRA:
-        # Buscamos si la ciudad ya existe por nombre
-        city = db.query(City).filter(City.name == data["canton"]).first()
-        
-        if not city:
-            # Si no existe, la creamos
-            new_city = City(
-                name=data["canton"],
-                province=data["provincia"],
-                lat=data["lat"],
-                lon=data["lon"]
-            )
-            db.add(new_city)
-        else:
-            # Si ya existe (quizás sin coordenadas), las actualizamos
-            city.province = data["provincia"]
-            city.lat = data["lat"]
-            city.lon = data["lon"]
-    
+    """Upsert de todos los cantones en una sola sentencia (idempotente)."""
+    logger.debug("Verificando cantones...")
+    stmt = dialect_insert(City.__table__).values([
+        {"name": data["canton"], "province": data["provincia"], "lat": data["lat"], "lon": data["lon"]}
+        for data in CANTONES_MUESTRA
+    ])
+    # Si ya existe (quizás sin coordenadas), se actualizan provincia y coordenadas
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["name"],
+        set_={"province": stmt.excluded.province, "lat": stmt.excluded.lat, "lon": stmt.excluded.lon},
+    )
+    db.execute(stmt)
     db.commit()
-    print("Base de datos de cantones actualizada.")
\ No newline at end of file
+    logger.info("Base de datos de cantones actualizada.")
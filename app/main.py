@@ -1,32 +1,111 @@
 # app/main.py
-from fastapi import FastAPI, Depends, HTTPException, status
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, status, Header, Request, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, JSONResponse
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from . import models, schemas, auth
-from .database import engine, Base, get_db, SessionLocal
-from services.predict_service import sismo_service, obtener_reporte_con_historial
-from typing import List
+from .database import engine, async_engine, get_db, get_sync_db, SessionLocal, create_tables, dialect_insert
+from services.predict_service import sismo_service, obtener_reporte_con_historial, obtener_reporte_guardado
+from services.weather_cache import weather_cache
+from services.circuit_breaker import circuito_open_meteo
+from services.scheduler import programador_reporte
+from services.report_cache import reporte_materializado
+from services.history_service import consultar_historial, decodificar_cursor
+from services.grid_service import grilla_riesgo
+from services import batch_predict
+from services.password_pool import password_pool, PoolSaturado, TiempoAgotado
+from services.user_cache import cache_usuarios
+from services.city_catalog import catalogo_ciudades, registro_cantones
+from services.alert_service import despachador_alertas, generar_alertas
+from services.metrics import metricas, MiddlewareMetricas, TIPO_CONTENIDO
+from services.profiler import perfilador
+from services import fechas
+from typing import List, Optional, Literal
+from datetime import date
+import json
+import gzip
+import hmac
+from .config import settings
 from .models import City, Subscription
 from .init_data import init_cities
+from .migrations import ejecutar_migraciones
 
-models.City.__table__.drop(engine, checkfirst=True)
+logging.basicConfig(level=settings.log_level.upper(), format=settings.log_format)
+logger = logging.getLogger(__name__)
 
-# Crear las tablas si no existen
-Base.metadata.create_all(bind=engine)
+# Estado de cada componente, para /ready
+estado_arranque = {"base_de_datos": False, "modelo": False}
 
-# -----------------------------------------------------
-# solo para cargar los cantones
-try:
+
+def inicializar_base_de_datos():
+    logger.info("Base de datos: %s", engine.url.render_as_string(hide_password=True))
+    # Crear las tablas si no existen y ajustar las antiguas
+    create_tables()
+    ejecutar_migraciones(engine)
+
+    # Cargar/actualizar los cantones
+    db = SessionLocal()
+    try:
+        init_cities(db)
+        catalogo_ciudades.invalidar()
+        registro_cantones.invalidar()
+        logger.info("Inicialización de datos completada.")
+        # Sin cantones no hay reporte: /ready sigue en 503 si falló la carga
+        estado_arranque["base_de_datos"] = True
+    except Exception as e:
+        logger.exception("Error inicializando datos: %s", e)
+    finally:
+        db.close()
+
+
+def cargar_modelo():
+    sismo_service.load_model()
+    estado_arranque["modelo"] = sismo_service.model is not None
+
+
+def aplicar_modelo_activo():
+    # La versión activa se guarda en BD: solo se puede leer cuando la BD está lista
     db = SessionLocal()
-    init_cities(db)  
-    print("Inicialización de datos completada.")
-except Exception as e:
-    print(f"Error inicializando datos: {e}")
-finally:
-    db.close()
-# -----------------------------------------------------
+    try:
+        sismo_service.registro.aplicar_version_deseada(db)
+    finally:
+        db.close()
+    estado_arranque["modelo"] = sismo_service.model is not None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Base de datos y modelo se inicializan en paralelo
+    await asyncio.gather(
+        asyncio.to_thread(inicializar_base_de_datos),
+        asyncio.to_thread(cargar_modelo),
+    )
+    await asyncio.to_thread(aplicar_modelo_activo)
+    await asyncio.to_thread(password_pool.iniciar)
+
+    # Detección de nuevas versiones del modelo en segundo plano
+    vigilante_modelos = asyncio.create_task(sismo_service.registro.vigilar(SessionLocal))
 
-app = FastAPI(title="QuakePredictEC Backend")
+    # Precálculo del reporte diario en segundo plano
+    if settings.scheduler_enabled:
+        programador_reporte.iniciar()
+    # Envío de las alertas del outbox
+    if settings.alerts_enabled:
+        despachador_alertas.iniciar()
+    yield
+    vigilante_modelos.cancel()
+    await programador_reporte.detener()
+    await despachador_alertas.detener()
+    await async_engine.dispose()
+    password_pool.detener()
+
+
+app = FastAPI(title="QuakePredictEC Backend", lifespan=lifespan)
 
 # CORS
 origins = [
@@ -43,11 +122,55 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Duración por ruta, trazas de peticiones lentas y perfilado a pedido
+if settings.metrics_enabled:
+    app.add_middleware(MiddlewareMetricas, lenta_ms=settings.slow_request_ms, perfilador=perfilador)
+
+# Readiness: 200 solo cuando la BD y el modelo están listos
+@app.get("/ready")
+async def ready():
+    listo = all(estado_arranque.values())
+    cuerpo = {"listo": listo, **estado_arranque, "programador": settings.scheduler_enabled}
+    if not listo:
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=cuerpo)
+    return cuerpo
+
+# El hash de contraseñas va al pool de procesos: si está lleno se responde 429,
+# si la operación no terminó a tiempo (pool lento, no lleno), 503
+def pool_saturado():
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Demasiadas solicitudes de autenticación, intente en unos segundos.",
+        headers={"Retry-After": "1"},
+    )
+
+def pool_lento():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="La autenticación tardó demasiado, intente de nuevo.",
+    )
+
+async def hashear_en_pool(password: str) -> str:
+    try:
+        return await password_pool.hashear_async(password)
+    except PoolSaturado:
+        raise pool_saturado()
+    except TiempoAgotado:
+        raise pool_lento()
+
+async def verificar_en_pool(password: str, password_hash: str) -> bool:
+    try:
+        return await password_pool.verificar_async(password, password_hash)
+    except PoolSaturado:
+        raise pool_saturado()
+    except TiempoAgotado:
+        raise pool_lento()
+
 # Registro de usuario
 @app.post("/register", response_model=schemas.UserOut)
-def register_user(user_in: schemas.UserCreate, db: Session = Depends(get_db)):
+async def register_user(user_in: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
     # ¿correo ya existe?
-    existing = db.query(models.User).filter(models.User.email == user_in.email).first()
+    existing = await db.scalar(select(models.User).where(models.User.email == user_in.email))
     if existing:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -55,10 +178,8 @@ def register_user(user_in: schemas.UserCreate, db: Session = Depends(get_db)):
         )
     # ¿username ya existe?
     if user_in.username:
-        existing_username = (
-            db.query(models.User)
-            .filter(models.User.username == user_in.username)
-            .first()
+        existing_username = await db.scalar(
+            select(models.User).where(models.User.username == user_in.username)
         )
         if existing_username:
             raise HTTPException(
@@ -66,7 +187,7 @@ def register_user(user_in: schemas.UserCreate, db: Session = Depends(get_db)):
                 detail="El nombre de usuario ya está en uso.",
             )
 
-    hashed_password = auth.get_password_hash(user_in.password)
+    hashed_password = await hashear_en_pool(user_in.password)
 
     user = models.User(
         first_name=user_in.first_name,
@@ -76,20 +197,23 @@ def register_user(user_in: schemas.UserCreate, db: Session = Depends(get_db)):
         password_hash=hashed_password,
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
 
     return user
 
 
 # Login de usuario
 @app.post("/login", response_model=schemas.Token)
-def login(payload: schemas.LoginRequest, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == payload.email).first()
-    if not user or not auth.verify_password(payload.password, user.password_hash):
+async def login(payload: schemas.LoginRequest, db: AsyncSession = Depends(get_db)):
+    user = await db.scalar(select(models.User).where(models.User.email == payload.email))
+    if not user or not await verificar_en_pool(payload.password, user.password_hash):
         raise HTTPException(status_code=401, detail="Credenciales incorrectas.")
 
-    access_token = auth.create_access_token(data={"sub": user.email})
+    datos_token = {"sub": user.email}
+    if settings.token_include_user_id:
+        datos_token["uid"] = user.id
+    access_token = auth.create_access_token(data=datos_token)
     return {"access_token": access_token, "token_type": "bearer"}
 
 
@@ -98,104 +222,417 @@ from fastapi.security import OAuth2PasswordBearer
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    token_data = auth.decode_access_token(token)
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    # Token y usuario salen de la caché; la BD solo se consulta en un miss
+    token_data = cache_usuarios.decodificar(token)
     if token_data is None or token_data.email is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token inválido o expirado.",
         )
 
-    user = db.query(models.User).filter(models.User.email == token_data.email).first()
+    usuario = cache_usuarios.obtener_usuario(token_data)
+    if usuario is not None:
+        return usuario
+
+    if token_data.user_id is not None:
+        user = await db.get(models.User, token_data.user_id)
+        if user is not None and user.email != token_data.email:
+            user = None
+    else:
+        user = await db.scalar(select(models.User).where(models.User.email == token_data.email))
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Usuario no encontrado.",
         )
-    return user
+    return cache_usuarios.guardar_usuario(token_data, user)
 
 @app.get("/me", response_model=schemas.UserOut)
-def read_me(current_user=Depends(get_current_user)):
+async def read_me(current_user=Depends(get_current_user)):
     return current_user
 
+def materializar_reporte():
+    if settings.scheduler_enabled:
+        # El programador precalcula el reporte: aquí solo se lee lo guardado
+        construir = obtener_reporte_guardado
+    else:
+        construir = obtener_reporte_con_historial
+
+    db = SessionLocal()
+    try:
+        return reporte_materializado.obtener(db, construir)
+    finally:
+        db.close()
+
 @app.get("/riesgo-sismico")
-def obtener_riesgo(db: Session = Depends(get_db)):
+async def obtener_riesgo(request: Request):
     """
     Retorna la lista de cantones con su predicción de sismo.
     El frontend usará esto para pintar el mapa.
+    La respuesta sale ya serializada de memoria y soporta If-None-Match (304).
     """
-    datos = obtener_reporte_con_historial(db)
-    return datos
+    # Casi siempre se responde desde memoria; revalidar (o calcular) usa los servicios sync en un hilo
+    respuesta = reporte_materializado.vigente()
+    if respuesta is None:
+        respuesta = await asyncio.to_thread(materializar_reporte)
+    if respuesta is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="El reporte de riesgo se está preparando, intente en unos minutos.",
+        )
+
+    headers = {
+        "ETag": respuesta.etag,
+        "Cache-Control": f"public, max-age={settings.riesgo_cache_max_age}",
+        "Vary": "Accept-Encoding",
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if respuesta.etag in [e.strip() for e in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    cuerpo = respuesta.cuerpo
+    if respuesta.cuerpo_gzip is not None and "gzip" in request.headers.get("accept-encoding", ""):
+        cuerpo = respuesta.cuerpo_gzip
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=cuerpo, media_type="application/json", headers=headers)
+
+# Riesgo de hoy en los k cantones más cercanos a un punto (p. ej. la posición GPS del usuario)
+@app.get("/riesgo-sismico/punto")
+async def riesgo_punto(
+    lat: float = Query(ge=-90, le=90),
+    lon: float = Query(ge=-180, le=180),
+    k: int = Query(default=1, ge=1, le=50),
+):
+    # Reporte e índice de cantones salen de memoria; solo al revalidar se usa la BD (en un hilo)
+    respuesta = reporte_materializado.vigente()
+    if respuesta is None:
+        respuesta = await asyncio.to_thread(materializar_reporte)
+    if respuesta is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="El reporte de riesgo se está preparando, intente en unos minutos.",
+        )
+    indice = registro_cantones.vigente()
+    if indice is None:
+        indice = await asyncio.to_thread(registro_cantones.obtener)
+
+    cantones = []
+    for canton, distancia in indice.cercanos(lat, lon, k):
+        # Un cantón agregado después del cálculo de hoy todavía no tiene riesgo
+        fila = respuesta.por_canton.get(canton["canton"]) or {
+            "canton": canton["canton"], "lat": canton["lat"], "lon": canton["lon"],
+            "probabilidad": None, "nivel_riesgo": None, "color": None,
+        }
+        cantones.append({**fila, "provincia": canton["provincia"], "distancia_km": round(distancia, 2)})
+    return {"lat": lat, "lon": lon, "cantones": cantones}
+
+# Historial de riesgo (diario o resumido por semana/mes) con paginación por cursor
+@app.get("/riesgo-sismico/historial")
+def historial_riesgo(
+    granularidad: Literal["dia", "semana", "mes"] = "dia",
+    canton: Optional[List[str]] = Query(default=None),
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    cursor: Optional[str] = None,
+    limite: int = Query(default=1000, ge=1, le=10000),
+):
+    if cursor:
+        try:
+            decodificar_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    def generar():
+        # Sesión propia: la respuesta se sigue enviando después de salir del endpoint
+        db = SessionLocal()
+        try:
+            yield '{"datos":['
+            primero = True
+            for fila in consultar_historial(db, granularidad, canton, desde, hasta, cursor, limite):
+                if "siguiente" in fila:
+                    yield '],"siguiente":' + json.dumps(fila["siguiente"]) + '}'
+                    break
+                yield ('' if primero else ',') + json.dumps(fila, ensure_ascii=False)
+                primero = False
+        finally:
+            db.close()
+
+    return StreamingResponse(generar(), media_type="application/json")
+
+# Superficie de riesgo en grilla: raster float32 little-endian (filas de norte a sur, NaN = sin dato)
+def cargar_grilla_o_404(fecha: Optional[date]):
+    meta, raster = grilla_riesgo.cargar(fecha)
+    if meta is None:
+        raise HTTPException(status_code=404, detail="No hay grilla de riesgo calculada.")
+    return meta, raster
+
+def parsear_bbox(bbox: Optional[str]):
+    if bbox is None:
+        return None
+    try:
+        lon_min, lat_min, lon_max, lat_max = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox debe ser lon_min,lat_min,lon_max,lat_max")
+    if lon_min >= lon_max or lat_min >= lat_max:
+        raise HTTPException(status_code=400, detail="bbox vacío.")
+    return lon_min, lat_min, lon_max, lat_max
+
+@app.get("/riesgo-sismico/grilla/info")
+def info_grilla(fecha: Optional[date] = None, bbox: Optional[str] = None,
+                zoom: Optional[int] = Query(default=None, ge=0)):
+    meta, raster = cargar_grilla_o_404(fecha)
+    _, meta_recorte = grilla_riesgo.recortar(meta, raster, parsear_bbox(bbox), zoom)
+    return meta_recorte
+
+@app.get("/riesgo-sismico/grilla")
+def grilla(request: Request, fecha: Optional[date] = None, bbox: Optional[str] = None,
+           zoom: Optional[int] = Query(default=None, ge=0)):
+    meta, raster = cargar_grilla_o_404(fecha)
+    recorte, meta_recorte = grilla_riesgo.recortar(meta, raster, parsear_bbox(bbox), zoom)
+
+    cuerpo = recorte.astype("<f4").tobytes()
+    headers = {
+        "X-Grid-Fecha": meta_recorte["fecha"],
+        "X-Grid-Shape": f"{meta_recorte['filas']},{meta_recorte['columnas']}",
+        "X-Grid-Paso": str(meta_recorte["paso"]),
+        "X-Grid-Origen": f"{meta_recorte['lat_norte']},{meta_recorte['lon_oeste']}",
+        "X-Grid-Dtype": meta_recorte["dtype"],
+        "Cache-Control": f"public, max-age={settings.riesgo_cache_max_age}",
+        "Vary": "Accept-Encoding",
+    }
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        cuerpo = gzip.compress(cuerpo, compresslevel=6)
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=cuerpo, media_type="application/octet-stream", headers=headers)
+
+# Predicción en lote sobre filas de features enviadas por el cliente (escenarios "qué pasa si")
+# Entrada: JSON {"columnas": {...}} o un .npy (application/x-npy, cabecera X-Feature-Names opcional).
+# Salida: JSON, o float32 little-endian si se pide Accept: application/octet-stream.
+@app.post("/predict/batch")
+async def predecir_lote(
+    request: Request,
+    version: Optional[str] = None,
+    x_feature_names: Optional[str] = Header(default=None),
+    current_user=Depends(get_current_user),
+):
+    limite_bytes = settings.predict_batch_max_body_mb * 1024 * 1024
+    if int(request.headers.get("content-length") or 0) > limite_bytes:
+        raise HTTPException(status_code=413, detail="El cuerpo de la petición es demasiado grande.")
+    cuerpo = await request.body()
+    if len(cuerpo) > limite_bytes:
+        raise HTTPException(status_code=413, detail="El cuerpo de la petición es demasiado grande.")
+
+    # Misma versión del modelo para validar columnas y predecir
+    activo = sismo_service.registro.versiones.get(version) if version else sismo_service.registro.activo
+    if activo is None:
+        if version:
+            raise HTTPException(status_code=404, detail=f"No existe la versión '{version}'.")
+        raise HTTPException(status_code=503, detail="El modelo no está disponible.")
+
+    tipo = request.headers.get("content-type", batch_predict.TIPO_JSON).split(";")[0].strip()
+    try:
+        if tipo == batch_predict.TIPO_NPY:
+            nombres = [n.strip() for n in x_feature_names.split(",")] if x_feature_names else None
+            matriz = await asyncio.to_thread(batch_predict.matriz_desde_npy, cuerpo, activo.feature_names, nombres)
+        elif tipo == batch_predict.TIPO_JSON:
+            matriz = await asyncio.to_thread(batch_predict.matriz_desde_json, cuerpo, activo.feature_names)
+        else:
+            raise HTTPException(status_code=415, detail=f"Tipo de contenido no soportado: {tipo}")
+    except batch_predict.DemasiadasFilas as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except batch_predict.EntradaInvalida as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    bloques = batch_predict.predecir_por_bloques(sismo_service, matriz, activo)
+    headers = {"X-Version-Modelo": activo.version, "X-Filas": str(matriz.shape[0])}
+    if batch_predict.TIPO_BINARIO in request.headers.get("accept", ""):
+        headers["X-Dtype"] = "float32-le"
+        return StreamingResponse(
+            batch_predict.respuesta_binaria(bloques), media_type=batch_predict.TIPO_BINARIO, headers=headers
+        )
+    return StreamingResponse(
+        batch_predict.respuesta_json(bloques, activo, matriz.shape[0]), media_type="application/json", headers=headers
+    )
+
+# Endpoints de operadores (cabecera X-Admin-Token)
+async def require_admin(x_admin_token: Optional[str] = Header(default=None)):
+    # Comparación en tiempo constante (no filtra cuántos caracteres coinciden)
+    if not settings.admin_token or not hmac.compare_digest(
+        (x_admin_token or "").encode(), settings.admin_token.encode()
+    ):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No autorizado.")
+
+# Estado del cálculo programado
+@app.get("/riesgo-sismico/estado")
+def estado_reporte():
+    return {
+        "programador_activo": settings.scheduler_enabled,
+        "ejecutando": programador_reporte.ejecutando,
+        **programador_reporte.estado,
+        "circuito_open_meteo": circuito_open_meteo.estadisticas(),
+    }
+
+# Registro de modelos
+@app.get("/admin/modelos", dependencies=[Depends(require_admin)])
+def listar_modelos():
+    return {"activo": sismo_service.version_modelo, "versiones": sismo_service.registro.listar()}
+
+@app.post("/admin/modelos/recargar", dependencies=[Depends(require_admin)])
+def recargar_modelos():
+    cargadas = sismo_service.registro.sincronizar()
+    return {"cargadas": cargadas, "versiones": sismo_service.registro.listar()}
+
+def registrar_version(version: Optional[str]):
+    """Activa `version` (None = la anterior) y la registra en la BD (registro sync, va en un hilo)."""
+    db = SessionLocal()
+    try:
+        if version is None:
+            version = sismo_service.registro.version_anterior(db)
+            if version is None:
+                raise HTTPException(status_code=409, detail="No hay una versión anterior.")
+        try:
+            sismo_service.registro.registrar_activacion(db, version)
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"No existe la versión '{version}'.")
+        return version
+    finally:
+        db.close()
+
+async def activar_version(version: Optional[str], recalcular: bool):
+    version = await asyncio.to_thread(registrar_version, version)
+    recalculando = recalcular and programador_reporte.disparar(forzar=True)
+    return {"ok": True, "activo": version, "recalculando": recalculando}
+
+# recalcular=true vuelve a calcular el reporte de hoy con la nueva versión
+@app.post("/admin/modelos/{version}/activar", dependencies=[Depends(require_admin)])
+async def activar_modelo(version: str, recalcular: bool = False):
+    return await activar_version(version, recalcular)
+
+@app.post("/admin/modelos/rollback", dependencies=[Depends(require_admin)])
+async def rollback_modelo(recalcular: bool = False):
+    return await activar_version(None, recalcular)
+
+# Ejecutar el cálculo manualmente (forzar=true recalcula el reporte de hoy y lo reemplaza)
+@app.post("/admin/reporte/ejecutar", status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(require_admin)])
+async def ejecutar_reporte(forzar: bool = False):
+    if not programador_reporte.disparar(forzar):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Ya hay un cálculo en curso.")
+    return {"ok": True, "forzar": forzar}
+
+# Alertas a suscriptores (outbox)
+@app.get("/admin/alertas", dependencies=[Depends(require_admin)])
+def estado_alertas(db: Session = Depends(get_sync_db)):
+    return despachador_alertas.estadisticas(db)
+
+# Vuelve a generar las alertas de un día (las ya existentes no se duplican)
+@app.post("/admin/alertas/generar", dependencies=[Depends(require_admin)])
+def generar_alertas_dia(fecha: Optional[date] = None, db: Session = Depends(get_sync_db)):
+    return {"fecha": fecha or fechas.hoy(), "creadas": generar_alertas(db, fecha or fechas.hoy())}
+
+# Métricas del worker en formato Prometheus
+@app.get("/metrics", include_in_schema=False)
+def exponer_metricas():
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Métricas deshabilitadas.")
+    return Response(content=metricas.exponer(), media_type=TIPO_CONTENIDO)
+
+# Estadísticas de la caché de usuarios autenticados (hits/misses)
+@app.get("/cache/usuarios", dependencies=[Depends(require_admin)])
+def estadisticas_cache_usuarios():
+    return cache_usuarios.estadisticas()
+
+# Estadísticas de la caché de clima (hits/misses)
+@app.get("/cache/clima", dependencies=[Depends(require_admin)])
+def estadisticas_cache_clima():
+    if weather_cache is None:
+        return {"habilitada": False}
+    return {"habilitada": True, **weather_cache.estadisticas()}
 
 # Endpoint para listar ciudades
 @app.get("/cities", response_model=List[schemas.CityOut])
-def list_cities(db: Session = Depends(get_db)):
-    return db.query(City).order_by(City.name.asc()).all()
+async def list_cities(db: AsyncSession = Depends(get_db)):
+    return (await db.scalars(select(City).order_by(City.name.asc()))).all()
 
 # Suscribirse a varias ciudades (requiere login)
+# Un solo INSERT ... ON CONFLICT DO NOTHING: las suscripciones existentes se ignoran
 @app.post("/subscribe")
-def subscribe(payload: schemas.SubscribeRequest,
-              db: Session = Depends(get_db),
-              current_user=Depends(get_current_user)):
-
-    # validar que existan
-    cities = db.query(City).filter(City.id.in_(payload.city_ids)).all()
-    found_ids = {c.id for c in cities}
-    missing = [cid for cid in payload.city_ids if cid not in found_ids]
+async def subscribe(payload: schemas.SubscribeRequest,
+                    db: AsyncSession = Depends(get_db),
+                    current_user=Depends(get_current_user)):
+
+    city_ids = list(dict.fromkeys(payload.city_ids))
+    # validar que existan (contra los ids en memoria)
+    missing = await catalogo_ciudades.desconocidos(db, city_ids)
     if missing:
         raise HTTPException(status_code=400, detail=f"Ciudades no válidas: {missing}")
-
-    created = 0
-    for cid in payload.city_ids:
-        exists = db.query(Subscription).filter(
-            Subscription.user_id == current_user.id,
-            Subscription.city_id == cid
-        ).first()
-        if not exists:
-            db.add(Subscription(user_id=current_user.id, city_id=cid))
-            created += 1
-
-    db.commit()
+    if not city_ids:
+        return {"ok": True, "added": 0}
+
+    stmt = dialect_insert(Subscription.__table__).values([
+        {"user_id": current_user.id, "city_id": cid} for cid in city_ids
+    ]).on_conflict_do_nothing(index_elements=["user_id", "city_id"])
+    created = (await db.execute(stmt)).rowcount
+    await db.commit()
     return {"ok": True, "added": created}
 
 # Ver mis suscripciones
 @app.get("/my-subscriptions", response_model=List[schemas.CityOut])
-def my_subscriptions(db: Session = Depends(get_db),
-                     current_user=Depends(get_current_user)):
+async def my_subscriptions(db: AsyncSession = Depends(get_db),
+                           current_user=Depends(get_current_user)):
 
-    rows = (
-        db.query(City)
+    rows = await db.scalars(
+        select(City)
         .join(Subscription, Subscription.city_id == City.id)
-        .filter(Subscription.user_id == current_user.id)
+        .where(Subscription.user_id == current_user.id)
         .order_by(City.name.asc())
-        .all()
     )
-    return rows
+    return rows.all()
 
 # Desuscribirse de una ciudad
 @app.delete("/unsubscribe/{city_id}")
-def unsubscribe(city_id: int,
-                db: Session = Depends(get_db),
-                current_user=Depends(get_current_user)):
+async def unsubscribe(city_id: int,
+                      db: AsyncSession = Depends(get_db),
+                      current_user=Depends(get_current_user)):
 
-    sub = db.query(Subscription).filter(
+    sub = await db.scalar(select(Subscription).where(
         Subscription.user_id == current_user.id,
         Subscription.city_id == city_id
-    ).first()
+    ))
 
     if not sub:
         raise HTTPException(status_code=404, detail="No estabas suscrito a esa ciudad.")
 
-    db.delete(sub)
-    db.commit()
+    await db.delete(sub)
+    await db.commit()
     return {"ok": True}
 
 
+# Desuscribirse de varias ciudades en un solo DELETE
+@app.post("/unsubscribe")
+async def unsubscribe_many(payload: schemas.UnsubscribeRequest,
+                           db: AsyncSession = Depends(get_db),
+                           current_user=Depends(get_current_user)):
+    city_ids = list(dict.fromkeys(payload.city_ids))
+    if not city_ids:
+        return {"ok": True, "removed": 0}
+
+    removed = (await db.execute(
+        delete(Subscription).where(
+            Subscription.user_id == current_user.id,
+            Subscription.city_id.in_(city_ids),
+        )
+    )).rowcount
+    await db.commit()
+    return {"ok": True, "removed": removed}
+
 @app.post("/seed-cities")
-def seed_cities(db: Session = Depends(get_db)):
+async def seed_cities(db: AsyncSession = Depends(get_db)):
     names = ["Quito", "Guayaquil", "Cuenca", "Manta"]
     for n in names:
-        if not db.query(City).filter(City.name == n).first():
+        if not await db.scalar(select(City).where(City.name == n)):
             db.add(City(name=n))
-    db.commit()
+    await db.commit()
+    catalogo_ciudades.invalidar()
+    registro_cantones.invalidar()
     return {"ok": True}
@@ -0,0 +1,163 @@
+# app/migrations.py
+# Migraciones simples e idempotentes que se ejecutan al iniciar, después de create_all.
+# create_all solo crea tablas nuevas; aquí se ajustan las tablas que ya existían.
+import logging
+import time
+
+from sqlalchemy import inspect, text, update, func
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from .models import PredictionReport, WeeklyRiskRollup
+
+logger = logging.getLogger(__name__)
+
+# Clave del advisory lock de Postgres que serializa las migraciones entre workers
+LOCK_MIGRACIONES = 72_401_512
+
+
+def agregar_columnas_cities(engine: Engine):
+    """Tablas cities creadas antes de tener provincia y coordenadas."""
+    columnas = {c["name"] for c in inspect(engine).get_columns("cities")}
+    faltantes = [
+        ("province", "VARCHAR"),
+        ("lat", "FLOAT NOT NULL DEFAULT 0.0"),
+        ("lon", "FLOAT NOT NULL DEFAULT 0.0"),
+    ]
+    with engine.begin() as conn:
+        for nombre, tipo in faltantes:
+            if nombre not in columnas:
+                logger.info("Migración: agregando cities.%s", nombre)
+                conn.execute(text(f"ALTER TABLE cities ADD COLUMN {nombre} {tipo}"))
+
+
+def agregar_report_date(engine: Engine):
+    """
+    Agrega prediction_reports.report_date, la rellena desde created_at
+    y crea el índice compuesto (report_date, location).
+    """
+    columnas = {c["name"] for c in inspect(engine).get_columns("prediction_reports")}
+
+    with engine.begin() as conn:
+        if "report_date" not in columnas:
+            logger.info("Migración: agregando prediction_reports.report_date")
+            # Se agrega como NULL-able para poder rellenar las filas existentes
+            conn.execute(text("ALTER TABLE prediction_reports ADD COLUMN report_date DATE"))
+
+        # Relleno: mismo criterio que usaba la consulta anterior (date(created_at))
+        tabla = PredictionReport.__table__
+        resultado = conn.execute(
+            update(tabla)
+            .where(tabla.c.report_date.is_(None))
+            .values(report_date=func.date(tabla.c.created_at))
+        )
+        if resultado.rowcount:
+            logger.info("Migración: report_date rellenado en %d filas", resultado.rowcount)
+
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_prediction_reports_report_date_location "
+            "ON prediction_reports (report_date, location)"
+        ))
+
+
+def agregar_model_version(engine: Engine):
+    columnas = {c["name"] for c in inspect(engine).get_columns("prediction_reports")}
+    if "model_version" not in columnas:
+        logger.info("Migración: agregando prediction_reports.model_version")
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE prediction_reports ADD COLUMN model_version VARCHAR"))
+
+
+def agregar_weather_date(engine: Engine):
+    columnas = {c["name"] for c in inspect(engine).get_columns("prediction_reports")}
+    if "weather_date" not in columnas:
+        logger.info("Migración: agregando prediction_reports.weather_date")
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE prediction_reports ADD COLUMN weather_date DATE"))
+
+
+def agregar_token_calculo(engine: Engine):
+    columnas = {c["name"] for c in inspect(engine).get_columns("daily_report_runs")}
+    if "token" not in columnas:
+        logger.info("Migración: agregando daily_report_runs.token")
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE daily_report_runs ADD COLUMN token VARCHAR"))
+
+
+def indice_unico_reportes(engine: Engine):
+    """
+    (report_date, location) pasa a ser único para poder hacer upsert (backfill).
+    Si hubiera duplicados de antes, se conserva el último insertado.
+    """
+    indices = {i["name"]: i for i in inspect(engine).get_indexes("prediction_reports")}
+    indice = indices.get("ix_prediction_reports_report_date_location")
+    if indice is not None and indice["unique"]:
+        return
+    logger.info("Migración: índice único en prediction_reports (report_date, location)")
+    with engine.begin() as conn:
+        resultado = conn.execute(text(
+            "DELETE FROM prediction_reports WHERE id NOT IN "
+            "(SELECT MAX(id) FROM prediction_reports GROUP BY report_date, location)"
+        ))
+        if resultado.rowcount:
+            logger.warning("Migración: %d reportes duplicados eliminados", resultado.rowcount)
+        conn.execute(text("DROP INDEX IF EXISTS ix_prediction_reports_report_date_location"))
+        conn.execute(text(
+            "CREATE UNIQUE INDEX ix_prediction_reports_report_date_location "
+            "ON prediction_reports (report_date, location)"
+        ))
+
+
+def agregar_indice_suscripciones(engine: Engine):
+    """Índice por ciudad en subscriptions (búsqueda de suscriptores para las alertas)."""
+    with engine.begin() as conn:
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_subscriptions_city_id ON subscriptions (city_id)"))
+
+
+def rellenar_rollups(engine: Engine):
+    """Genera los resúmenes semanal/mensual para reportes guardados antes de existir esas tablas."""
+    from services.history_service import reconstruir_rollups
+
+    with Session(engine) as db:
+        hay_reportes = db.query(PredictionReport.id).first() is not None
+        hay_resumenes = db.query(WeeklyRiskRollup.location).first() is not None
+        if hay_reportes and not hay_resumenes:
+            logger.info("Migración: generando resúmenes semanales y mensuales")
+            reconstruir_rollups(db)
+
+
+def ejecutar_migraciones(engine: Engine, intentos=3):
+    """
+    Todos los workers ejecutan las migraciones al arrancar. En Postgres se serializan
+    con un advisory lock (los demás esperan y luego no encuentran nada que hacer);
+    como cada paso vuelve a revisar el esquema, si aun así dos chocan (o en SQLite)
+    se reintenta.
+    """
+    for intento in range(1, intentos + 1):
+        try:
+            if engine.dialect.name == "postgresql":
+                with engine.connect() as conn:
+                    conn.execute(text("SELECT pg_advisory_lock(:clave)"), {"clave": LOCK_MIGRACIONES})
+                    try:
+                        _ejecutar_migraciones(engine)
+                    finally:
+                        conn.execute(text("SELECT pg_advisory_unlock(:clave)"), {"clave": LOCK_MIGRACIONES})
+            else:
+                _ejecutar_migraciones(engine)
+            return
+        except (OperationalError, ProgrammingError, IntegrityError) as e:
+            if intento == intentos:
+                raise
+            logger.warning("Migraciones en conflicto con otro worker (intento %d): %s", intento, e)
+            time.sleep(0.5 * intento)
+
+
+def _ejecutar_migraciones(engine: Engine):
+    agregar_columnas_cities(engine)
+    agregar_report_date(engine)
+    agregar_model_version(engine)
+    agregar_weather_date(engine)
+    agregar_token_calculo(engine)
+    indice_unico_reportes(engine)
+    agregar_indice_suscripciones(engine)
+    rellenar_rollups(engine)
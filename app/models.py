@@ -1,5 +1,5 @@
 # app/models.py
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, UniqueConstraint, Float
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, UniqueConstraint, Float, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
@@ -39,7 +39,11 @@ class Subscription(Base):
     city = relationship("City", back_populates="subscriptions")
 
     # evita que el mismo usuario se suscriba 2 veces a la misma ciudad
-    __table_args__ = (UniqueConstraint("user_id", "city_id", name="uq_user_city"),)
+    # ix_subscriptions_city_id: suscriptores de una ciudad (alertas)
+    __table_args__ = (
+        UniqueConstraint("user_id", "city_id", name="uq_user_city"),
+        Index("ix_subscriptions_city_id", "city_id"),
+    )
 
 class PredictionReport(Base):
     __tablename__ = "prediction_reports"
@@ -53,4 +57,114 @@ class PredictionReport(Base):
     
     probability = Column(Float, nullable=False)
     
-    risk_level = Column(String, nullable=False)
\ No newline at end of file
+    risk_level = Column(String, nullable=False)
+
+    # Día del reporte (fecha local del cálculo). Se filtra por esta columna
+    # en lugar de func.date(created_at), que no puede usar índices.
+    report_date = Column(Date, nullable=False)
+
+    # Versión del modelo que produjo la predicción (ver services/model_registry.py)
+    model_version = Column(String, nullable=True)
+
+    # Último día de clima usado: anterior a report_date si Open-Meteo no respondió
+    # y se usaron las últimas features guardadas (datos atrasados)
+    weather_date = Column(Date, nullable=True)
+
+    __table_args__ = (
+        # Único: un reporte por cantón y día (el backfill hace upsert sobre este índice)
+        Index("ix_prediction_reports_report_date_location", "report_date", "location", unique=True),
+    )
+
+class DailyReportRun(Base):
+    """
+    Marca del cálculo diario: solo el proceso que logra insertar la fila
+    del día ejecuta el cálculo; los demás esperan a que termine.
+    """
+    __tablename__ = "daily_report_runs"
+
+    report_date = Column(Date, primary_key=True)
+    # "calculando" | "listo" | "error"
+    status = Column(String, nullable=False)
+    started_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    # Identifica el reclamo vigente: solo quien lo tiene puede cerrar la marca
+    token = Column(String, nullable=True)
+
+
+class WeeklyRiskRollup(Base):
+    """Resumen semanal por cantón (semana ISO, empieza el lunes)."""
+    __tablename__ = "prediction_rollups_weekly"
+    __table_args__ = (Index("ix_prediction_rollups_weekly_period_location", "period_start", "location"),)
+
+    location = Column(String, primary_key=True)
+    period_start = Column(Date, primary_key=True)
+    days = Column(Integer, nullable=False)
+    prob_sum = Column(Float, nullable=False)
+    prob_max = Column(Float, nullable=False)
+    alto_days = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class MonthlyRiskRollup(Base):
+    """Resumen mensual por cantón."""
+    __tablename__ = "prediction_rollups_monthly"
+    __table_args__ = (Index("ix_prediction_rollups_monthly_period_location", "period_start", "location"),)
+
+    location = Column(String, primary_key=True)
+    period_start = Column(Date, primary_key=True)
+    days = Column(Integer, nullable=False)
+    prob_sum = Column(Float, nullable=False)
+    prob_max = Column(Float, nullable=False)
+    alto_days = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class WeatherDaily(Base):
+    """Clima diario por cantón (lo que devuelve Open-Meteo), base del almacén de features."""
+    __tablename__ = "weather_daily"
+
+    location = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    precipitation_sum = Column(Float, nullable=True)
+    temperature_2m_mean = Column(Float, nullable=True)
+    pressure_msl_mean = Column(Float, nullable=True)
+    fetched_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ModelActivation(Base):
+    """Historial de versiones activadas; la última fila es la versión activa."""
+    __tablename__ = "model_activations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    version = Column(String, nullable=False)
+    activated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class AlertOutbox(Base):
+    """
+    Alertas pendientes de enviar a los suscriptores (patrón outbox).
+    Una sola alerta por usuario, ciudad y día; el despachador las envía por lotes.
+    """
+    __tablename__ = "alert_outbox"
+    __table_args__ = (
+        UniqueConstraint("user_id", "city_id", "report_date", name="uq_alert_user_city_day"),
+        Index("ix_alert_outbox_status_id", "status", "id"),
+        Index("ix_alert_outbox_report_date", "report_date"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    city_id = Column(Integer, ForeignKey("cities.id"), nullable=False)
+    report_date = Column(Date, nullable=False)
+    location = Column(String, nullable=False)
+    probability = Column(Float, nullable=False)
+    risk_level = Column(String, nullable=False)
+    # "pendiente" | "enviando" | "enviada" | "error"
+    status = Column(String, nullable=False, default="pendiente")
+    attempts = Column(Integer, nullable=False, default=0)
+    # Lote que reclamó la alerta (ver services/alert_service.py)
+    claim_token = Column(String, nullable=True)
+    claimed_at = Column(DateTime, nullable=True)
+    sent_at = Column(DateTime, nullable=True)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -36,6 +36,8 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     email: Optional[str] = None
+    user_id: Optional[int] = None
+    exp: Optional[int] = None
 
 class CityOut(BaseModel):
     id: int
@@ -47,6 +49,9 @@ class CityOut(BaseModel):
 class SubscribeRequest(BaseModel):
     city_ids: List[int]   # ejemplo: [1,2,5]
 
+class UnsubscribeRequest(BaseModel):
+    city_ids: List[int]
+
 class SubscriptionOut(BaseModel):
     city: CityOut
 
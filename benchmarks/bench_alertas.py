@@ -0,0 +1,131 @@
+"""
+Alertas a suscriptores con muchos usuarios: generación (join + outbox) y envío.
+
+Crea un SQLite temporal con --usuarios usuarios suscritos a --por-usuario cantones
+y un reporte de hoy con varios cantones en ALTO. Mide:
+- generar_alertas: tiempo y pico de memoria de Python (tracemalloc);
+- una segunda ejecución (no debe crear alertas duplicadas);
+- el vaciado del outbox con --trabajadores hilos hacia un archivo JSONL,
+  verificando que cada alerta se entregue exactamente una vez.
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_alertas --usuarios 100000 --por-usuario 3
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date, datetime
+
+DIRECTORIO = tempfile.mkdtemp(prefix="bench_alertas_")
+# La URL se fija antes de importar app.database (el engine se crea al importar)
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(DIRECTORIO, 'alertas.db')}"
+
+from app import models  # noqa: E402
+from app.database import SessionLocal, create_tables, engine  # noqa: E402
+from app.init_data import init_cities, CANTONES_MUESTRA  # noqa: E402
+from services.alert_service import DespachadorAlertas, SalidaArchivo, generar_alertas  # noqa: E402
+
+
+def poblar(usuarios, por_usuario, cantones_alto):
+    create_tables()
+    db = SessionLocal()
+    try:
+        init_cities(db)
+        ciudades = [c for (c,) in db.query(models.City.id)]
+    finally:
+        db.close()
+
+    rnd = random.Random(0)
+    ahora = datetime.utcnow()
+    with engine.begin() as conn:
+        for inicio in range(0, usuarios, 20000):
+            ids = range(inicio + 1, min(usuarios, inicio + 20000) + 1)
+            conn.execute(models.User.__table__.insert(), [
+                {"id": i, "first_name": "U", "last_name": str(i), "email": f"u{i}@example.com",
+                 "password_hash": "x", "created_at": ahora}
+                for i in ids
+            ])
+            conn.execute(models.Subscription.__table__.insert(), [
+                {"user_id": i, "city_id": c, "created_at": ahora}
+                for i in ids for c in rnd.sample(ciudades, por_usuario)
+            ])
+        conn.execute(models.PredictionReport.__table__.insert(), [
+            {"location": c["canton"], "probability": 0.9 if c["canton"] in cantones_alto else 0.1,
+             "risk_level": "ALTO" if c["canton"] in cantones_alto else "BAJO",
+             "report_date": date.today(), "created_at": ahora, "model_version": "base"}
+            for c in CANTONES_MUESTRA
+        ])
+
+
+def generar(medir_memoria=False):
+    db = SessionLocal()
+    try:
+        if medir_memoria:
+            tracemalloc.start()
+        inicio = time.perf_counter()
+        creadas = generar_alertas(db, date.today())
+        duracion = time.perf_counter() - inicio
+        pico = None
+        if medir_memoria:
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        return creadas, duracion, pico
+    finally:
+        db.close()
+
+
+def vaciar_outbox():
+    with engine.begin() as conn:
+        conn.execute(models.AlertOutbox.__table__.delete())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--usuarios", type=int, default=100000)
+    parser.add_argument("--por-usuario", type=int, default=3)
+    parser.add_argument("--cantones-alto", type=int, default=5)
+    parser.add_argument("--trabajadores", type=int, default=4)
+    parser.add_argument("--lote", type=int, default=1000)
+    args = parser.parse_args()
+
+    cantones_alto = {c["canton"] for c in CANTONES_MUESTRA[:args.cantones_alto]}
+    inicio = time.perf_counter()
+    poblar(args.usuarios, args.por_usuario, cantones_alto)
+    print(f"BD temporal: {DIRECTORIO} ({args.usuarios} usuarios, "
+          f"{args.usuarios * args.por_usuario} suscripciones, {time.perf_counter() - inicio:.1f}s)")
+
+    # tracemalloc vuelve lento el código: tiempo y memoria se miden en ejecuciones separadas
+    _, _, pico = generar(medir_memoria=True)
+    vaciar_outbox()
+    creadas, duracion, _ = generar()
+    print(f"generar_alertas: {creadas} alertas en {duracion:.2f}s, pico de memoria {pico / 1e6:.1f} MB")
+    repetidas, duracion, _ = generar()
+    print(f"segunda ejecución: {repetidas} alertas nuevas en {duracion:.2f}s")
+
+    ruta = os.path.join(DIRECTORIO, "alertas.jsonl")
+    despachador = DespachadorAlertas(SalidaArchivo(ruta), args.lote, args.trabajadores)
+    totales = []
+    hilos = [threading.Thread(target=lambda: totales.append(despachador.drenar())) for _ in range(args.trabajadores)]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    duracion = time.perf_counter() - inicio
+
+    with open(ruta, encoding="utf-8") as f:
+        ids = [json.loads(linea)["id"] for linea in f]
+    print(f"envío: {len(ids)} alertas en {duracion:.2f}s con {args.trabajadores} trabajadores "
+          f"({len(ids) / duracion:.0f} alertas/s), lotes por trabajador: {totales}")
+
+    if repetidas or len(ids) != creadas or len(set(ids)) != len(ids):
+        raise SystemExit("Alertas duplicadas o perdidas.")
+
+
+if __name__ == "__main__":
+    main()
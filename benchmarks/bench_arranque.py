@@ -0,0 +1,88 @@
+"""
+Mide el costo de arranque de un worker:
+- tiempo de `import app.main` (debe ser bajo y sin tocar la BD ni cargar el modelo);
+- tiempo hasta que /ready responde 200 con uvicorn (BD + modelo listos).
+
+Cada medición usa un proceso nuevo y un SQLite temporal, sin programador.
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_arranque --repeticiones 5
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def entorno(directorio):
+    env = dict(os.environ)
+    env["DATABASE_URL"] = f"sqlite:///{os.path.join(directorio, 'arranque.db')}"
+    env["WEATHER_CACHE_PATH"] = os.path.join(directorio, "weather_cache.db")
+    env["SCHEDULER_ENABLED"] = "false"
+    env["PYTHONPATH"] = RAIZ
+    return env
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def medir_import(directorio):
+    codigo = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+    salida = subprocess.run(
+        [sys.executable, "-c", codigo], cwd=directorio, env=entorno(directorio),
+        capture_output=True, text=True, check=True,
+    )
+    return float(salida.stdout.strip().splitlines()[-1])
+
+
+def medir_primera_peticion(directorio, limite=60):
+    puerto = puerto_libre()
+    inicio = time.perf_counter()
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(puerto), "--log-level", "warning"],
+        cwd=directorio, env=entorno(directorio),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - inicio < limite:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{puerto}/ready", timeout=1) as resp:
+                    if resp.status == 200:
+                        return time.perf_counter() - inicio
+            except OSError:
+                pass
+            time.sleep(0.02)
+        raise RuntimeError("El servidor no estuvo listo a tiempo")
+    finally:
+        proceso.terminate()
+        proceso.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    imports, listos = [], []
+    for _ in range(args.repeticiones):
+        with tempfile.TemporaryDirectory() as directorio:
+            imports.append(medir_import(directorio))
+            sin_bd = not os.path.exists(os.path.join(directorio, "arranque.db"))
+            listos.append(medir_primera_peticion(directorio))
+
+    print(f"import app.main:    mediana {statistics.median(imports) * 1000:.0f} ms (sin crear BD al importar: {sin_bd})")
+    print(f"hasta /ready = 200: mediana {statistics.median(listos) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
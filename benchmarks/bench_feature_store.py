@@ -0,0 +1,111 @@
+"""
+Verifica que las features incrementales (ventanas móviles en FeatureStore)
+coincidan con preparar_datos sobre la ventana completa, simulando varios días
+de actualización, y compara el costo de ambas formas.
+
+El pronóstico de "hoy" se altera un poco respecto al valor observado al día
+siguiente, para comprobar que el día re-pedido reemplaza al pronóstico.
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_feature_store --cantones 220 --dias 60
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.models import WeatherDaily
+from benchmarks.bench_inferencia import cantones_sinteticos
+from services.feature_store import FeatureStore, DIAS_VENTANA
+from services.predict_service import sismo_service
+
+
+def serie_sintetica(canton, inicio, dias):
+    rnd = random.Random(canton)
+    serie = {}
+    for i in range(dias):
+        dia = inicio + timedelta(days=i)
+        serie[dia] = (
+            None if rnd.random() < 0.03 else round(rnd.uniform(0, 30), 1),
+            round(rnd.uniform(8, 30), 1),
+            None if rnd.random() < 0.03 else round(rnd.uniform(1005, 1020), 1),
+        )
+    return serie
+
+
+def respuesta(serie, hoy, past_days, canton):
+    """Json como el de Open-Meteo; el último día es un pronóstico (algo distinto)."""
+    dias = [hoy - timedelta(days=k) for k in range(past_days, -1, -1)]
+    valores = [list(serie[d]) for d in dias]
+    ruido = random.Random(f"{canton}{hoy}")
+    if valores[-1][1] is not None:
+        valores[-1][1] = round(valores[-1][1] + ruido.uniform(-1, 1), 1)
+    return {"daily": {
+        "time": [d.isoformat() for d in dias],
+        "precipitation_sum": [v[0] for v in valores],
+        "temperature_2m_mean": [v[1] for v in valores],
+        "pressure_msl_mean": [v[2] for v in valores],
+    }}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cantones", type=int, default=220)
+    parser.add_argument("--dias", type=int, default=60)
+    args = parser.parse_args()
+    sismo_service.load_model()
+
+    engine = create_engine("sqlite://")
+    WeatherDaily.__table__.create(engine)
+
+    cantones = cantones_sinteticos(args.cantones)
+    inicio = date(2026, 1, 1)
+    series = {c["canton"]: serie_sintetica(c["canton"], inicio, DIAS_VENTANA + args.dias) for c in cantones}
+
+    store = FeatureStore()
+    diferencia = 0.0
+    t_store = t_completo = 0.0
+    pedidos_store = pedidos_completo = 0
+
+    with Session(engine) as db:
+        for k in range(args.dias):
+            hoy = inicio + timedelta(days=DIAS_VENTANA - 1 + k)
+
+            t0 = time.perf_counter()
+            for c in cantones:
+                past_days = store.dias_a_pedir(c["canton"], hoy)
+                if past_days:
+                    store.registrar(db, c["canton"], respuesta(series[c["canton"]], hoy, past_days, c["canton"]))
+                    pedidos_store += past_days + 1
+            incremental = np.vstack([store.vector(c, sismo_service.feature_names) for c in cantones])
+            db.commit()
+            t_store += time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            completos = []
+            for c in cantones:
+                datos = respuesta(series[c["canton"]], hoy, DIAS_VENTANA - 1, c["canton"])
+                completos.append(sismo_service.preparar_datos(c, datos).to_numpy(dtype=np.float32)[0])
+                pedidos_completo += DIAS_VENTANA
+            completos = np.vstack(completos)
+            t_completo += time.perf_counter() - t0
+
+            iguales_nan = np.isnan(incremental) == np.isnan(completos)
+            if not iguales_nan.all():
+                raise SystemExit(f"NaN distintos el día {hoy}")
+            diferencia = max(diferencia, float(np.nanmax(np.abs(incremental - completos))))
+
+    print(f"cantones: {args.cantones}, días simulados: {args.dias}")
+    print(f"preparar_datos (ventana completa): {t_completo / args.dias * 1000:.1f} ms/día, {pedidos_completo} días pedidos")
+    print(f"FeatureStore (incremental):        {t_store / args.dias * 1000:.1f} ms/día, {pedidos_store} días pedidos")
+    print(f"diferencia máxima en features (float32): {diferencia:.3e}")
+    if diferencia > 1e-3:
+        raise SystemExit("Las features incrementales no coinciden con preparar_datos.")
+
+
+if __name__ == "__main__":
+    main()
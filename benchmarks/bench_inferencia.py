@@ -0,0 +1,86 @@
+"""
+Compara la inferencia por cantón (DataFrame + DMatrix + predict por fila)
+contra la inferencia en lote (matriz NumPy + un solo inplace_predict).
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_inferencia --cantones 220 --repeticiones 5
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+import xgboost as xgb
+
+from app.init_data import CANTONES_MUESTRA
+from services.predict_service import sismo_service
+
+
+def clima_sintetico(lat, lon, dias=31, semilla=0):
+    rnd = random.Random(f"{lat},{lon},{semilla}")
+    return {"daily": {
+        "precipitation_sum": [round(rnd.uniform(0, 30), 1) for _ in range(dias)],
+        "temperature_2m_mean": [round(rnd.uniform(8, 30), 1) for _ in range(dias)],
+        "pressure_msl_mean": [round(rnd.uniform(1005, 1020), 1) for _ in range(dias)],
+    }}
+
+
+def cantones_sinteticos(n):
+    cantones = []
+    for i in range(n):
+        base = CANTONES_MUESTRA[i % len(CANTONES_MUESTRA)]
+        cantones.append({
+            "canton": f"{base['canton']}-{i}",
+            "lat": round(base["lat"] + (i // len(CANTONES_MUESTRA)) * 0.01, 4),
+            "lon": base["lon"],
+        })
+    return cantones
+
+
+def por_canton(cantones, climas):
+    probs = []
+    for item in cantones:
+        df = sismo_service.preparar_datos(item, climas[item["canton"]])
+        probs.append(float(sismo_service.model.predict(xgb.DMatrix(df))[0]))
+    return np.array(probs)
+
+
+def en_lote(cantones, climas):
+    matriz = np.vstack([sismo_service.calcular_features(item, climas[item["canton"]]) for item in cantones])
+    return sismo_service.predecir_lote(matriz, motor="xgboost")
+
+
+def medir(funcion, repeticiones, *args):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion(*args)
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos), resultado
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cantones", type=int, default=220)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+    sismo_service.load_model()
+
+    cantones = cantones_sinteticos(args.cantones)
+    climas = {c["canton"]: clima_sintetico(c["lat"], c["lon"]) for c in cantones}
+
+    t_loop, p_loop = medir(por_canton, args.repeticiones, cantones, climas)
+    t_lote, p_lote = medir(en_lote, args.repeticiones, cantones, climas)
+
+    diferencia = float(np.max(np.abs(p_loop - p_lote)))
+    print(f"cantones: {args.cantones}")
+    print(f"por cantón: {t_loop * 1000:.2f} ms total, {t_loop / args.cantones * 1e6:.1f} us/cantón")
+    print(f"en lote:    {t_lote * 1000:.2f} ms total, {t_lote / args.cantones * 1e6:.1f} us/cantón")
+    print(f"aceleración: x{t_loop / t_lote:.1f}")
+    print(f"diferencia máxima de probabilidad: {diferencia:.3e}")
+    if diferencia != 0.0:
+        raise SystemExit("Las probabilidades del lote no coinciden con las del loop por cantón.")
+
+
+if __name__ == "__main__":
+    main()
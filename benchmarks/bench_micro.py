@@ -0,0 +1,101 @@
+"""
+Micro-benchmarks de la preparación de features y de la inferencia, sin red ni BD:
+- preparar_datos (pandas) y calcular_features (NumPy) por cantón;
+- armar la matriz de N cantones (lo que hace generar_mapa_riesgo antes de inferir);
+- predecir_lote con cada motor y Booster.predict (DMatrix) por tamaño de lote.
+
+Cada medición repite la función hasta juntar ~--tiempo-min segundos por ronda y
+reporta el mínimo y la mediana de --rondas rondas (por llamada).
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_micro --lotes 1,20,220,10000 --salida micro.json
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+import xgboost as xgb
+
+from benchmarks.bench_inferencia import cantones_sinteticos, clima_sintetico
+from benchmarks.bench_motor_arboles import matriz_aleatoria
+from benchmarks import resultados
+from services.predict_service import sismo_service
+
+
+def cronometrar(funcion, rondas, tiempo_min):
+    """Segundos por llamada: (mínimo, mediana) entre rondas de `veces` llamadas."""
+    veces, transcurrido = 1, 0.0
+    while True:
+        inicio = time.perf_counter()
+        for _ in range(veces):
+            funcion()
+        transcurrido = time.perf_counter() - inicio
+        if transcurrido >= tiempo_min or veces >= 1_000_000:
+            break
+        veces *= 2 if transcurrido == 0 else max(2, min(10, int(tiempo_min / transcurrido) + 1))
+
+    tiempos = [transcurrido / veces]
+    for _ in range(rondas - 1):
+        inicio = time.perf_counter()
+        for _ in range(veces):
+            funcion()
+        tiempos.append((time.perf_counter() - inicio) / veces)
+    return min(tiempos), statistics.median(tiempos)
+
+
+def registrar(tabla, nombre, funcion, args, filas=1):
+    minimo, mediana = cronometrar(funcion, args.rondas, args.tiempo_min)
+    tabla[nombre] = {
+        "min_us": round(minimo * 1e6, 3),
+        "mediana_us": round(mediana * 1e6, 3),
+        "filas": filas,
+        "filas_por_s": round(filas / minimo, 1),
+    }
+    print(f"{nombre:<36} min {minimo * 1e6:11.1f} us  mediana {mediana * 1e6:11.1f} us  "
+          f"({filas / minimo:12,.0f} filas/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lotes", default="1,20,220,10000", help="tamaños de lote para la inferencia")
+    parser.add_argument("--cantones", type=int, default=220, help="cantones al armar la matriz")
+    parser.add_argument("--rondas", type=int, default=5)
+    parser.add_argument("--tiempo-min", type=float, default=0.2, help="segundos mínimos por ronda")
+    parser.add_argument("--salida", default=None, help="archivo JSON con los resultados")
+    args = parser.parse_args()
+    lotes = [int(x) for x in args.lotes.split(",") if x.strip()]
+
+    sismo_service.load_model()
+    activo = sismo_service.registro.activo
+    nombres = activo.feature_names
+    tabla = {}
+
+    print("== features ==")
+    cantones = cantones_sinteticos(args.cantones)
+    climas = {c["canton"]: clima_sintetico(c["lat"], c["lon"]) for c in cantones}
+    uno, clima_uno = cantones[0], climas[cantones[0]["canton"]]
+    registrar(tabla, "preparar_datos_pandas", lambda: sismo_service.preparar_datos(uno, clima_uno), args)
+    registrar(tabla, "calcular_features_numpy",
+              lambda: sismo_service.calcular_features(uno, clima_uno, nombres), args)
+    registrar(tabla, f"matriz_{args.cantones}_cantones",
+              lambda: np.vstack([sismo_service.calcular_features(c, climas[c["canton"]], nombres) for c in cantones]),
+              args, filas=args.cantones)
+
+    print("== inferencia ==")
+    for n in lotes:
+        matriz = matriz_aleatoria(n, nombres, semilla=n)
+        registrar(tabla, f"dmatrix_predict_{n}",
+                  lambda: activo.booster.predict(xgb.DMatrix(matriz, feature_names=nombres)), args, filas=n)
+        registrar(tabla, f"inplace_predict_{n}",
+                  lambda: sismo_service.predecir_lote(matriz, activo, motor="xgboost"), args, filas=n)
+        if activo.compilado is not None:
+            registrar(tabla, f"numpy_{n}",
+                      lambda: sismo_service.predecir_lote(matriz, activo, motor="numpy"), args, filas=n)
+        registrar(tabla, f"auto_{n}", lambda: sismo_service.predecir_lote(matriz, activo, motor="auto"), args, filas=n)
+
+    resultados.guardar(args.salida, "micro", {**vars(args), "modelo": activo.version}, tabla)
+
+
+if __name__ == "__main__":
+    main()
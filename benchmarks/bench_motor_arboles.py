@@ -0,0 +1,91 @@
+"""
+Paridad y velocidad del evaluador NumPy (services/tree_engine.py) frente a
+Booster.predict (DMatrix) y Booster.inplace_predict, por tamaño de lote.
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_motor_arboles --lotes 1,10,100,1000,10000 --repeticiones 20
+"""
+import argparse
+import time
+
+import numpy as np
+import xgboost as xgb
+
+from services.predict_service import sismo_service
+from services.tree_engine import EnsambleCompilado
+
+TOLERANCIA = 1e-5
+
+
+def matriz_aleatoria(n, nombres, semilla, fraccion_nan=0.0):
+    """Valores en rangos parecidos a los reales; opcionalmente con NaN sueltos."""
+    rng = np.random.default_rng(semilla)
+    rangos = {
+        "temp_mean": (5.0, 32.0),
+        "temp_std": (0.0, 5.0),
+        "pres_mean": (1000.0, 1025.0),
+        "pres_delta": (-10.0, 10.0),
+        "precip_sum": (0.0, 400.0),
+        "latitud": (-5.0, 1.5),
+        "longitud": (-81.0, -75.2),
+    }
+    matriz = np.empty((n, len(nombres)), dtype=np.float32)
+    for j, nombre in enumerate(nombres):
+        bajo, alto = rangos.get(nombre, (0.0, 60.0))
+        matriz[:, j] = rng.uniform(bajo, alto, n)
+    if fraccion_nan:
+        matriz[rng.random(matriz.shape) < fraccion_nan] = np.nan
+    return matriz
+
+
+def verificar_paridad(booster, compilado, nombres, lotes):
+    fallas = 0
+    for n in lotes:
+        for fraccion_nan in (0.0, 0.2):
+            matriz = matriz_aleatoria(n, nombres, semilla=n, fraccion_nan=fraccion_nan)
+            referencia = booster.predict(xgb.DMatrix(matriz, feature_names=nombres))
+            diferencia = float(np.max(np.abs(compilado.predecir(matriz) - referencia)))
+            estado = "ok" if diferencia <= TOLERANCIA else "FALLA"
+            fallas += estado != "ok"
+            print(f"paridad n={n:>6} nan={fraccion_nan:.1f}: diferencia máxima {diferencia:.2e} {estado}")
+    return fallas
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lotes", default="1,10,100,1000,10000")
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args()
+    lotes = [int(n) for n in args.lotes.split(",")]
+
+    sismo_service.load_model()
+    booster = sismo_service.model
+    nombres = sismo_service.feature_names
+    compilado = EnsambleCompilado.desde_booster(booster)
+    print(f"árboles: {len(compilado.raices)}, nodos: {len(compilado.umbral)}, profundidad: {compilado.profundidad}")
+
+    fallas = verificar_paridad(booster, compilado, nombres, lotes)
+
+    print(f"\n{'filas':>7} {'predict (ms)':>13} {'inplace (ms)':>13} {'numpy (ms)':>11}")
+    for n in lotes:
+        matriz = matriz_aleatoria(n, nombres, semilla=n)
+        t_predict = medir(lambda: booster.predict(xgb.DMatrix(matriz, feature_names=nombres)), args.repeticiones)
+        t_inplace = medir(lambda: booster.inplace_predict(matriz), args.repeticiones)
+        t_numpy = medir(lambda: compilado.predecir(matriz), args.repeticiones)
+        print(f"{n:>7} {t_predict:>13.3f} {t_inplace:>13.3f} {t_numpy:>11.3f}")
+
+    if fallas:
+        raise SystemExit(f"{fallas} casos fuera de tolerancia ({TOLERANCIA}).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Rendimiento de POST /predict/batch (filas por segundo) por tamaño de lote y
+formato de entrada/salida, contra la app en proceso (TestClient, sin red).
+También compara las probabilidades con Booster.predict.
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_predict_batch --filas 100,1000,10000,100000 --repeticiones 3
+"""
+import argparse
+import io
+import json
+import time
+
+import numpy as np
+import xgboost as xgb
+from fastapi.testclient import TestClient
+
+from app.main import app, get_current_user
+from services.predict_service import sismo_service
+from benchmarks.bench_motor_arboles import matriz_aleatoria
+
+
+def cuerpo_json(matriz, nombres):
+    columnas = {nombre: matriz[:, j].tolist() for j, nombre in enumerate(nombres)}
+    return json.dumps({"columnas": columnas}), {"Content-Type": "application/json"}
+
+
+def cuerpo_npy(matriz, nombres):
+    buffer = io.BytesIO()
+    np.save(buffer, matriz)
+    return buffer.getvalue(), {"Content-Type": "application/x-npy"}
+
+
+def leer_respuesta(respuesta, binaria):
+    if binaria:
+        return np.frombuffer(respuesta.content, dtype="<f4")
+    return np.array(respuesta.json()["probabilidades"], dtype=np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filas", default="100,1000,10000,100000")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    sismo_service.load_model()
+    nombres = sismo_service.feature_names
+    # Sin lifespan (no hace falta BD ni programador) y sin autenticación
+    app.dependency_overrides[get_current_user] = lambda: None
+    cliente = TestClient(app)
+
+    print(f"{'filas':>7} {'entrada':>8} {'salida':>8} {'ms':>9} {'filas/s':>11} {'dif. máx':>9}")
+    for n in (int(v) for v in args.filas.split(",")):
+        matriz = matriz_aleatoria(n, nombres, semilla=n, fraccion_nan=0.05)
+        referencia = sismo_service.model.predict(xgb.DMatrix(matriz, feature_names=nombres))
+        for entrada, construir in (("json", cuerpo_json), ("npy", cuerpo_npy)):
+            cuerpo, headers = construir(matriz, nombres)
+            for binaria in (False, True):
+                headers_peticion = {**headers, "Accept": "application/octet-stream" if binaria else "application/json"}
+                tiempos = []
+                for _ in range(args.repeticiones):
+                    inicio = time.perf_counter()
+                    respuesta = cliente.post("/predict/batch", content=cuerpo, headers=headers_peticion)
+                    probabilidades = leer_respuesta(respuesta, binaria)
+                    tiempos.append(time.perf_counter() - inicio)
+                if respuesta.status_code != 200:
+                    raise SystemExit(f"HTTP {respuesta.status_code}: {respuesta.text[:200]}")
+                diferencia = float(np.max(np.abs(probabilidades - referencia)))
+                mejor = min(tiempos)
+                print(f"{n:>7} {entrada:>8} {'f32' if binaria else 'json':>8} {mejor * 1000:>9.1f} "
+                      f"{n / mejor:>11.0f} {diferencia:>9.1e}")
+
+
+if __name__ == "__main__":
+    main()
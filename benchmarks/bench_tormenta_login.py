@@ -0,0 +1,168 @@
+"""
+Prueba de carga: latencia de /riesgo-sismico durante una ráfaga de /login.
+
+Para cada modo se levanta uvicorn en un SQLite temporal (sin programador) con
+el reporte de hoy ya guardado, y se mide la latencia del mapa:
+- en reposo;
+- mientras `--clientes` hilos hacen /login sin pausa.
+
+Modos: hash en el mismo hilo (PASSWORD_POOL_WORKERS=0) y en el pool de procesos.
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_tormenta_login --clientes 32 --segundos 10 [--pausa-429 1]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+from benchmarks.bench_arranque import entorno, puerto_libre
+from services import fechas
+
+CANTONES = ["Quito", "Guayaquil", "Cuenca", "Manta", "Esmeraldas", "Loja", "Ambato", "Ibarra"]
+
+
+def peticion(url, datos=None):
+    cuerpo = json.dumps(datos).encode() if datos is not None else None
+    req = urllib.request.Request(url, data=cuerpo, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            resp.read()
+            return resp.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def esperar_listo(base, limite=60):
+    inicio = time.perf_counter()
+    while time.perf_counter() - inicio < limite:
+        try:
+            if peticion(f"{base}/ready") == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.05)
+    raise RuntimeError("El servidor no estuvo listo a tiempo")
+
+
+def sembrar_reporte(ruta_bd):
+    hoy = fechas.hoy().isoformat()
+    ahora = datetime.now().isoformat(sep=" ")
+    conn = sqlite3.connect(ruta_bd)
+    with conn:
+        conn.executemany(
+            "INSERT INTO prediction_reports (created_at, location, probability, risk_level, report_date, model_version)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            [(ahora, canton, 0.1, "BAJO", hoy, "base") for canton in CANTONES],
+        )
+        conn.execute(
+            "INSERT INTO daily_report_runs (report_date, status, started_at, finished_at) VALUES (?, 'listo', ?, ?)",
+            (hoy, ahora, ahora),
+        )
+    conn.close()
+
+
+def percentiles(latencias):
+    ordenadas = sorted(latencias)
+    def p(q):
+        return ordenadas[min(len(ordenadas) - 1, int(q * len(ordenadas)))] * 1000
+    return f"p50 {p(0.50):7.1f} ms  p95 {p(0.95):7.1f} ms  p99 {p(0.99):7.1f} ms  (n={len(ordenadas)})"
+
+
+def medir_mapa(base, segundos):
+    latencias = []
+    fin = time.perf_counter() + segundos
+    while time.perf_counter() < fin:
+        inicio = time.perf_counter()
+        estado = peticion(f"{base}/riesgo-sismico")
+        latencias.append(time.perf_counter() - inicio)
+        if estado != 200:
+            raise RuntimeError(f"/riesgo-sismico respondió {estado}")
+        time.sleep(0.01)
+    return latencias
+
+
+def tormenta(base, clientes, segundos, pausa_429, resultados):
+    """Corre en otro proceso: los hilos de carga no compiten por el GIL con la medición."""
+    credenciales = {"email": "carga@example.com", "password": "clave-de-prueba"}
+    conteo, lock = {}, threading.Lock()
+    fin = time.perf_counter() + segundos
+
+    def cliente():
+        while time.perf_counter() < fin:
+            estado = peticion(f"{base}/login", credenciales)
+            with lock:
+                conteo[estado] = conteo.get(estado, 0) + 1
+            if estado == 429 and pausa_429:
+                time.sleep(pausa_429)
+
+    hilos = [threading.Thread(target=cliente) for _ in range(clientes)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    resultados.put(conteo)
+
+
+def ejecutar_modo(nombre, procesos, clientes, segundos, pausa_429):
+    with tempfile.TemporaryDirectory() as directorio:
+        env = entorno(directorio)
+        env["PASSWORD_POOL_WORKERS"] = str(procesos)
+        puerto = puerto_libre()
+        base = f"http://127.0.0.1:{puerto}"
+        servidor = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(puerto), "--log-level", "warning"],
+            cwd=directorio, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            esperar_listo(base)
+            sembrar_reporte(os.path.join(directorio, "arranque.db"))
+            peticion(f"{base}/register", {
+                "first_name": "Carga", "last_name": "Prueba",
+                "email": "carga@example.com", "password": "clave-de-prueba",
+            })
+
+            reposo = medir_mapa(base, segundos / 2)
+            resultados = multiprocessing.Queue()
+            carga = multiprocessing.Process(target=tormenta, args=(base, clientes, segundos, pausa_429, resultados))
+            carga.start()
+            durante = medir_mapa(base, segundos)
+            conteo = resultados.get()
+            carga.join()
+            duracion = segundos
+        finally:
+            servidor.terminate()
+            servidor.wait()
+
+    logins = " ".join(f"{estado}:{n}" for estado, n in sorted(conteo.items()))
+    print(f"\n== {nombre} ==")
+    print(f"mapa en reposo:   {percentiles(reposo)}")
+    print(f"mapa con ráfaga:  {percentiles(durante)}")
+    print(f"logins ({clientes} clientes, {duracion:.0f}s): {logins}  "
+          f"({conteo.get(200, 0) / duracion:.0f} logins ok/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clientes", type=int, default=32)
+    parser.add_argument("--segundos", type=float, default=10)
+    parser.add_argument("--procesos", type=int, default=2)
+    # Espera de cada cliente tras un 429 (0 = reintenta de inmediato, el peor caso)
+    parser.add_argument("--pausa-429", type=float, default=0.0)
+    args = parser.parse_args()
+
+    ejecutar_modo("hash en el hilo de la petición", 0, args.clientes, args.segundos, args.pausa_429)
+    ejecutar_modo(f"pool de {args.procesos} procesos", args.procesos, args.clientes, args.segundos, args.pausa_429)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Cliente HTTP/1.1 mínimo sobre asyncio para generar carga.
+
+httpx satura la CPU antes que el servidor cuando corren en la misma máquina;
+este cliente solo escribe la petición y lee la respuesta por Content-Length
+(o por bloques), sobre una conexión keep-alive por usuario virtual.
+"""
+import asyncio
+import json
+import time
+
+
+class ConexionHTTP:
+    def __init__(self, host, puerto):
+        self.host = host
+        self.puerto = puerto
+        self.lector = None
+        self.escritor = None
+
+    async def abrir(self):
+        self.lector, self.escritor = await asyncio.open_connection(self.host, self.puerto)
+
+    def cerrar(self):
+        if self.escritor is not None:
+            self.escritor.close()
+            self.escritor = None
+
+    async def peticion(self, metodo, ruta, datos=None, cabeceras=None):
+        """Devuelve (estado, cuerpo en bytes). `datos` se envía como JSON."""
+        if self.escritor is None:
+            await self.abrir()
+        cuerpo = json.dumps(datos).encode() if datos is not None else b""
+        lineas = [f"{metodo} {ruta} HTTP/1.1", f"Host: {self.host}"]
+        for nombre, valor in (cabeceras or {}).items():
+            lineas.append(f"{nombre}: {valor}")
+        if datos is not None:
+            lineas.append("Content-Type: application/json")
+        if cuerpo or metodo in ("POST", "PUT", "PATCH"):
+            lineas.append(f"Content-Length: {len(cuerpo)}")
+        self.escritor.write(("\r\n".join(lineas) + "\r\n\r\n").encode() + cuerpo)
+        await self.escritor.drain()
+
+        encabezado = await self.lector.readuntil(b"\r\n\r\n")
+        estado = int(encabezado.split(b" ", 2)[1])
+        largo, por_bloques, cerrar = 0, False, False
+        for linea in encabezado.split(b"\r\n")[1:]:
+            nombre, _, valor = linea.partition(b":")
+            nombre, valor = nombre.strip().lower(), valor.strip().lower()
+            if nombre == b"content-length":
+                largo = int(valor)
+            elif nombre == b"transfer-encoding" and valor == b"chunked":
+                por_bloques = True
+            elif nombre == b"connection" and valor == b"close":
+                cerrar = True
+
+        if por_bloques:
+            partes = []
+            while True:
+                tam = int((await self.lector.readuntil(b"\r\n")).split(b";")[0], 16)
+                partes.append(await self.lector.readexactly(tam + 2))
+                if tam == 0:
+                    break
+            respuesta = b"".join(p[:-2] for p in partes)
+        else:
+            respuesta = await self.lector.readexactly(largo)
+        if cerrar:
+            self.cerrar()
+        return estado, respuesta
+
+
+class Registro:
+    """Latencias y códigos de estado de una operación durante la carga."""
+
+    def __init__(self):
+        self.latencias = []
+        self.estados = {}
+        self.excepciones = 0
+
+    def anotar(self, estado, segundos):
+        self.estados[estado] = self.estados.get(estado, 0) + 1
+        if 200 <= estado < 400:
+            self.latencias.append(segundos)
+
+    def resumen(self, duracion):
+        return resumen_latencias(self.latencias, duracion, self.estados, self.excepciones)
+
+
+def percentil(ordenadas, q):
+    """Percentil por rango más cercano (ordenadas ya en orden ascendente), en ms."""
+    if not ordenadas:
+        return None
+    return ordenadas[min(len(ordenadas) - 1, int(q * len(ordenadas)))] * 1000
+
+
+def resumen_latencias(latencias, duracion, estados=None, excepciones=0):
+    ordenadas = sorted(latencias)
+    estados = estados or {200: len(ordenadas)}
+    errores = sum(n for estado, n in estados.items() if not 200 <= estado < 400) + excepciones
+    redondear = lambda x: None if x is None else round(x, 2)
+    return {
+        "peticiones": sum(estados.values()) + excepciones,
+        "ok": len(ordenadas),
+        "errores": errores,
+        "estados": {str(estado): n for estado, n in sorted(estados.items())},
+        "duracion_s": round(duracion, 3),
+        "rps": round(len(ordenadas) / duracion, 2) if duracion > 0 else None,
+        "p50_ms": redondear(percentil(ordenadas, 0.50)),
+        "p95_ms": redondear(percentil(ordenadas, 0.95)),
+        "p99_ms": redondear(percentil(ordenadas, 0.99)),
+        "max_ms": redondear(ordenadas[-1] * 1000 if ordenadas else None),
+    }
+
+
+async def cargar(host, puerto, concurrencia, segundos, operacion):
+    """
+    `concurrencia` usuarios virtuales, cada uno con su conexión, repiten
+    `await operacion(conexion, usuario, registros)` hasta que pasen `segundos`.
+    La operación mide sus peticiones con `medir`. Devuelve ({nombre: Registro}, duración).
+    """
+    registros = {}
+    inicio = time.perf_counter()
+    fin = inicio + segundos
+
+    async def usuario(indice):
+        conexion = ConexionHTTP(host, puerto)
+        try:
+            while time.perf_counter() < fin:
+                try:
+                    await operacion(conexion, indice, registros)
+                except (OSError, asyncio.IncompleteReadError):
+                    registros.setdefault("conexion", Registro()).excepciones += 1
+                    conexion.cerrar()
+        finally:
+            conexion.cerrar()
+
+    await asyncio.gather(*(usuario(i) for i in range(concurrencia)))
+    return registros, time.perf_counter() - inicio
+
+
+async def medir(registros, nombre, conexion, metodo, ruta, datos=None, cabeceras=None):
+    """Hace la petición y anota su latencia en registros[nombre]. Devuelve (estado, cuerpo)."""
+    inicio = time.perf_counter()
+    estado, cuerpo = await conexion.peticion(metodo, ruta, datos, cabeceras)
+    registros.setdefault(nombre, Registro()).anotar(estado, time.perf_counter() - inicio)
+    return estado, cuerpo
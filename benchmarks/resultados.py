@@ -0,0 +1,119 @@
+"""
+Resultados de benchmarks en JSON, para comparar corridas entre cambios.
+
+Cada archivo tiene el mismo formato:
+    {"benchmark": ..., "entorno": {commit, python, cpus, ...}, "parametros": {...},
+     "resultados": {<nombre>: {<métrica>: valor, ...}, ...}}
+
+Comparar dos corridas (métricas numéricas en común, con la variación en %):
+    python -m benchmarks.resultados antes.json despues.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+from benchmarks.bench_arranque import RAIZ
+
+# Métricas donde un valor mayor es mejor (en el resto, menor es mejor)
+MAYOR_ES_MEJOR = ("rps", "ok", "peticiones", "filas_por_s", "aceleracion")
+
+
+def commit_actual():
+    try:
+        salida = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, timeout=10,
+        )
+        sucio = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=RAIZ,
+            capture_output=True, text=True, timeout=30,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if salida.returncode != 0:
+        return None
+    return salida.stdout.strip() + ("-modificado" if sucio.stdout.strip() else "")
+
+
+def entorno():
+    return {
+        "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit_actual(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def guardar(ruta, benchmark, parametros, resultados):
+    """Escribe el JSON de la corrida (si ruta es None no hace nada). Devuelve el documento."""
+    documento = {
+        "benchmark": benchmark,
+        "entorno": entorno(),
+        "parametros": parametros,
+        "resultados": resultados,
+    }
+    if ruta:
+        with open(ruta, "w") as f:
+            json.dump(documento, f, indent=2, ensure_ascii=False, default=str)
+        print(f"Resultados guardados en {ruta}")
+    return documento
+
+
+def aplanar(resultados, prefijo=""):
+    """{"a": {"b": 1}} -> {"a.b": 1}, solo valores numéricos (sin el conteo por código de estado)."""
+    planos = {}
+    for clave, valor in resultados.items():
+        if clave == "estados":
+            continue
+        nombre = f"{prefijo}{clave}"
+        if isinstance(valor, dict):
+            planos.update(aplanar(valor, nombre + "."))
+        elif isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            planos[nombre] = valor
+    return planos
+
+
+def comparar(antes, despues):
+    """Filas (métrica, antes, después, variación %, mejora?) de las métricas en común."""
+    planos_antes, planos_despues = aplanar(antes["resultados"]), aplanar(despues["resultados"])
+    filas = []
+    for metrica in sorted(set(planos_antes) & set(planos_despues)):
+        a, d = planos_antes[metrica], planos_despues[metrica]
+        variacion = (d - a) / a * 100 if a else None
+        mayor_mejor = metrica.rsplit(".", 1)[-1] in MAYOR_ES_MEJOR
+        mejora = None if variacion is None or d == a else (d > a) == mayor_mejor
+        filas.append((metrica, a, d, variacion, mejora))
+    return filas
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("antes")
+    parser.add_argument("despues")
+    parser.add_argument("--umbral", type=float, default=5.0, help="variación (%%) a partir de la cual se marca")
+    args = parser.parse_args()
+
+    with open(args.antes) as f:
+        antes = json.load(f)
+    with open(args.despues) as f:
+        despues = json.load(f)
+    if antes.get("benchmark") != despues.get("benchmark"):
+        print(f"Aviso: se comparan benchmarks distintos ({antes.get('benchmark')} / {despues.get('benchmark')})",
+              file=sys.stderr)
+
+    print(f"antes:   {antes['entorno'].get('commit')} ({antes['entorno'].get('fecha')})")
+    print(f"después: {despues['entorno'].get('commit')} ({despues['entorno'].get('fecha')})")
+    for metrica, a, d, variacion, mejora in comparar(antes, despues):
+        marca = ""
+        if variacion is not None and abs(variacion) >= args.umbral:
+            marca = "mejor" if mejora else "PEOR"
+        texto = f"{variacion:+7.1f}%" if variacion is not None else "      -"
+        print(f"{metrica:<55} {a:>12.4g} {d:>12.4g} {texto}  {marca}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Servidor local que imita /v1/forecast de Open-Meteo, para pruebas de carga sin
+salir a la red (OPEN_METEO_URL=http://127.0.0.1:<puerto>/v1/forecast), y
+/v1/archive (start_date/end_date) para el backfill
+(OPEN_METEO_ARCHIVE_URL=http://127.0.0.1:<puerto>/v1/archive).
+
+- Acepta una o varias coordenadas (listas separadas por coma) y devuelve un
+  objeto o una lista, como la API real, con daily.time y las variables pedidas.
+- Los valores son deterministas por (lat, lon, día): dos consultas del mismo
+  día devuelven lo mismo, y al día siguiente la ventana se desplaza.
+- Latencia configurable (fija + jitter) e inyección de fallas: respuestas con
+  error HTTP, respuestas lentas (para provocar timeouts) y ubicaciones sin datos
+  dentro de una consulta en lote.
+- GET /stats devuelve los contadores (consultas, ubicaciones, fallas inyectadas).
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.stub_open_meteo --puerto 8090 --latencia-ms 150 --tasa-error 0.05
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from zoneinfo import ZoneInfo
+
+# Con timezone=auto Open-Meteo usa la fecha local de las coordenadas (Ecuador continental)
+ZONA_ECUADOR = ZoneInfo("America/Guayaquil")
+
+# variable -> (mínimo, máximo, decimales), en los rangos reales de Ecuador
+RANGOS = {
+    "precipitation_sum": (0.0, 30.0, 1),
+    "temperature_2m_mean": (8.0, 30.0, 1),
+    "pressure_msl_mean": (1005.0, 1020.0, 1),
+}
+
+
+def valor_diario(variable, lat, lon, dia):
+    minimo, maximo, decimales = RANGOS.get(variable, (0.0, 1.0, 2))
+    rnd = random.Random(f"{variable}|{lat:.4f},{lon:.4f}|{dia.isoformat()}")
+    return round(rnd.uniform(minimo, maximo), decimales)
+
+
+def ubicacion(lat, lon, variables, dias):
+    daily = {"time": [d.isoformat() for d in dias]}
+    for variable in variables:
+        daily[variable] = [valor_diario(variable, lat, lon, d) for d in dias]
+    return {
+        "latitude": lat,
+        "longitude": lon,
+        "timezone": "America/Guayaquil",
+        "daily_units": {"time": "iso8601", **{v: "" for v in variables}},
+        "daily": daily,
+    }
+
+
+class ConfiguracionStub:
+    def __init__(self, latencia_ms=0.0, jitter_ms=0.0, tasa_error=0.0, codigo_error=500,
+                 tasa_lenta=0.0, lenta_ms=30000.0, tasa_sin_datos=0.0, semilla=0):
+        self.latencia_ms = latencia_ms
+        self.jitter_ms = jitter_ms
+        self.tasa_error = tasa_error
+        self.codigo_error = codigo_error
+        self.tasa_lenta = tasa_lenta
+        self.lenta_ms = lenta_ms
+        self.tasa_sin_datos = tasa_sin_datos
+        self.azar = random.Random(semilla)
+        self.contadores = {"consultas": 0, "ubicaciones": 0, "errores": 0, "lentas": 0, "sin_datos": 0}
+        self._lock = threading.Lock()
+
+    def sortear(self):
+        """(espera en segundos, falla HTTP?, lenta?) de una consulta."""
+        with self._lock:
+            espera = self.latencia_ms + self.azar.uniform(0, self.jitter_ms)
+            error = self.azar.random() < self.tasa_error
+            lenta = not error and self.azar.random() < self.tasa_lenta
+            self.contadores["consultas"] += 1
+            self.contadores["errores"] += error
+            self.contadores["lentas"] += lenta
+        if lenta:
+            espera = self.lenta_ms
+        return espera / 1000, error, lenta
+
+    def sin_datos(self, n):
+        with self._lock:
+            marcas = [self.azar.random() < self.tasa_sin_datos for _ in range(n)]
+            self.contadores["ubicaciones"] += n
+            self.contadores["sin_datos"] += sum(marcas)
+        return marcas
+
+    def estadisticas(self):
+        with self._lock:
+            return dict(self.contadores)
+
+
+def crear_manejador(configuracion):
+    class Manejador(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, como la API real
+
+        def responder(self, estado, cuerpo):
+            datos = json.dumps(cuerpo).encode()
+            self.send_response(estado)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(datos)))
+            self.end_headers()
+            self.wfile.write(datos)
+
+        def do_GET(self):
+            partes = urlsplit(self.path)
+            if partes.path == "/stats":
+                return self.responder(200, configuracion.estadisticas())
+            if partes.path not in ("/v1/forecast", "/v1/archive"):
+                return self.responder(404, {"error": True, "reason": "Ruta desconocida"})
+
+            espera, error, _ = configuracion.sortear()
+            if espera > 0:
+                time.sleep(espera)
+            if error:
+                return self.responder(configuracion.codigo_error, {"error": True, "reason": "Falla inyectada"})
+
+            params = parse_qs(partes.query)
+            try:
+                lats = [float(x) for x in params["latitude"][0].split(",")]
+                lons = [float(x) for x in params["longitude"][0].split(",")]
+                variables = [v for valor in params.get("daily", []) for v in valor.split(",")]
+                if partes.path == "/v1/archive":
+                    inicio = date.fromisoformat(params["start_date"][0])
+                    fin = date.fromisoformat(params["end_date"][0])
+                    dias = [inicio + timedelta(days=k) for k in range((fin - inicio).days + 1)]
+                else:
+                    past_days = int(params.get("past_days", ["0"])[0])
+                    forecast_days = int(params.get("forecast_days", ["7"])[0])
+                    hoy = datetime.now(ZONA_ECUADOR).date()
+                    dias = [hoy + timedelta(days=k) for k in range(-past_days, forecast_days)]
+            except (KeyError, ValueError) as e:
+                return self.responder(400, {"error": True, "reason": f"Parámetros inválidos: {e}"})
+            if len(lats) != len(lons):
+                return self.responder(400, {"error": True, "reason": "latitude y longitude de distinto largo"})
+
+            resultados = [
+                {"error": True, "reason": "Sin datos (falla inyectada)"} if vacia
+                else ubicacion(lat, lon, variables, dias)
+                for lat, lon, vacia in zip(lats, lons, configuracion.sin_datos(len(lats)))
+            ]
+            # Con una sola coordenada la API devuelve un objeto, no una lista
+            self.responder(200, resultados[0] if len(resultados) == 1 else resultados)
+
+        def log_message(self, *args):
+            pass
+
+    return Manejador
+
+
+def crear_servidor(puerto, configuracion, host="127.0.0.1"):
+    servidor = ThreadingHTTPServer((host, puerto), crear_manejador(configuracion))
+    servidor.daemon_threads = True
+    return servidor
+
+
+def agregar_argumentos(parser, prefijo=""):
+    """Opciones de latencia y fallas (también las usa bench_carga con prefijo "clima-")."""
+    parser.add_argument(f"--{prefijo}latencia-ms", type=float, default=0.0)
+    parser.add_argument(f"--{prefijo}jitter-ms", type=float, default=0.0)
+    parser.add_argument(f"--{prefijo}tasa-error", type=float, default=0.0,
+                        help="fracción de consultas que responden con error HTTP")
+    parser.add_argument(f"--{prefijo}codigo-error", type=int, default=500)
+    parser.add_argument(f"--{prefijo}tasa-lenta", type=float, default=0.0,
+                        help="fracción de consultas que tardan --lenta-ms (timeouts)")
+    parser.add_argument(f"--{prefijo}lenta-ms", type=float, default=30000.0)
+    parser.add_argument(f"--{prefijo}tasa-sin-datos", type=float, default=0.0,
+                        help="fracción de ubicaciones que vienen con error dentro de un lote")
+
+
+def argumentos_de_linea(args, prefijo=""):
+    """Reconstruye la línea de comandos del stub a partir de los argumentos ya parseados."""
+    linea = []
+    for nombre in ("latencia-ms", "jitter-ms", "tasa-error", "codigo-error", "tasa-lenta", "lenta-ms", "tasa-sin-datos"):
+        linea += [f"--{nombre}", str(getattr(args, (prefijo + nombre).replace("-", "_")))]
+    return linea
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--puerto", type=int, default=8090)
+    parser.add_argument("--semilla", type=int, default=0)
+    agregar_argumentos(parser)
+    args = parser.parse_args()
+
+    configuracion = ConfiguracionStub(
+        latencia_ms=args.latencia_ms, jitter_ms=args.jitter_ms,
+        tasa_error=args.tasa_error, codigo_error=args.codigo_error,
+        tasa_lenta=args.tasa_lenta, lenta_ms=args.lenta_ms,
+        tasa_sin_datos=args.tasa_sin_datos, semilla=args.semilla,
+    )
+    servidor = crear_servidor(args.puerto, configuracion)
+    print(f"Open-Meteo simulado en http://127.0.0.1:{args.puerto}/v1/forecast", flush=True)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Verifica que el reporte diario se calcule una sola vez aunque lo pidan a la vez
+varios hilos de varios procesos (workers) sobre el mismo archivo SQLite.
+
+generar_mapa_riesgo se reemplaza por uno sintético y lento (sin modelo ni
+Open-Meteo) que anota cada llamada en un archivo compartido. Al final se exige:
+una sola llamada, un registro por cantón y la marca de DailyReportRun en "listo".
+Sale con código distinto de 0 si algo no se cumple.
+
+Con --marca-listo se parte de una marca "listo" sin registros (p. ej. borrados a mano):
+también ahí uno solo debe recalcular.
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.verificar_calculo_unico --procesos 3 --hilos 6 [--marca-listo]
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+
+def mapa_sintetico(archivo_llamadas, demora):
+    """generar_mapa_riesgo de reemplazo: anota la llamada y tarda `demora` segundos."""
+    from services import fechas
+    from services.city_catalog import registro_cantones
+    from services.predict_service import sismo_service
+
+    def generar_mapa_riesgo(cantones=None):
+        with open(archivo_llamadas, "a") as f:
+            f.write(f"{os.getpid()}\n")
+        time.sleep(demora)
+        if cantones is None:
+            cantones = registro_cantones.obtener().cantones()
+        hoy = fechas.hoy()
+        resultados = []
+        for i, item in enumerate(cantones):
+            probabilidad = (i % 10) / 10
+            nivel, color = sismo_service.calcular_semaforo(probabilidad)
+            resultados.append({
+                "canton": item["canton"], "lat": item["lat"], "lon": item["lon"],
+                "probabilidad": probabilidad, "nivel_riesgo": nivel, "color": color,
+                "version_modelo": "sintetico", "fecha_clima": hoy, "datos_atrasados": False,
+            })
+        return resultados
+
+    return generar_mapa_riesgo
+
+
+def trabajador(hilos, listos, inicio, archivo_llamadas, demora, tamanos):
+    """Un "worker": `hilos` hilos pidiendo el reporte del día en cuanto se da la señal."""
+    from app.database import SessionLocal
+    from services.predict_service import obtener_reporte_con_historial, sismo_service
+
+    sismo_service.generar_mapa_riesgo = mapa_sintetico(archivo_llamadas, demora)
+
+    def pedir():
+        inicio.wait()
+        db = SessionLocal()
+        try:
+            tamanos.append(len(obtener_reporte_con_historial(db)))
+        finally:
+            db.close()
+
+    corriendo = [threading.Thread(target=pedir) for _ in range(hilos)]
+    for t in corriendo:
+        t.start()
+    listos.release()
+    for t in corriendo:
+        t.join()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--procesos", type=int, default=3)
+    parser.add_argument("--hilos", type=int, default=6)
+    parser.add_argument("--demora", type=float, default=0.5, help="segundos que tarda el cálculo sintético")
+    parser.add_argument("--marca-listo", action="store_true", help="partir de una marca \"listo\" sin registros")
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix="calculo_unico_")
+    archivo_llamadas = os.path.join(directorio, "llamadas.txt")
+    # Antes de importar app.database: los procesos hijos heredan el entorno
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(directorio, 'reporte.db')}"
+    os.environ["ALERTS_ENABLED"] = "false"
+    os.environ["WEATHER_CACHE_ENABLED"] = "false"
+
+    from sqlalchemy import func
+    from app import models
+    from app.database import SessionLocal, create_tables
+    from app.init_data import init_cities
+    from services import fechas
+
+    create_tables()
+    with SessionLocal() as db:
+        init_cities(db)
+        total_cantones = db.query(models.City).count()
+        if args.marca_listo:
+            db.add(models.DailyReportRun(report_date=fechas.hoy(), status="listo", finished_at=datetime.utcnow()))
+            db.commit()
+
+    # spawn: cada proceso importa la app desde cero, como un worker de uvicorn
+    contexto = multiprocessing.get_context("spawn")
+    listos = contexto.Semaphore(0)
+    inicio = contexto.Event()
+    with contexto.Manager() as manager:
+        tamanos = manager.list()
+        procesos = [
+            contexto.Process(
+                target=trabajador, args=(args.hilos, listos, inicio, archivo_llamadas, args.demora, tamanos)
+            )
+            for _ in range(args.procesos)
+        ]
+        for p in procesos:
+            p.start()
+        # Hilos de este mismo proceso también compiten
+        local = threading.Thread(
+            target=trabajador, args=(args.hilos, listos, inicio, archivo_llamadas, args.demora, tamanos)
+        )
+        local.start()
+        # Se larga cuando todos los procesos terminaron de importar y tienen sus hilos esperando
+        for _ in range(args.procesos + 1):
+            listos.acquire()
+        inicio.set()
+        for p in procesos:
+            p.join()
+        local.join()
+        tamanos = list(tamanos)
+
+    with open(archivo_llamadas) as f:
+        llamadas = len(f.read().split())
+    with SessionLocal() as db:
+        hoy = fechas.hoy()
+        registros = db.query(models.PredictionReport).filter(models.PredictionReport.report_date == hoy).count()
+        repetidos = db.query(models.PredictionReport.location).filter(
+            models.PredictionReport.report_date == hoy
+        ).group_by(models.PredictionReport.location).having(func.count() > 1).count()
+        marca = db.get(models.DailyReportRun, hoy)
+        estado = marca.status if marca is not None else None
+
+    pedidos = (args.procesos + 1) * args.hilos
+    print(f"procesos: {args.procesos} (+ el principal), hilos por proceso: {args.hilos}")
+    print(f"pedidos respondidos: {len(tamanos)} de {pedidos}")
+    print(f"cálculos: {llamadas}, registros: {registros} (cantones: {total_cantones}), "
+          f"cantones repetidos: {repetidos}, marca: {estado}")
+
+    fallas = []
+    if llamadas != 1:
+        fallas.append(f"se esperaba 1 cálculo y hubo {llamadas}")
+    if registros != total_cantones or repetidos:
+        fallas.append("no hay exactamente un registro por cantón")
+    if estado != "listo":
+        fallas.append(f"la marca del día quedó en {estado!r}")
+    if len(tamanos) != pedidos or any(t != total_cantones for t in tamanos):
+        fallas.append("algún pedido no recibió el reporte completo")
+    if fallas:
+        raise SystemExit("; ".join(fallas))
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
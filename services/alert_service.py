@@ -0,0 +1,273 @@
+import asyncio
+import json
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, case, func, select, update
+from sqlalchemy.orm import Session
+
+from app import models
+from app.config import settings
+from app.database import SessionLocal, dialect_insert
+
+logger = logging.getLogger(__name__)
+
+# Niveles de riesgo que generan alerta
+NIVELES_ALERTA = ("ALTO",)
+
+
+def generar_alertas(db: Session, fecha):
+    """
+    Escribe en el outbox una alerta por cada suscriptor de un cantón en riesgo ALTO
+    el día `fecha`. Un solo join (suscripciones x ciudades x reporte del día) leído
+    por partes con un cursor del lado del servidor, e insertado por lotes con
+    ON CONFLICT DO NOTHING: repetir el cálculo del día no duplica alertas.
+    Devuelve la cantidad de alertas nuevas.
+    """
+    consulta = (
+        select(
+            models.Subscription.user_id,
+            models.Subscription.city_id,
+            models.PredictionReport.location,
+            models.PredictionReport.probability,
+            models.PredictionReport.risk_level,
+        )
+        .join(models.City, models.City.id == models.Subscription.city_id)
+        .join(
+            models.PredictionReport,
+            and_(
+                models.PredictionReport.location == models.City.name,
+                models.PredictionReport.report_date == fecha,
+            ),
+        )
+        .where(models.PredictionReport.risk_level.in_(NIVELES_ALERTA))
+        .execution_options(yield_per=settings.alert_batch_size)
+    )
+
+    # Sentencia fija (se compila una sola vez) ejecutada con executemany por lote
+    insertar = dialect_insert(models.AlertOutbox.__table__).on_conflict_do_nothing(
+        index_elements=["user_id", "city_id", "report_date"]
+    )
+    antes = contar_alertas(db, fecha)
+    ahora = datetime.utcnow()
+    for filas in db.execute(consulta).partitions():
+        db.execute(insertar, [
+            {
+                "user_id": fila.user_id,
+                "city_id": fila.city_id,
+                "report_date": fecha,
+                "location": fila.location,
+                "probability": fila.probability,
+                "risk_level": fila.risk_level,
+                "status": "pendiente",
+                "attempts": 0,
+                "created_at": ahora,
+            }
+            for fila in filas
+        ])
+    # rowcount de un executemany no es confiable en todos los drivers: se cuenta antes y después
+    creadas = contar_alertas(db, fecha) - antes
+    db.commit()
+    return creadas
+
+
+def contar_alertas(db: Session, fecha):
+    return db.query(func.count(models.AlertOutbox.id)).filter(models.AlertOutbox.report_date == fecha).scalar()
+
+
+# --- Salidas de entrega ---
+
+class SalidaLog:
+    """Escribe cada alerta en la salida estándar (pruebas y desarrollo)."""
+
+    def entregar(self, alertas):
+        for alerta in alertas:
+            logger.info(
+                "ALERTA %s %s (%s, %.2f) -> %s", alerta['report_date'], alerta['location'],
+                alerta['risk_level'], alerta['probability'], alerta['email'],
+            )
+
+
+class SalidaArchivo:
+    """Agrega cada alerta como una línea JSON al archivo `ruta`."""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+
+    def entregar(self, alertas):
+        lineas = "".join(json.dumps(a, default=str, ensure_ascii=False) + "\n" for a in alertas)
+        with self._lock, open(self.ruta, "a", encoding="utf-8") as f:
+            f.write(lineas)
+
+
+# settings.alert_backend -> fábrica de la salida. Otras salidas (correo, push)
+# solo necesitan un método entregar(alertas) que lance una excepción si falla.
+SALIDAS = {
+    "log": lambda: SalidaLog(),
+    "archivo": lambda: SalidaArchivo(settings.alert_file_path),
+}
+
+
+class DespachadorAlertas:
+    """
+    Vacía el outbox por lotes con varios trabajadores concurrentes.
+
+    Cada trabajador reclama un lote (UPDATE de "pendiente" a "enviando" con una
+    marca propia; en Postgres con SKIP LOCKED), lo entrega a la salida y lo marca
+    "enviada". Si la entrega falla, el lote vuelve a "pendiente" hasta agotar
+    alert_max_attempts y entonces queda en "error". Los lotes reclamados por un
+    proceso que murió se liberan después de alert_claim_timeout_seconds.
+    """
+
+    def __init__(self, salida, tamano_lote, trabajadores):
+        self.salida = salida
+        self.tamano_lote = tamano_lote
+        self.trabajadores = trabajadores
+        self.enviadas = 0
+        self.fallidas = 0
+        self._tareas = []
+
+    def reclamar(self, db: Session):
+        marca = uuid.uuid4().hex
+        ahora = datetime.utcnow()
+        Alerta = models.AlertOutbox
+        ids = (
+            select(Alerta.id)
+            .where(Alerta.status == "pendiente")
+            .order_by(Alerta.id)
+            .limit(self.tamano_lote)
+            .with_for_update(skip_locked=True)
+        )
+        db.execute(
+            update(Alerta)
+            .where(Alerta.status == "pendiente", Alerta.id.in_(ids.scalar_subquery()))
+            .values(status="enviando", claim_token=marca, claimed_at=ahora, attempts=Alerta.attempts + 1)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+
+        filas = db.execute(
+            select(
+                Alerta.id, Alerta.user_id, models.User.email, Alerta.city_id, Alerta.location,
+                Alerta.report_date, Alerta.probability, Alerta.risk_level,
+            )
+            .join(models.User, models.User.id == Alerta.user_id)
+            .where(Alerta.claim_token == marca)
+            .order_by(Alerta.id)
+        ).mappings().all()
+        return marca, [dict(fila) for fila in filas]
+
+    def liberar_vencidas(self, db: Session):
+        limite = datetime.utcnow() - timedelta(seconds=settings.alert_claim_timeout_seconds)
+        db.execute(
+            update(models.AlertOutbox)
+            .where(models.AlertOutbox.status == "enviando", models.AlertOutbox.claimed_at < limite)
+            .values(
+                # Como en una entrega fallida: agotados los intentos, queda en "error"
+                # (si el despacho hace caer al proceso, no se reintenta para siempre)
+                status=case(
+                    (models.AlertOutbox.attempts >= settings.alert_max_attempts, "error"), else_="pendiente"
+                ),
+                claim_token=None,
+                last_error="Reclamo vencido (el proceso que la despachaba no terminó)",
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+
+    def procesar_lote(self):
+        """Reclama, entrega y marca un lote. Devuelve cuántas alertas tomó."""
+        db = SessionLocal()
+        try:
+            marca, alertas = self.reclamar(db)
+            if not alertas:
+                return 0
+            Alerta = models.AlertOutbox
+            try:
+                self.salida.entregar(alertas)
+            except Exception as e:
+                logger.error("Error entregando %d alertas: %s", len(alertas), e)
+                db.execute(
+                    update(Alerta)
+                    .where(Alerta.claim_token == marca)
+                    .values(
+                        status=case((Alerta.attempts >= settings.alert_max_attempts, "error"), else_="pendiente"),
+                        claim_token=None,
+                        last_error=str(e)[:500],
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+                db.commit()
+                self.fallidas += len(alertas)
+                return len(alertas)
+
+            db.execute(
+                update(Alerta)
+                .where(Alerta.claim_token == marca)
+                .values(status="enviada", sent_at=datetime.utcnow(), last_error=None)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            self.enviadas += len(alertas)
+            return len(alertas)
+        finally:
+            db.close()
+
+    def drenar(self):
+        """Procesa lotes hasta vaciar el outbox (en el hilo actual). Devuelve el total."""
+        total = 0
+        while True:
+            procesadas = self.procesar_lote()
+            if not procesadas:
+                return total
+            total += procesadas
+
+    def iniciar(self):
+        self._tareas = [asyncio.create_task(self._trabajador(i)) for i in range(self.trabajadores)]
+
+    async def detener(self):
+        for tarea in self._tareas:
+            tarea.cancel()
+        await asyncio.gather(*self._tareas, return_exceptions=True)
+        self._tareas = []
+
+    async def _trabajador(self, numero):
+        while True:
+            try:
+                if numero == 0:
+                    await asyncio.to_thread(self._liberar_vencidas)
+                procesadas = await asyncio.to_thread(self.procesar_lote)
+            except Exception as e:
+                logger.exception("Error en el despachador de alertas: %s", e)
+                procesadas = 0
+            if not procesadas:
+                await asyncio.sleep(settings.alert_poll_seconds)
+
+    def _liberar_vencidas(self):
+        db = SessionLocal()
+        try:
+            self.liberar_vencidas(db)
+        finally:
+            db.close()
+
+    def estadisticas(self, db: Session):
+        por_estado = dict(
+            db.query(models.AlertOutbox.status, func.count()).group_by(models.AlertOutbox.status).all()
+        )
+        return {
+            "salida": settings.alert_backend,
+            "trabajadores": self.trabajadores,
+            "por_estado": por_estado,
+            "enviadas_en_este_proceso": self.enviadas,
+            "fallidas_en_este_proceso": self.fallidas,
+        }
+
+
+despachador_alertas = DespachadorAlertas(
+    SALIDAS[settings.alert_backend](),
+    settings.alert_batch_size,
+    settings.alert_workers,
+)
@@ -0,0 +1,328 @@
+"""
+Backfill de reportes históricos: calcula y guarda PredictionReport para un rango
+de fechas pasadas y un conjunto de cantones, con el clima de la API de archivo
+de Open-Meteo (settings.open_meteo_archive_url; en pruebas, benchmarks/stub_open_meteo.py).
+
+- El trabajo se parte en tramos (backfill_batch_size cantones x backfill_window_days
+  días). Cada tramo es una sola consulta de clima, features vectorizadas por día
+  y una sola inferencia; los tramos se reparten en un pool de procesos.
+- El proceso principal es el único que escribe en la BD: upsert por
+  (report_date, location), así que repetir un tramo no duplica filas.
+- Cada tramo guardado queda en el archivo de checkpoint: si la corrida se corta,
+  la siguiente con los mismos parámetros sigue desde donde quedó.
+- Al final se recalculan los resúmenes semanales y mensuales del rango.
+
+Uso (desde la raíz del proyecto):
+    python -m services.backfill --desde 2020-01-01 --hasta 2024-12-31 [--cantones Quito,Cuenca]
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from app import models
+from app.config import settings
+from app.database import SessionLocal, create_tables, dialect_insert, engine
+from app.migrations import ejecutar_migraciones
+from services.city_catalog import registro_cantones
+from services import fechas
+from services.feature_store import DIAS_VENTANA
+from services.history_service import actualizar_rollups
+from services.model_registry import ModelRegistry
+from services.predict_service import sismo_service
+
+logger = logging.getLogger(__name__)
+
+# Filas por sentencia de upsert (6 columnas por fila: lejos del límite de parámetros de SQLite)
+FILAS_POR_UPSERT = 500
+
+
+# --- Tramos ---
+
+def armar_tramos(cantones, desde, hasta, dias_por_tramo, cantones_por_tramo):
+    """Lista de tramos {id, inicio, fin, cantones}, en orden cronológico."""
+    tramos = []
+    inicio = desde
+    while inicio <= hasta:
+        fin = min(inicio + timedelta(days=dias_por_tramo - 1), hasta)
+        for k in range(0, len(cantones), cantones_por_tramo):
+            tramos.append({
+                "id": f"{inicio.isoformat()}_{fin.isoformat()}_{k // cantones_por_tramo}",
+                "inicio": inicio,
+                "fin": fin,
+                "cantones": cantones[k:k + cantones_por_tramo],
+            })
+        inicio = fin + timedelta(days=1)
+    return tramos
+
+
+def _iniciar_proceso(version):
+    logging.basicConfig(level=settings.log_level.upper(), format=settings.log_format)
+    sismo_service.load_model()
+    sismo_service.registro.activar(version)
+
+
+def procesar_tramo(tramo):
+    """
+    Clima, features e inferencia de un tramo (corre en un proceso del pool).
+    Devuelve {id, filas: [(canton, fecha, probabilidad)], sin_datos: [cantones]}.
+    """
+    activo = sismo_service.registro.activo
+    # La ventana del primer día empieza DIAS_VENTANA - 1 días antes
+    desde_clima = tramo["inicio"] - timedelta(days=DIAS_VENTANA - 1)
+    coords = [(c["lat"], c["lon"]) for c in tramo["cantones"]]
+    climas = sismo_service.consultar_archivo_lote(coords, desde_clima, tramo["fin"])
+
+    nombres, fechas, matrices, sin_datos = [], [], [], []
+    for item, clima in zip(tramo["cantones"], climas):
+        if isinstance(clima, Exception):
+            sin_datos.append(item["canton"])
+            continue
+        dias, matriz = sismo_service.calcular_features_por_dia(item, clima, activo.feature_names)
+        dentro = (dias >= tramo["inicio"]) & (dias <= tramo["fin"])
+        if not dentro.any():
+            sin_datos.append(item["canton"])
+            continue
+        nombres.extend([item["canton"]] * int(dentro.sum()))
+        fechas.extend(dias[dentro])
+        matrices.append(matriz[dentro])
+
+    filas = []
+    if matrices:
+        # Una sola inferencia para todo el tramo
+        probabilidades = sismo_service.predecir_lote(np.vstack(matrices), activo, motor="xgboost")
+        filas = [(canton, fecha, float(p)) for canton, fecha, p in zip(nombres, fechas, probabilidades)]
+    return {"id": tramo["id"], "filas": filas, "sin_datos": sin_datos}
+
+
+# --- Checkpoint ---
+
+class Checkpoint:
+    """Tramos ya guardados, en un archivo JSON que se reescribe de forma atómica."""
+
+    def __init__(self, ruta, parametros):
+        self.ruta = ruta
+        self.parametros = parametros
+        self.completados = set()
+
+    def cargar(self, reiniciar=False):
+        if reiniciar or not os.path.exists(self.ruta):
+            return
+        with open(self.ruta) as f:
+            guardado = json.load(f)
+        anteriores = guardado.get("parametros") or {}
+        distintos = sorted(k for k in self.parametros if anteriores.get(k) != self.parametros[k])
+        if distintos:
+            raise ValueError(
+                f"El checkpoint {self.ruta} es de otra corrida (cambió: {', '.join(distintos)}). "
+                "Usar --reiniciar o otro --checkpoint."
+            )
+        self.completados = set(guardado.get("completados", []))
+
+    def marcar(self, tramo_id):
+        self.completados.add(tramo_id)
+        temporal = self.ruta + ".tmp"
+        with open(temporal, "w") as f:
+            json.dump({
+                "parametros": self.parametros,
+                "completados": sorted(self.completados),
+                "actualizado": datetime.now().isoformat(timespec="seconds"),
+            }, f, ensure_ascii=False)
+        os.replace(temporal, self.ruta)
+
+
+# --- Escritura ---
+
+def guardar_filas(db, filas, version):
+    """Upsert de [(canton, fecha, probabilidad)] en prediction_reports (sin commit)."""
+    tabla = models.PredictionReport.__table__
+    for k in range(0, len(filas), FILAS_POR_UPSERT):
+        valores = []
+        for canton, fecha, probabilidad in filas[k:k + FILAS_POR_UPSERT]:
+            nivel, _ = sismo_service.calcular_semaforo(probabilidad)
+            valores.append({
+                "location": canton, "report_date": fecha, "probability": round(probabilidad, 4),
+                "risk_level": nivel, "model_version": version, "weather_date": fecha,
+            })
+        stmt = dialect_insert(tabla).values(valores)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["report_date", "location"],
+            set_={
+                "probability": stmt.excluded.probability,
+                "risk_level": stmt.excluded.risk_level,
+                "model_version": stmt.excluded.model_version,
+                "weather_date": stmt.excluded.weather_date,
+            },
+        )
+        db.execute(stmt)
+
+
+def actualizar_resumenes(db, desde, hasta):
+    """Resúmenes de todas las semanas y meses del rango (cada paso de 7 días toca una semana y su mes)."""
+    fecha = desde
+    while True:
+        actualizar_rollups(db, fecha)
+        # Sin autoflush, el merge del mismo mes en el siguiente paso insertaría otra fila
+        db.flush()
+        if fecha >= hasta:
+            break
+        fecha = min(fecha + timedelta(days=7), hasta)
+    db.commit()
+
+
+# --- Corrida ---
+
+def leer_cantones(db, nombres=None):
+    cantones = [
+        {"canton": c["canton"], "lat": c["lat"], "lon": c["lon"]}
+        for c in registro_cantones.obtener(db).cantones()
+        if not nombres or c["canton"] in nombres
+    ]
+    if nombres:
+        faltan = set(nombres) - {c["canton"] for c in cantones}
+        if faltan:
+            raise ValueError(f"Cantones desconocidos o sin coordenadas: {', '.join(sorted(faltan))}")
+    return cantones
+
+
+def ejecutar(tramos, checkpoint, version, procesos):
+    """Procesa los tramos pendientes y guarda cada uno al terminar. Devuelve (filas, tramos fallidos)."""
+    pendientes = [t for t in tramos if t["id"] not in checkpoint.completados]
+    logger.info("Tramos: %d en total, %d ya guardados, %d pendientes",
+                len(tramos), len(tramos) - len(pendientes), len(pendientes))
+    guardadas, fallidos = 0, []
+    db = SessionLocal()
+
+    def guardar(tramo, resultado):
+        nonlocal guardadas
+        guardar_filas(db, resultado["filas"], version)
+        db.commit()
+        checkpoint.marcar(tramo["id"])
+        guardadas += len(resultado["filas"])
+        if resultado["sin_datos"]:
+            logger.warning("Tramo %s: sin clima para %s", tramo["id"], ", ".join(resultado["sin_datos"]))
+        logger.info("Tramo %s guardado: %d reportes (%d/%d tramos)",
+                    tramo["id"], len(resultado["filas"]), len(checkpoint.completados), len(tramos))
+
+    def fallo(tramo, error):
+        db.rollback()
+        fallidos.append(tramo["id"])
+        logger.error("Tramo %s falló: %s", tramo["id"], error)
+
+    try:
+        if procesos <= 0:
+            _iniciar_proceso(version)
+            for tramo in pendientes:
+                try:
+                    guardar(tramo, procesar_tramo(tramo))
+                except Exception as e:
+                    fallo(tramo, e)
+            return guardadas, fallidos
+
+        # spawn: los procesos no heredan conexiones a la BD ni sesiones HTTP
+        with ProcessPoolExecutor(
+            max_workers=procesos,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_iniciar_proceso,
+            initargs=(version,),
+        ) as executor:
+            # A lo sumo 2 tramos por proceso en vuelo: la memoria no crece con el rango
+            cola = iter(pendientes)
+            en_curso = {}
+            while True:
+                while len(en_curso) < procesos * 2:
+                    tramo = next(cola, None)
+                    if tramo is None:
+                        break
+                    en_curso[executor.submit(procesar_tramo, tramo)] = tramo
+                if not en_curso:
+                    break
+                listos, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+                for futuro in listos:
+                    tramo = en_curso.pop(futuro)
+                    try:
+                        guardar(tramo, futuro.result())
+                    except Exception as e:
+                        fallo(tramo, e)
+        return guardadas, fallidos
+    finally:
+        db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill de reportes de riesgo históricos.")
+    parser.add_argument("--desde", type=date.fromisoformat, required=True, help="primera fecha (AAAA-MM-DD)")
+    parser.add_argument("--hasta", type=date.fromisoformat, default=fechas.hoy() - timedelta(days=1),
+                        help="última fecha (por defecto, ayer)")
+    parser.add_argument("--cantones", default="", help="nombres separados por coma (por defecto, todos los de cities)")
+    parser.add_argument("--modelo", default=None, help="versión del modelo (por defecto, la activa)")
+    parser.add_argument("--procesos", type=int, default=settings.backfill_processes)
+    parser.add_argument("--dias-por-tramo", type=int, default=settings.backfill_window_days)
+    parser.add_argument("--cantones-por-tramo", type=int, default=settings.backfill_batch_size)
+    parser.add_argument("--checkpoint", default=settings.backfill_checkpoint_path)
+    parser.add_argument("--reiniciar", action="store_true", help="ignorar el checkpoint existente")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=settings.log_level.upper(), format=settings.log_format)
+    if args.desde > args.hasta:
+        parser.error("--desde es posterior a --hasta")
+    if args.hasta >= fechas.hoy():
+        parser.error("--hasta debe ser anterior a hoy (el reporte de hoy lo calcula el servidor)")
+
+    create_tables()
+    ejecutar_migraciones(engine)
+    db = SessionLocal()
+    try:
+        nombres = [n.strip() for n in args.cantones.split(",") if n.strip()]
+        cantones = leer_cantones(db, nombres)
+        version = args.modelo or ModelRegistry.version_deseada(db)
+        if version not in sismo_service.registro.descubrir():
+            raise ValueError(f"No existe la versión de modelo '{version}'")
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        db.close()
+    if not cantones:
+        parser.error("No hay cantones en la tabla cities (iniciar el servidor una vez la carga)")
+
+    parametros = {
+        "desde": args.desde.isoformat(), "hasta": args.hasta.isoformat(),
+        "cantones": [c["canton"] for c in cantones], "modelo": version,
+        "dias_por_tramo": args.dias_por_tramo, "cantones_por_tramo": args.cantones_por_tramo,
+    }
+    checkpoint = Checkpoint(args.checkpoint, parametros)
+    try:
+        checkpoint.cargar(args.reiniciar)
+    except ValueError as e:
+        parser.error(str(e))
+
+    tramos = armar_tramos(cantones, args.desde, args.hasta, args.dias_por_tramo, args.cantones_por_tramo)
+    logger.info("Backfill %s a %s: %d cantones, modelo '%s', %d procesos",
+                args.desde, args.hasta, len(cantones), version, args.procesos)
+    inicio = time.perf_counter()
+    guardadas, fallidos = ejecutar(tramos, checkpoint, version, args.procesos)
+    duracion = time.perf_counter() - inicio
+    logger.info("Reportes guardados: %d en %.1fs (%.0f/s)", guardadas, duracion, guardadas / duracion if duracion else 0)
+
+    db = SessionLocal()
+    try:
+        logger.info("Actualizando resúmenes semanales y mensuales...")
+        actualizar_resumenes(db, args.desde, args.hasta)
+    finally:
+        db.close()
+
+    if fallidos:
+        logger.error("%d tramos fallaron; volver a ejecutar el mismo comando para reintentarlos", len(fallidos))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+import io
+import json
+
+import numpy as np
+
+from app.config import settings
+
+# Tipos de contenido aceptados por /predict/batch
+TIPO_JSON = "application/json"
+TIPO_NPY = "application/x-npy"
+TIPO_BINARIO = "application/octet-stream"
+
+
+class EntradaInvalida(ValueError):
+    pass
+
+
+class DemasiadasFilas(ValueError):
+    pass
+
+
+def matriz_desde_json(cuerpo, feature_names):
+    """
+    {"columnas": {"<feature>": [v1, v2, ...], ...}}: una lista por feature,
+    todas del mismo largo. null se toma como dato faltante (NaN).
+    """
+    try:
+        datos = json.loads(cuerpo)
+    except ValueError as e:
+        raise EntradaInvalida(f"JSON inválido: {e}")
+    columnas = datos.get("columnas") if isinstance(datos, dict) else None
+    if not isinstance(columnas, dict):
+        raise EntradaInvalida('Se esperaba {"columnas": {"<feature>": [...]}}.')
+    verificar_nombres(list(columnas), feature_names)
+
+    largos = {len(v) if isinstance(v, list) else -1 for v in columnas.values()}
+    if len(largos) != 1 or -1 in largos:
+        raise EntradaInvalida("Todas las columnas deben ser listas del mismo largo.")
+    filas = largos.pop()
+    verificar_filas(filas)
+
+    matriz = np.empty((filas, len(feature_names)), dtype=np.float32)
+    for j, nombre in enumerate(feature_names):
+        try:
+            matriz[:, j] = np.array(columnas[nombre], dtype=np.float64)
+        except (TypeError, ValueError):
+            raise EntradaInvalida(f"La columna '{nombre}' tiene valores no numéricos.")
+    return matriz
+
+
+def matriz_desde_npy(cuerpo, feature_names, nombres_columnas=None):
+    """
+    Arreglo .npy de 2 dimensiones (filas x features). Las columnas siguen el orden
+    de feature_names, salvo que se indique otro en nombres_columnas.
+    """
+    try:
+        arreglo = np.load(io.BytesIO(cuerpo), allow_pickle=False)
+    except ValueError as e:
+        raise EntradaInvalida(f"Archivo .npy inválido: {e}")
+    if arreglo.ndim != 2 or not np.issubdtype(arreglo.dtype, np.number):
+        raise EntradaInvalida("Se esperaba un arreglo numérico de 2 dimensiones.")
+    verificar_filas(arreglo.shape[0])
+
+    nombres_columnas = nombres_columnas or list(feature_names)
+    if arreglo.shape[1] != len(nombres_columnas):
+        raise EntradaInvalida(
+            f"El arreglo tiene {arreglo.shape[1]} columnas y se esperaban {len(nombres_columnas)}."
+        )
+    verificar_nombres(nombres_columnas, feature_names)
+    orden = [nombres_columnas.index(nombre) for nombre in feature_names]
+    return np.ascontiguousarray(arreglo[:, orden], dtype=np.float32)
+
+
+def verificar_nombres(recibidos, feature_names):
+    faltantes = [n for n in feature_names if n not in recibidos]
+    sobrantes = [n for n in recibidos if n not in feature_names]
+    if faltantes or sobrantes or len(set(recibidos)) != len(recibidos):
+        raise EntradaInvalida(
+            f"Las columnas deben ser exactamente {list(feature_names)} "
+            f"(faltan: {faltantes}, sobran: {sobrantes})."
+        )
+
+
+def verificar_filas(filas):
+    if filas == 0:
+        raise EntradaInvalida("La entrada no tiene filas.")
+    if filas > settings.predict_batch_max_rows:
+        raise DemasiadasFilas(
+            f"Máximo {settings.predict_batch_max_rows} filas por petición (se recibieron {filas})."
+        )
+
+
+def predecir_por_bloques(servicio, matriz, activo):
+    """Genera las probabilidades de bloques de predict_batch_chunk_rows filas."""
+    tamano = settings.predict_batch_chunk_rows
+    for inicio in range(0, matriz.shape[0], tamano):
+        yield servicio.predecir_lote(matriz[inicio:inicio + tamano], activo).astype(np.float32)
+
+
+def respuesta_json(bloques, activo, filas):
+    yield f'{{"version_modelo":{json.dumps(activo.version)},"filas":{filas},"probabilidades":['
+    primero = True
+    for probabilidades in bloques:
+        # float32 -> float conserva ~7 cifras significativas, suficiente para una probabilidad
+        texto = ",".join(f"{p:.7g}" for p in probabilidades.tolist())
+        yield ("" if primero else ",") + texto
+        primero = False
+    yield "]}"
+
+
+def respuesta_binaria(bloques):
+    for probabilidades in bloques:
+        yield probabilidades.astype("<f4").tobytes()
@@ -0,0 +1,100 @@
+import logging
+import threading
+import time
+
+from app.config import settings
+from services.metrics import metricas
+
+logger = logging.getLogger(__name__)
+
+CERRADO = "cerrado"
+SEMIABIERTO = "semiabierto"
+ABIERTO = "abierto"
+
+# Valor del medidor por estado (para graficar y alertar)
+CODIGOS_ESTADO = {CERRADO: 0, SEMIABIERTO: 1, ABIERTO: 2}
+
+
+class CircuitoAbierto(Exception):
+    """El servicio externo está marcado como caído: no se intenta la consulta."""
+
+
+class Circuito:
+    """
+    Circuit breaker para un servicio externo:
+    - cerrado: las consultas pasan; `fallas` fallas seguidas lo abren;
+    - abierto: toda consulta falla en el acto (CircuitoAbierto) durante `espera` segundos;
+    - semiabierto: pasada la espera se deja pasar una sola consulta de prueba;
+      si sale bien se cierra, si falla se vuelve a abrir.
+    El estado es por proceso (cada worker tiene su circuito).
+    """
+
+    def __init__(self, nombre, fallas, espera):
+        self.nombre = nombre
+        self.fallas = fallas
+        self.espera = espera
+        self.estado = CERRADO
+        self.fallas_seguidas = 0
+        self.abierto_desde = None
+        self.rechazos = 0
+        self._prueba_en_curso = False
+        self._lock = threading.Lock()
+
+    def permitir(self):
+        """Lanza CircuitoAbierto si no se debe consultar ahora."""
+        with self._lock:
+            if self.estado == ABIERTO:
+                if time.monotonic() - self.abierto_desde < self.espera:
+                    self.rechazos += 1
+                    raise CircuitoAbierto(f"Circuito de {self.nombre} abierto")
+                self.estado = SEMIABIERTO
+                logger.info("Circuito de %s semiabierto: probando con una consulta", self.nombre)
+            if self.estado == SEMIABIERTO:
+                if self._prueba_en_curso:
+                    self.rechazos += 1
+                    raise CircuitoAbierto(f"Circuito de {self.nombre} semiabierto (prueba en curso)")
+                self._prueba_en_curso = True
+
+    def exito(self):
+        with self._lock:
+            if self.estado != CERRADO:
+                logger.info("Circuito de %s cerrado: el servicio volvió a responder", self.nombre)
+            self.estado = CERRADO
+            self.fallas_seguidas = 0
+            self._prueba_en_curso = False
+
+    def falla(self):
+        with self._lock:
+            self.fallas_seguidas += 1
+            self._prueba_en_curso = False
+            if self.estado == SEMIABIERTO or (self.estado == CERRADO and self.fallas_seguidas >= self.fallas):
+                self.estado = ABIERTO
+                self.abierto_desde = time.monotonic()
+                logger.warning("Circuito de %s abierto tras %d fallas seguidas (reintento en %.0fs)",
+                               self.nombre, self.fallas_seguidas, self.espera)
+
+    def estadisticas(self):
+        with self._lock:
+            restante = None
+            if self.estado == ABIERTO:
+                restante = round(max(0.0, self.espera - (time.monotonic() - self.abierto_desde)), 1)
+            return {
+                "estado": self.estado,
+                "fallas_seguidas": self.fallas_seguidas,
+                "rechazos": self.rechazos,
+                "segundos_para_probar": restante,
+            }
+
+
+circuito_open_meteo = Circuito(
+    "Open-Meteo", settings.weather_circuit_failures, settings.weather_circuit_reset_seconds
+)
+
+metricas.medidor(
+    "circuito_estado", "Estado del circuito por servicio (0 cerrado, 1 semiabierto, 2 abierto)", ("servicio",),
+    funcion=lambda: {("open_meteo",): CODIGOS_ESTADO[circuito_open_meteo.estado]},
+)
+metricas.contador(
+    "circuito_rechazos_total", "Consultas no enviadas porque el circuito estaba abierto", ("servicio",),
+    funcion=lambda: {("open_meteo",): circuito_open_meteo.rechazos},
+)
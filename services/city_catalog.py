@@ -0,0 +1,155 @@
+import threading
+import time
+
+import numpy as np
+from scipy.spatial import cKDTree
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.config import settings
+from app.database import SessionLocal
+
+RADIO_TIERRA_KM = 6371.0088
+
+
+class CatalogoCiudades:
+    """
+    Ids de las ciudades en memoria, para validar listas de city_ids sin consultar la BD.
+
+    Se recarga al invalidarse (cambios hechos en este worker), cada `ttl` segundos
+    (cambios de otros workers) y, una sola vez, cuando llega un id desconocido.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._ids = None
+        self._cargado = 0.0
+        self._lock = threading.Lock()
+
+    def invalidar(self):
+        self._ids = None
+
+    async def recargar(self, db: AsyncSession):
+        ids = frozenset((await db.scalars(select(models.City.id))).all())
+        with self._lock:
+            self._ids = ids
+            self._cargado = time.monotonic()
+        return ids
+
+    async def ids(self, db: AsyncSession):
+        ids = self._ids
+        if ids is None or time.monotonic() - self._cargado > self.ttl:
+            ids = await self.recargar(db)
+        return ids
+
+    async def desconocidos(self, db: AsyncSession, city_ids):
+        """Los ids de city_ids que no corresponden a ninguna ciudad (en el orden recibido)."""
+        ids = await self.ids(db)
+        faltantes = [cid for cid in city_ids if cid not in ids]
+        if faltantes:
+            # Puede ser una ciudad creada por otro worker: se confirma contra la BD
+            ids = await self.recargar(db)
+            faltantes = [cid for cid in faltantes if cid not in ids]
+        return faltantes
+
+
+def a_cartesianas(lats, lons):
+    """Puntos de la esfera unitaria: la distancia euclídea (cuerda) ordena igual que la distancia real."""
+    lat, lon = np.radians(lats), np.radians(lons)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+class IndiceCantones:
+    """
+    Foto inmutable de los cantones: arreglos de coordenadas y un KD-tree sobre
+    ellos. Para cambiarla se arma otra y se reemplaza la referencia.
+    """
+
+    def __init__(self, filas):
+        # filas: ((id, nombre, provincia, lat, lon), ...) en orden de id
+        self.filas = filas
+        self.lista = [
+            {"id": cid, "canton": nombre, "provincia": provincia, "lat": lat, "lon": lon}
+            for cid, nombre, provincia, lat, lon in filas
+        ]
+        self.posicion = {c["canton"]: i for i, c in enumerate(self.lista)}
+        self.coords = np.array([(c["lat"], c["lon"]) for c in self.lista], dtype=np.float64).reshape(-1, 2)
+        self.arbol = cKDTree(a_cartesianas(self.coords[:, 0], self.coords[:, 1])) if self.lista else None
+
+    def __len__(self):
+        return len(self.lista)
+
+    def cantones(self):
+        """Los cantones como dicts {id, canton, provincia, lat, lon} (no modificar)."""
+        return self.lista
+
+    def buscar(self, nombre):
+        i = self.posicion.get(nombre)
+        return self.lista[i] if i is not None else None
+
+    def cercanos(self, lat, lon, k=1):
+        """[(canton, distancia_km)] de los k cantones más cercanos, del más cercano al más lejano."""
+        k = min(k, len(self))
+        if k == 0:
+            return []
+        cuerdas, indices = self.arbol.query(a_cartesianas([lat], [lon])[0], k=k)
+        cuerdas, indices = np.atleast_1d(cuerdas), np.atleast_1d(indices)
+        distancias = 2 * RADIO_TIERRA_KM * np.arcsin(np.minimum(cuerdas / 2, 1.0))
+        return [(self.lista[i], float(d)) for i, d in zip(indices, distancias)]
+
+
+class RegistroCantones:
+    """
+    Los cantones de la tabla cities (la única lista: app/init_data.py solo la
+    siembra) en un IndiceCantones, para el cálculo del reporte y la búsqueda por
+    punto. Las ciudades sin coordenadas (0, 0) quedan fuera.
+
+    Igual que CatalogoCiudades: se recarga al invalidarse (cambios de este
+    worker) y cada `ttl` segundos (cambios de otros workers); el índice solo
+    se rearma si las filas cambiaron.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._indice = None
+        self._revisado = 0.0
+        self._lock = threading.Lock()
+
+    def invalidar(self):
+        self._revisado = 0.0
+
+    def vigente(self):
+        """El índice si no toca revisarlo (sin tocar la BD), o None."""
+        indice = self._indice
+        if indice is not None and time.monotonic() - self._revisado < self.ttl:
+            return indice
+        return None
+
+    def obtener(self, db=None):
+        indice = self.vigente()
+        if indice is not None:
+            return indice
+        with self._lock:
+            indice = self.vigente()
+            if indice is not None:
+                return indice
+            propia = db is None
+            db = SessionLocal() if propia else db
+            try:
+                filas = tuple(tuple(fila) for fila in db.execute(
+                    select(models.City.id, models.City.name, models.City.province, models.City.lat, models.City.lon)
+                    .where((models.City.lat != 0.0) | (models.City.lon != 0.0))
+                    .order_by(models.City.id)
+                ))
+            finally:
+                if propia:
+                    db.close()
+            if self._indice is None or self._indice.filas != filas:
+                self._indice = IndiceCantones(filas)
+            self._revisado = time.monotonic()
+            return self._indice
+
+
+catalogo_ciudades = CatalogoCiudades(settings.city_cache_ttl_seconds)
+registro_cantones = RegistroCantones(settings.city_cache_ttl_seconds)
@@ -0,0 +1,192 @@
+import math
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app import models
+
+# Misma ventana que preparar_datos: 30 días pasados + el pronóstico de hoy
+DIAS_VENTANA = 31
+
+
+def es_nulo(x):
+    return x is None or (isinstance(x, float) and math.isnan(x))
+
+
+class EstadisticaMovil:
+    """
+    Suma, media y varianza de una ventana deslizante con altas y bajas en O(1)
+    (Welford). Los valores nulos se ignoran, igual que en pandas.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.suma = 0.0
+        self.media = 0.0
+        self.m2 = 0.0
+
+    def agregar(self, x):
+        if es_nulo(x):
+            return
+        self.n += 1
+        self.suma += x
+        delta = x - self.media
+        self.media += delta / self.n
+        self.m2 += delta * (x - self.media)
+
+    def quitar(self, x):
+        if es_nulo(x):
+            return
+        self.n -= 1
+        if self.n == 0:
+            self.suma = self.media = self.m2 = 0.0
+            return
+        self.suma -= x
+        delta = x - self.media
+        self.media -= delta / self.n
+        self.m2 = max(self.m2 - delta * (x - self.media), 0.0)
+
+    def promedio(self):
+        return self.media if self.n else float("nan")
+
+    def desviacion(self):
+        # Muestral (ddof=1), como pandas.Series.std
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else float("nan")
+
+
+class VentanaCanton:
+    """Últimos DIAS_VENTANA días de clima de un cantón con sus agregados."""
+
+    def __init__(self):
+        self.dias = OrderedDict()  # fecha -> (precip, temp, pres), en orden cronológico
+        self.precip = EstadisticaMovil()
+        self.temp = EstadisticaMovil()
+        self.pres = EstadisticaMovil()
+
+    @property
+    def ultimo_dia(self):
+        return next(reversed(self.dias)) if self.dias else None
+
+    def _sumar(self, valores, signo):
+        for estadistica, x in zip((self.precip, self.temp, self.pres), valores):
+            if signo > 0:
+                estadistica.agregar(x)
+            else:
+                estadistica.quitar(x)
+
+    def poner(self, fecha, precip, temp, pres):
+        """Agrega (o reemplaza) un día y saca los que quedaron fuera de la ventana."""
+        valores = (precip, temp, pres)
+        if fecha in self.dias:
+            self._sumar(self.dias[fecha], -1)
+            self.dias[fecha] = valores
+        elif self.dias and fecha < self.ultimo_dia:
+            # Día atrasado: se inserta en su lugar (poco frecuente)
+            self.dias[fecha] = valores
+            self.dias = OrderedDict(sorted(self.dias.items()))
+        else:
+            self.dias[fecha] = valores
+        self._sumar(valores, +1)
+
+        inicio = self.ultimo_dia - timedelta(days=DIAS_VENTANA - 1)
+        while self.dias and next(iter(self.dias)) < inicio:
+            _, viejos = self.dias.popitem(last=False)
+            self._sumar(viejos, -1)
+
+    def features(self, ubicacion):
+        primero = self.dias[next(iter(self.dias))][2]
+        ultimo = self.dias[self.ultimo_dia][2]
+        return {
+            'latitud': ubicacion['lat'],
+            'longitud': ubicacion['lon'],
+            'precip_sum': self.precip.suma,
+            'temp_mean': self.temp.promedio(),
+            'temp_std': self.temp.desviacion(),
+            'pres_mean': self.pres.promedio(),
+            'pres_delta': (float("nan") if es_nulo(primero) or es_nulo(ultimo) else ultimo - primero),
+        }
+
+
+class FeatureStore:
+    """
+    Almacén incremental de features por cantón.
+    - El clima diario se guarda en la tabla weather_daily (compartida entre workers).
+    - En memoria se mantiene la ventana de cada cantón con sumas y varianzas
+      móviles, así que cada día nuevo cuesta O(1) en lugar de recalcular 31 días.
+    - Solo se piden a Open-Meteo los días que faltan.
+    """
+
+    def __init__(self):
+        self.ventanas = {}
+        self._lock = threading.Lock()
+
+    def cargar(self, db: Session, cantones, hoy):
+        """Reconstruye desde la BD las ventanas de los cantones que no están en memoria."""
+        faltan = [c['canton'] for c in cantones if c['canton'] not in self.ventanas]
+        if not faltan:
+            return
+        filas = db.query(models.WeatherDaily).filter(
+            models.WeatherDaily.location.in_(faltan),
+            models.WeatherDaily.day > hoy - timedelta(days=DIAS_VENTANA),
+        ).order_by(models.WeatherDaily.day).all()
+
+        with self._lock:
+            for canton in faltan:
+                self.ventanas.setdefault(canton, VentanaCanton())
+            for fila in filas:
+                self.ventanas[fila.location].poner(
+                    fila.day, fila.precipitation_sum, fila.temperature_2m_mean, fila.pressure_msl_mean
+                )
+
+    def dias_a_pedir(self, canton, hoy):
+        """
+        past_days a pedir para completar la ventana. Se vuelve a pedir el último
+        día guardado porque pudo haber sido un pronóstico. 0 = ya está al día.
+        """
+        ventana = self.ventanas.get(canton)
+        if ventana is None or ventana.ultimo_dia is None:
+            return DIAS_VENTANA - 1
+        atraso = (hoy - ventana.ultimo_dia).days
+        if atraso <= 0:
+            return 0
+        return min(atraso, DIAS_VENTANA - 1)
+
+    def ultimo_dia(self, canton):
+        """Último día de clima guardado del cantón (None si no hay ninguno)."""
+        ventana = self.ventanas.get(canton)
+        return ventana.ultimo_dia if ventana is not None else None
+
+    def registrar(self, db: Session, canton, data_json):
+        """Guarda los días recibidos de Open-Meteo y actualiza la ventana del cantón."""
+        daily = data_json['daily']
+        dias = [date.fromisoformat(d) for d in daily['time']]
+        filas = list(zip(dias, daily['precipitation_sum'], daily['temperature_2m_mean'], daily['pressure_msl_mean']))
+
+        db.query(models.WeatherDaily).filter(
+            models.WeatherDaily.location == canton,
+            models.WeatherDaily.day.in_(dias),
+        ).delete(synchronize_session=False)
+        db.bulk_insert_mappings(models.WeatherDaily, [
+            {"location": canton, "day": dia, "precipitation_sum": precip,
+             "temperature_2m_mean": temp, "pressure_msl_mean": pres}
+            for dia, precip, temp, pres in filas
+        ])
+
+        with self._lock:
+            ventana = self.ventanas.setdefault(canton, VentanaCanton())
+            for dia, precip, temp, pres in filas:
+                ventana.poner(dia, precip, temp, pres)
+
+    def vector(self, ubicacion, feature_names):
+        ventana = self.ventanas.get(ubicacion['canton'])
+        if ventana is None or not ventana.dias:
+            raise ValueError("Sin datos de clima en el almacén de features")
+        input_dict = ventana.features(ubicacion)
+        nombres = feature_names or list(input_dict)
+        return np.array([input_dict[n] for n in nombres], dtype=np.float32)
+
+
+feature_store = FeatureStore()
@@ -0,0 +1,18 @@
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from app.config import settings
+
+# Los días del reporte son los de Ecuador: Open-Meteo (timezone=auto) devuelve fechas
+# locales de cada punto, y el servidor puede estar en UTC
+ZONA = ZoneInfo(settings.zona_horaria)
+
+
+def ahora():
+    """Hora local de settings.zona_horaria, sin tzinfo (como datetime.now())."""
+    return datetime.now(ZONA).replace(tzinfo=None)
+
+
+def hoy():
+    """Fecha del reporte de hoy en settings.zona_horaria."""
+    return ahora().date()
@@ -0,0 +1,245 @@
+import json
+import os
+import time
+import warnings
+from datetime import date
+
+import numpy as np
+from scipy.interpolate import NearestNDInterpolator, RegularGridInterpolator
+
+from app.config import settings
+from services import fechas
+from services.metrics import etapa
+
+# Ecuador continental (lat_min, lat_max, lon_min, lon_max)
+BBOX_ECUADOR = (-5.0, 1.5, -81.1, -75.2)
+
+
+def ejes(lat_min, lat_max, lon_min, lon_max, paso):
+    """Centros de celda; las filas van de norte a sur (como una imagen)."""
+    lats = np.round(np.arange(lat_max, lat_min - paso / 2, -paso), 6)
+    lons = np.round(np.arange(lon_min, lon_max + paso / 2, paso), 6)
+    return lats, lons
+
+
+def rellenar_nulos(valores, lats, lons):
+    """Completa las celdas sin datos con el valor de la celda válida más cercana."""
+    validos = ~np.isnan(valores)
+    if validos.all() or not validos.any():
+        return valores
+    malla_lat, malla_lon = np.meshgrid(lats, lons, indexing="ij")
+    vecino = NearestNDInterpolator(
+        np.column_stack([malla_lat[validos], malla_lon[validos]]), valores[validos]
+    )
+    resultado = valores.copy()
+    resultado[~validos] = vecino(malla_lat[~validos], malla_lon[~validos])
+    return resultado
+
+
+class GrillaRiesgo:
+    """
+    Superficie de riesgo sobre una grilla regular lat/lon.
+
+    El clima se consulta en una grilla gruesa (grid_weather_step, en lote y con caché)
+    y se interpola a la grilla fina (grid_step); latitud/longitud usan los valores
+    exactos de cada celda. Todas las celdas se evalúan en una sola llamada al booster.
+    El resultado es un raster float32 en disco que se lee con np.memmap.
+    """
+
+    def __init__(self, directorio, paso, paso_clima, bbox=BBOX_ECUADOR):
+        self.directorio = directorio
+        self.paso = paso
+        self.paso_clima = paso_clima
+        self.bbox = bbox
+
+    def rutas(self, fecha):
+        base = os.path.join(self.directorio, f"riesgo_{fecha.isoformat()}")
+        return base + ".f32", base + ".json"
+
+    def existe(self, fecha):
+        return all(os.path.exists(r) for r in self.rutas(fecha))
+
+    def ruta_lock(self, fecha):
+        return os.path.join(self.directorio, f"riesgo_{fecha.isoformat()}.lock")
+
+    def reclamar(self, fecha):
+        """
+        Se queda con el cálculo de la grilla de la fecha entre todos los workers:
+        gana quien crea el archivo .lock (O_EXCL es atómico). Un lock más viejo que
+        report_lock_timeout_seconds se considera abandonado y se puede retomar.
+        """
+        os.makedirs(self.directorio, exist_ok=True)
+        ruta = self.ruta_lock(fecha)
+        if self._crear_lock(ruta):
+            return True
+        try:
+            if time.time() - os.path.getmtime(ruta) < settings.report_lock_timeout_seconds:
+                return False
+            # Renombrar es atómico: solo un worker aparta el lock abandonado
+            abandonado = f"{ruta}.{os.getpid()}.abandonado"
+            os.rename(ruta, abandonado)
+            os.remove(abandonado)
+        except FileNotFoundError:
+            return False
+        return self._crear_lock(ruta)
+
+    @staticmethod
+    def _crear_lock(ruta):
+        try:
+            fd = os.open(ruta, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w") as f:
+            f.write(str(os.getpid()))
+        return True
+
+    def liberar(self, fecha):
+        try:
+            os.remove(self.ruta_lock(fecha))
+        except FileNotFoundError:
+            pass
+
+    def calcular(self, servicio, fecha=None):
+        fecha = fecha or fechas.hoy()
+        lats, lons = ejes(*self.bbox, self.paso)
+        lats_clima, lons_clima = ejes(*self.bbox, self.paso_clima)
+
+        # 1. Clima en la grilla gruesa
+        puntos = [
+            {"canton": f"grilla:{lat},{lon}", "lat": float(lat), "lon": float(lon)}
+            for lat in lats_clima for lon in lons_clima
+        ]
+        # Misma versión del modelo para features e inferencia
+        activo = servicio.registro.activo
+        if activo is None:
+            raise RuntimeError("El modelo no está disponible")
+        nombres = activo.feature_names
+        features = servicio.features_desde_clima(puntos, nombres)
+
+        gruesa = np.full((len(puntos), len(nombres)), np.nan, dtype=np.float64)
+        for i, punto in enumerate(puntos):
+            vector = features[punto["canton"]]
+            if not isinstance(vector, Exception):
+                gruesa[i] = vector
+        gruesa = gruesa.reshape(len(lats_clima), len(lons_clima), len(nombres))
+        if np.isnan(gruesa).all():
+            raise RuntimeError("No se obtuvo clima para ningún punto de la grilla")
+
+        # 2. Interpolación a la grilla fina (los ejes deben ser crecientes)
+        with etapa("grilla_interpolacion"):
+            matriz = self.interpolar(gruesa, nombres, lats, lons, lats_clima, lons_clima)
+
+        # 3. Una sola inferencia para todas las celdas
+        with etapa("inferencia"):
+            raster = servicio.predecir_lote(matriz, activo).astype(np.float32).reshape(len(lats), len(lons))
+        with etapa("grilla_guardado"):
+            self.guardar(fecha, raster, lats, lons)
+        return raster
+
+    @staticmethod
+    def interpolar(gruesa, nombres, lats, lons, lats_clima, lons_clima):
+        malla_lat, malla_lon = np.meshgrid(lats, lons, indexing="ij")
+        destino = np.column_stack([malla_lat.ravel(), malla_lon.ravel()])
+        matriz = np.empty((destino.shape[0], len(nombres)), dtype=np.float32)
+        for j, nombre in enumerate(nombres):
+            if nombre == "latitud":
+                matriz[:, j] = destino[:, 0]
+            elif nombre == "longitud":
+                matriz[:, j] = destino[:, 1]
+            else:
+                capa = rellenar_nulos(gruesa[:, :, j], lats_clima, lons_clima)
+                interpolador = RegularGridInterpolator(
+                    (lats_clima[::-1], lons_clima), capa[::-1],
+                    bounds_error=False, fill_value=None,
+                )
+                matriz[:, j] = interpolador(destino)
+        return matriz
+
+    def guardar(self, fecha, raster, lats, lons):
+        os.makedirs(self.directorio, exist_ok=True)
+        ruta_raster, ruta_meta = self.rutas(fecha)
+        meta = {
+            "fecha": fecha.isoformat(),
+            "filas": int(raster.shape[0]),
+            "columnas": int(raster.shape[1]),
+            "paso": self.paso,
+            "lat_norte": float(lats[0]),
+            "lon_oeste": float(lons[0]),
+            "dtype": "float32-le",
+        }
+        # Escritura atómica: otro worker puede estar leyendo el archivo anterior
+        temporal = ruta_raster + f".{os.getpid()}.tmp"
+        raster.astype("<f4").tofile(temporal)
+        os.replace(temporal, ruta_raster)
+        temporal = ruta_meta + f".{os.getpid()}.tmp"
+        with open(temporal, "w") as f:
+            json.dump(meta, f)
+        os.replace(temporal, ruta_meta)
+
+    def cargar(self, fecha=None):
+        """Devuelve (meta, raster memmap) de la fecha o del último día disponible."""
+        if fecha is None:
+            if not os.path.isdir(self.directorio):
+                return None, None
+            disponibles = sorted(
+                f for f in os.listdir(self.directorio) if f.startswith("riesgo_") and f.endswith(".json")
+            )
+            if not disponibles:
+                return None, None
+            fecha = date.fromisoformat(disponibles[-1][len("riesgo_"):-len(".json")])
+        if not self.existe(fecha):
+            return None, None
+
+        ruta_raster, ruta_meta = self.rutas(fecha)
+        with open(ruta_meta) as f:
+            meta = json.load(f)
+        raster = np.memmap(ruta_raster, dtype="<f4", mode="r", shape=(meta["filas"], meta["columnas"]))
+        return meta, raster
+
+    @staticmethod
+    def recortar(meta, raster, bbox=None, zoom=None):
+        """
+        Recorta el raster al bbox (lon_min, lat_min, lon_max, lat_max) y lo reduce
+        según el zoom: cada nivel por debajo de grid_max_zoom agrupa 2x2 celdas
+        tomando el máximo (el riesgo no se diluye al alejarse).
+        Devuelve (arreglo float32, meta del recorte).
+        """
+        paso = meta["paso"]
+        fila0, col0 = 0, 0
+        fila1, col1 = meta["filas"], meta["columnas"]
+        if bbox is not None:
+            lon_min, lat_min, lon_max, lat_max = bbox
+            fila0 = max(0, int(np.floor((meta["lat_norte"] - lat_max) / paso)))
+            fila1 = min(meta["filas"], int(np.ceil((meta["lat_norte"] - lat_min) / paso)) + 1)
+            col0 = max(0, int(np.floor((lon_min - meta["lon_oeste"]) / paso)))
+            col1 = min(meta["columnas"], int(np.ceil((lon_max - meta["lon_oeste"]) / paso)) + 1)
+        recorte = np.asarray(raster[fila0:fila1, col0:col1], dtype=np.float32)
+
+        factor = 1
+        if zoom is not None and zoom < settings.grid_max_zoom:
+            factor = 2 ** (settings.grid_max_zoom - zoom)
+        if factor > 1 and recorte.size:
+            filas = -(-recorte.shape[0] // factor) * factor
+            columnas = -(-recorte.shape[1] // factor) * factor
+            relleno = np.full((filas, columnas), np.nan, dtype=np.float32)
+            relleno[:recorte.shape[0], :recorte.shape[1]] = recorte
+            bloques = relleno.reshape(filas // factor, factor, columnas // factor, factor)
+            with warnings.catch_warnings():
+                # Bloques sin datos (todo NaN) quedan como NaN
+                warnings.simplefilter("ignore", RuntimeWarning)
+                recorte = np.nanmax(np.nanmax(bloques, axis=3), axis=1).astype(np.float32)
+
+        meta_recorte = {
+            "fecha": meta["fecha"],
+            "filas": int(recorte.shape[0]),
+            "columnas": int(recorte.shape[1]),
+            "paso": round(paso * factor, 6),
+            # Centro de la primera celda (o bloque) del recorte
+            "lat_norte": round(meta["lat_norte"] - fila0 * paso - (factor - 1) * paso / 2, 6),
+            "lon_oeste": round(meta["lon_oeste"] + col0 * paso + (factor - 1) * paso / 2, 6),
+            "dtype": meta["dtype"],
+        }
+        return recorte, meta_recorte
+
+
+grilla_riesgo = GrillaRiesgo(settings.grid_dir, settings.grid_step, settings.grid_weather_step)
@@ -0,0 +1,159 @@
+import base64
+import json
+from datetime import date, timedelta
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from app import models
+
+# Granularidad -> (modelo de resumen, función que da el inicio del periodo)
+ROLLUPS = {
+    "semana": (models.WeeklyRiskRollup, lambda d: d - timedelta(days=d.weekday())),
+    "mes": (models.MonthlyRiskRollup, lambda d: d.replace(day=1)),
+}
+
+
+def fin_de_periodo(granularidad, inicio):
+    if granularidad == "semana":
+        return inicio + timedelta(days=6)
+    siguiente_mes = (inicio.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return siguiente_mes - timedelta(days=1)
+
+
+def acumular(acumulados, clave, probabilidad, nivel):
+    a = acumulados.setdefault(clave, {"days": 0, "prob_sum": 0.0, "prob_max": 0.0, "alto_days": 0})
+    a["days"] += 1
+    a["prob_sum"] += probabilidad
+    a["prob_max"] = max(a["prob_max"], probabilidad)
+    a["alto_days"] += 1 if nivel == "ALTO" else 0
+
+
+def guardar_resumenes(db: Session, modelo, acumulados):
+    """acumulados: {(location, period_start): {...}}. Reemplaza esos periodos."""
+    for (location, inicio), valores in acumulados.items():
+        db.merge(modelo(location=location, period_start=inicio, **valores))
+
+
+def actualizar_rollups(db: Session, fecha):
+    """
+    Recalcula solo la semana y el mes que contienen `fecha` a partir de los
+    reportes diarios de ese periodo (búsqueda por rango en report_date).
+    Se llama al guardar o descartar el reporte del día, dentro de la misma transacción.
+    """
+    for granularidad, (modelo, inicio_de) in ROLLUPS.items():
+        inicio = inicio_de(fecha)
+        fin = fin_de_periodo(granularidad, inicio)
+
+        filas = db.query(
+            models.PredictionReport.location,
+            models.PredictionReport.probability,
+            models.PredictionReport.risk_level,
+        ).filter(
+            models.PredictionReport.report_date >= inicio,
+            models.PredictionReport.report_date <= fin,
+        ).all()
+
+        acumulados = {}
+        for location, probabilidad, nivel in filas:
+            acumular(acumulados, (location, inicio), probabilidad, nivel)
+
+        # Cantones que ya no tienen días en el periodo (p.ej. reporte descartado)
+        sobrantes = db.query(modelo).filter(modelo.period_start == inicio)
+        if acumulados:
+            sobrantes = sobrantes.filter(modelo.location.notin_([loc for loc, _ in acumulados]))
+        sobrantes.delete(synchronize_session=False)
+        guardar_resumenes(db, modelo, acumulados)
+
+
+def reconstruir_rollups(db: Session):
+    """Recalcula todos los resúmenes desde cero (para datos previos a esta tabla)."""
+    acumulados = {granularidad: {} for granularidad in ROLLUPS}
+    filas = db.query(
+        models.PredictionReport.location,
+        models.PredictionReport.report_date,
+        models.PredictionReport.probability,
+        models.PredictionReport.risk_level,
+    ).yield_per(10000)
+
+    for location, fecha, probabilidad, nivel in filas:
+        for granularidad, (_, inicio_de) in ROLLUPS.items():
+            acumular(acumulados[granularidad], (location, inicio_de(fecha)), probabilidad, nivel)
+
+    for granularidad, (modelo, _) in ROLLUPS.items():
+        db.query(modelo).delete(synchronize_session=False)
+        guardar_resumenes(db, modelo, acumulados[granularidad])
+    db.commit()
+
+
+def codificar_cursor(fecha, canton):
+    crudo = json.dumps([fecha.isoformat(), canton]).encode("utf-8")
+    return base64.urlsafe_b64encode(crudo).decode("ascii")
+
+
+def decodificar_cursor(cursor):
+    try:
+        fecha, canton = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return date.fromisoformat(fecha), canton
+    except Exception:
+        raise ValueError("Cursor inválido.")
+
+
+def consultar_historial(db: Session, granularidad="dia", cantones=None, desde=None, hasta=None,
+                        cursor=None, limite=1000):
+    """
+    Itera las filas del historial en orden (fecha, cantón), con paginación por
+    keyset: el cursor es la última (fecha, cantón) entregada, nunca un OFFSET.
+    Entrega hasta `limite` filas y al final un dict {"siguiente": cursor o None}.
+    """
+    if granularidad == "dia":
+        modelo = models.PredictionReport
+        col_fecha, col_canton = modelo.report_date, modelo.location
+        columnas = [col_fecha, col_canton, modelo.probability, modelo.risk_level]
+    else:
+        modelo = ROLLUPS[granularidad][0]
+        col_fecha, col_canton = modelo.period_start, modelo.location
+        columnas = [col_fecha, col_canton, modelo.days, modelo.prob_sum, modelo.prob_max, modelo.alto_days]
+
+    consulta = db.query(*columnas)
+    if cantones:
+        consulta = consulta.filter(col_canton.in_(cantones))
+    if desde:
+        consulta = consulta.filter(col_fecha >= desde)
+    if hasta:
+        consulta = consulta.filter(col_fecha <= hasta)
+    if cursor:
+        ultima_fecha, ultimo_canton = decodificar_cursor(cursor)
+        consulta = consulta.filter(or_(
+            col_fecha > ultima_fecha,
+            and_(col_fecha == ultima_fecha, col_canton > ultimo_canton),
+        ))
+
+    # Pedimos una fila extra para saber si hay otra página
+    consulta = consulta.order_by(col_fecha, col_canton).limit(limite + 1).yield_per(500)
+
+    entregadas = 0
+    ultima = None
+    for fila in consulta:
+        if entregadas == limite:
+            yield {"siguiente": codificar_cursor(ultima[0], ultima[1])}
+            return
+        entregadas += 1
+        ultima = fila
+        if granularidad == "dia":
+            yield {
+                "fecha": fila[0].isoformat(),
+                "canton": fila[1],
+                "probabilidad": fila[2],
+                "nivel_riesgo": fila[3],
+            }
+        else:
+            yield {
+                "periodo_inicio": fila[0].isoformat(),
+                "canton": fila[1],
+                "dias": fila[2],
+                "probabilidad_media": round(fila[3] / fila[2], 4) if fila[2] else None,
+                "probabilidad_max": fila[4],
+                "dias_alto": fila[5],
+            }
+    yield {"siguiente": None}
@@ -0,0 +1,286 @@
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Límites de los histogramas de duración (segundos)
+BUCKETS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+TIPO_CONTENIDO = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _etiquetas_texto(nombres, valores, extra=None):
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _numero(valor):
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Metrica:
+    """
+    Una familia de series con las mismas etiquetas. Si se pasa `funcion`, los
+    valores no se acumulan aquí: se leen al exponer ({(valores de etiquetas): valor}).
+    """
+
+    tipo = "untyped"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), funcion=None):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.funcion = funcion
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def _clave(self, etiquetas):
+        try:
+            if len(etiquetas) == len(self.etiquetas):
+                return tuple([str(etiquetas[n]) for n in self.etiquetas])
+        except KeyError:
+            pass
+        raise ValueError(f"{self.nombre}: se esperaban las etiquetas {self.etiquetas}")
+
+    def valores(self):
+        if self.funcion is not None:
+            return {tuple(str(v) for v in clave): valor for clave, valor in self.funcion().items()}
+        with self._lock:
+            return dict(self._valores)
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+        for clave, valor in sorted(self.valores().items()):
+            lineas.append(f"{self.nombre}{_etiquetas_texto(self.etiquetas, clave)} {_numero(valor)}")
+        return lineas
+
+
+class Contador(Metrica):
+    tipo = "counter"
+
+    def inc(self, cantidad=1, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + cantidad
+
+
+class Medidor(Metrica):
+    tipo = "gauge"
+
+    def set(self, valor, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = valor
+
+
+class Histograma(Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(sorted(buckets))
+
+    def observar(self, valor, **etiquetas):
+        clave = self._clave(etiquetas)
+        # Conteo por bucket (no acumulado); el último es +Inf
+        indice = bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._valores.get(clave)
+            if serie is None:
+                serie = self._valores[clave] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+        with self._lock:
+            series = sorted((clave, (list(s[0]), s[1], s[2])) for clave, s in self._valores.items())
+        for clave, (conteos, suma, total) in series:
+            acumulado = 0
+            for limite, conteo in zip(self.buckets + (float("inf"),), conteos):
+                acumulado += conteo
+                le = _etiquetas_texto(self.etiquetas, clave, f'le="{_numero(limite)}"')
+                lineas.append(f"{self.nombre}_bucket{le} {acumulado}")
+            etiquetas = _etiquetas_texto(self.etiquetas, clave)
+            lineas.append(f"{self.nombre}_sum{etiquetas} {_numero(suma)}")
+            lineas.append(f"{self.nombre}_count{etiquetas} {total}")
+        return lineas
+
+
+class RegistroMetricas:
+    """
+    Métricas del proceso en formato de texto de Prometheus (GET /metrics).
+    Cada worker de uvicorn tiene su propio registro, como las demás cachés y estadísticas.
+    """
+
+    def __init__(self, prefijo):
+        self.prefijo = prefijo
+        self.metricas = {}
+        self._lock = threading.Lock()
+
+    def _registrar(self, clase, nombre, *args, **kwargs):
+        nombre = f"{self.prefijo}_{nombre}"
+        with self._lock:
+            if nombre not in self.metricas:
+                self.metricas[nombre] = clase(nombre, *args, **kwargs)
+            return self.metricas[nombre]
+
+    def contador(self, nombre, ayuda, etiquetas=(), funcion=None):
+        return self._registrar(Contador, nombre, ayuda, etiquetas, funcion)
+
+    def medidor(self, nombre, ayuda, etiquetas=(), funcion=None):
+        return self._registrar(Medidor, nombre, ayuda, etiquetas, funcion)
+
+    def histograma(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS):
+        return self._registrar(Histograma, nombre, ayuda, etiquetas, buckets)
+
+    def exponer(self):
+        lineas = []
+        for metrica in list(self.metricas.values()):
+            try:
+                lineas.extend(metrica.exponer())
+            except Exception:
+                # Un recolector con error no debe tumbar el resto de /metrics
+                logger.exception("Error exponiendo la métrica %s", metrica.nombre)
+        return "\n".join(lineas) + "\n"
+
+
+metricas = RegistroMetricas("quakepredict")
+
+DURACION_ETAPA = metricas.histograma(
+    "etapa_segundos", "Duración de cada etapa del cálculo del reporte", ("etapa",)
+)
+DURACION_PETICION = metricas.histograma(
+    "http_peticion_segundos", "Duración de las peticiones HTTP (hasta enviar la respuesta completa)",
+    ("metodo", "ruta", "codigo"),
+)
+
+
+# --- Etapas con tiempo y trazas ---
+
+_traza_actual = contextvars.ContextVar("traza_actual", default=None)
+
+
+class Traza:
+    """Etapas medidas dentro de una operación (una petición o un cálculo del reporte)."""
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.inicio = time.perf_counter()
+        self.etapas = []
+        self._lock = threading.Lock()
+
+    def agregar(self, etapa, segundos):
+        with self._lock:
+            self.etapas.append((etapa, segundos))
+
+    def duracion(self):
+        return time.perf_counter() - self.inicio
+
+    def resumen(self):
+        """Total y suma por etapa, en el orden en que aparecieron: 'x 812 ms: clima=640.1ms(1) ...'."""
+        totales = {}
+        with self._lock:
+            for etapa, segundos in self.etapas:
+                suma, veces = totales.get(etapa, (0.0, 0))
+                totales[etapa] = (suma + segundos, veces + 1)
+        detalle = " ".join(f"{etapa}={suma * 1000:.1f}ms({veces})" for etapa, (suma, veces) in totales.items())
+        return f"{self.nombre} {self.duracion() * 1000:.0f} ms: {detalle or 'sin etapas'}"
+
+
+@contextmanager
+def traza(nombre, umbral_ms=0.0, nivel=logging.INFO):
+    """
+    Junta las etapas medidas dentro del bloque (también en los hilos de
+    asyncio.to_thread, que copian el contexto). Al salir registra el resumen si
+    tardó al menos umbral_ms. Si ya hay una traza activa, las etapas van a esa.
+    """
+    actual = _traza_actual.get()
+    if actual is not None:
+        yield actual
+        return
+    nueva = Traza(nombre)
+    token = _traza_actual.set(nueva)
+    try:
+        yield nueva
+    finally:
+        _traza_actual.reset(token)
+        if nueva.duracion() * 1000 >= umbral_ms:
+            logger.log(nivel, nueva.resumen())
+
+
+@contextmanager
+def etapa(nombre):
+    """Mide el bloque: histograma etapa_segundos{etapa=nombre} y, si hay, la traza actual."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        segundos = time.perf_counter() - inicio
+        DURACION_ETAPA.observar(segundos, etapa=nombre)
+        actual = _traza_actual.get()
+        if actual is not None:
+            actual.agregar(nombre, segundos)
+        logger.debug("etapa=%s duracion_ms=%.2f", nombre, segundos * 1000)
+
+
+# --- Middleware ASGI ---
+
+class MiddlewareMetricas:
+    """
+    Duración de cada petición por ruta (la plantilla, p. ej. /unsubscribe/{city_id})
+    y traza de sus etapas: las peticiones más lentas que `lenta_ms` se registran
+    con el detalle. `perfilador` (opcional) decide si muestrear la petición.
+    """
+
+    def __init__(self, app, lenta_ms=1000.0, perfilador=None):
+        self.app = app
+        self.lenta_ms = lenta_ms
+        self.perfilador = perfilador
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        codigo = 500
+        perfil = self.perfilador.iniciar_si_pedido(scope) if self.perfilador is not None else None
+
+        async def enviar(mensaje):
+            nonlocal codigo
+            if mensaje["type"] == "http.response.start":
+                codigo = mensaje["status"]
+                if perfil is not None:
+                    mensaje = {**mensaje, "headers": [*mensaje.get("headers", []), perfil.cabecera()]}
+            await send(mensaje)
+
+        # Igual que traza(), sin el costo del context manager en cada petición
+        actual = Traza(f"{scope['method']} {scope['path']}")
+        token = _traza_actual.set(actual)
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _traza_actual.reset(token)
+            if perfil is not None:
+                # Espera al hilo de muestreo y escribe el archivo: fuera del event loop
+                await asyncio.to_thread(perfil.terminar)
+            duracion = actual.duracion()
+            if duracion * 1000 >= self.lenta_ms:
+                logger.warning(actual.resumen())
+            ruta = scope.get("route")
+            DURACION_PETICION.observar(
+                duracion, metodo=scope["method"], ruta=getattr(ruta, "path", "sin_ruta"), codigo=codigo,
+            )
@@ -0,0 +1,166 @@
+import asyncio
+import glob
+import logging
+import os
+import threading
+from datetime import datetime
+
+import xgboost as xgb
+from sqlalchemy.orm import Session
+
+from app import models
+from app.config import settings
+from services.tree_engine import EnsambleCompilado, ModeloNoSoportado
+
+logger = logging.getLogger(__name__)
+
+# Nombre de la versión que corresponde al modelo original (app/modelo_xgboost.json)
+VERSION_BASE = "base"
+
+
+class ModeloCargado:
+    """Un booster ya cargado en memoria junto con sus datos de versión."""
+
+    def __init__(self, version, ruta, booster):
+        self.version = version
+        self.ruta = ruta
+        self.booster = booster
+        self.feature_names = booster.feature_names or []
+        self.mtime = os.path.getmtime(ruta)
+        self.cargado_en = datetime.utcnow()
+        # Árboles en arreglos NumPy para lotes pequeños (None si el modelo no se puede compilar)
+        try:
+            self.compilado = EnsambleCompilado.desde_booster(booster)
+        except ModeloNoSoportado as e:
+            logger.warning("Modelo '%s' sin evaluador NumPy: %s", version, e)
+            self.compilado = None
+
+    def info(self):
+        return {
+            "version": self.version,
+            "archivo": os.path.basename(self.ruta),
+            "features": self.feature_names,
+            "evaluador_numpy": self.compilado is not None,
+            "cargado_en": self.cargado_en.isoformat(),
+        }
+
+
+class ModelRegistry:
+    """
+    Varias versiones del modelo cargadas a la vez.
+
+    - Versiones: el modelo base más cada `<version>.json` de settings.model_dir.
+    - Los archivos nuevos o modificados se detectan y cargan en segundo plano.
+    - `activo` se reemplaza con una sola asignación: las predicciones en curso
+      siguen con el booster que tomaron al empezar.
+    - La versión activa se guarda en la tabla model_activations, así todos los
+      workers terminan usando la misma y se puede volver a la anterior.
+    """
+
+    def __init__(self, ruta_base, directorio):
+        self.ruta_base = ruta_base
+        self.directorio = directorio
+        self.versiones = {}
+        self.activo = None
+        self._lock = threading.Lock()
+
+    def descubrir(self):
+        archivos = {}
+        if os.path.exists(self.ruta_base):
+            archivos[VERSION_BASE] = self.ruta_base
+        if self.directorio and os.path.isdir(self.directorio):
+            for ruta in sorted(glob.glob(os.path.join(self.directorio, "*.json"))):
+                archivos[os.path.splitext(os.path.basename(ruta))[0]] = ruta
+        return archivos
+
+    def cargar(self, version, ruta):
+        booster = xgb.Booster()
+        booster.load_model(ruta)
+        modelo = ModeloCargado(version, ruta, booster)
+        with self._lock:
+            self.versiones[version] = modelo
+            # Si se reemplazó el archivo de la versión activa, se activa el nuevo booster
+            if self.activo is not None and self.activo.version == version:
+                self.activo = modelo
+        return modelo
+
+    def sincronizar(self):
+        """Carga las versiones nuevas o cuyo archivo cambió. Devuelve las versiones cargadas."""
+        cargadas = []
+        for version, ruta in self.descubrir().items():
+            actual = self.versiones.get(version)
+            if actual is not None and actual.ruta == ruta and actual.mtime == os.path.getmtime(ruta):
+                continue
+            try:
+                self.cargar(version, ruta)
+                cargadas.append(version)
+                logger.info("Modelo '%s' cargado desde %s", version, ruta)
+            except Exception as e:
+                logger.exception("Error cargando el modelo '%s' (%s): %s", version, ruta, e)
+        return cargadas
+
+    def activar(self, version):
+        modelo = self.versiones.get(version)
+        if modelo is None:
+            raise KeyError(version)
+        self.activo = modelo
+        return modelo
+
+    def listar(self):
+        activo = self.activo.version if self.activo else None
+        return [
+            {**modelo.info(), "activo": modelo.version == activo}
+            for modelo in sorted(self.versiones.values(), key=lambda m: m.version)
+        ]
+
+    # --- Versión activa compartida (BD) ---
+
+    @staticmethod
+    def version_deseada(db: Session):
+        ultima = db.query(models.ModelActivation).order_by(models.ModelActivation.id.desc()).first()
+        return ultima.version if ultima else VERSION_BASE
+
+    def registrar_activacion(self, db: Session, version):
+        if version not in self.versiones:
+            raise KeyError(version)
+        db.add(models.ModelActivation(version=version))
+        db.commit()
+        return self.activar(version)
+
+    def version_anterior(self, db: Session):
+        """La versión activa inmediatamente antes de la actual (para rollback)."""
+        historial = db.query(models.ModelActivation.version).order_by(models.ModelActivation.id.desc()).all()
+        actual = historial[0][0] if historial else VERSION_BASE
+        for (version,) in historial[1:]:
+            if version != actual:
+                return version
+        return VERSION_BASE if actual != VERSION_BASE else None
+
+    def aplicar_version_deseada(self, db: Session):
+        """Activa la versión registrada en la BD si ya está cargada y no es la actual."""
+        version = self.version_deseada(db)
+        if self.activo is not None and self.activo.version == version:
+            return False
+        if version not in self.versiones:
+            logger.warning("La versión '%s' no está disponible en este worker.", version)
+            return False
+        self.activar(version)
+        logger.info("Modelo activo: '%s'", version)
+        return True
+
+    async def vigilar(self, sesion_factory):
+        """Revisa periódicamente archivos nuevos y la versión activa en la BD."""
+        while True:
+            await asyncio.sleep(settings.model_poll_seconds)
+            try:
+                await asyncio.to_thread(self._revisar, sesion_factory)
+            except Exception as e:
+                logger.exception("Error revisando modelos: %s", e)
+
+    def _revisar(self, sesion_factory):
+        self.sincronizar()
+        db = sesion_factory()
+        try:
+            self.aplicar_version_deseada(db)
+        finally:
+            db.close()
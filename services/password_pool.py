@@ -0,0 +1,141 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from app import auth
+from app.config import settings
+from services.metrics import metricas
+
+
+class PoolSaturado(Exception):
+    """No hay cupo en el pool de contraseñas (la petición debe responder 429)."""
+
+
+class TiempoAgotado(Exception):
+    """La operación tenía cupo pero no terminó a tiempo (la petición debe responder 503)."""
+
+
+def _pid(_):
+    return os.getpid()
+
+
+def _iniciar_proceso(prioridad):
+    # Menor prioridad que el servidor: con pocos núcleos, las peticiones normales
+    # siguen teniendo CPU aunque el pool esté ocupado
+    if prioridad and hasattr(os, "nice"):
+        os.nice(prioridad)
+
+
+class PoolContrasenas:
+    """
+    Hash y verificación de contraseñas (pbkdf2, costoso a propósito) en un pool
+    de procesos de tamaño fijo, fuera de los hilos que atienden peticiones.
+
+    - A lo sumo `max_pendientes` operaciones en curso o en cola; las demás se
+      rechazan en el acto con PoolSaturado, sin ocupar un hilo esperando.
+    - Si una operación con cupo no termina en `timeout` segundos, TiempoAgotado.
+    - Con procesos=0 se calcula en el mismo hilo (desarrollo).
+    """
+
+    def __init__(self, procesos, max_pendientes, timeout, prioridad=0):
+        self.procesos = procesos
+        self.prioridad = prioridad
+        self.max_pendientes = max_pendientes
+        self.timeout = timeout
+        self.rechazadas = 0
+        self.vencidas = 0
+        self.completadas = 0
+        self._cupos = threading.BoundedSemaphore(max_pendientes)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def iniciar(self):
+        with self._lock:
+            if self._executor is not None or self.procesos <= 0:
+                return
+            # spawn: los procesos no heredan los hilos ni conexiones del servidor
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.procesos,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_iniciar_proceso,
+                initargs=(self.prioridad,),
+            )
+            # Se levantan todos los procesos ahora y no en la primera petición
+            list(self._executor.map(_pid, range(self.procesos)))
+
+    def detener(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _ejecutar_async(self, funcion, *args):
+        """La petición espera el resultado sin ocupar un hilo."""
+        if self.procesos <= 0:
+            # Sin pool: en un hilo, para no bloquear el event loop
+            return await asyncio.to_thread(funcion, *args)
+        if not self._cupos.acquire(blocking=False):
+            self.rechazadas += 1
+            raise PoolSaturado()
+        try:
+            if self._executor is None:
+                await asyncio.to_thread(self.iniciar)
+            futuro = self._executor.submit(funcion, *args)
+        except BaseException as e:
+            self._cupos.release()
+            if isinstance(e, BrokenProcessPool):
+                self.detener()
+            raise
+        # El cupo se libera cuando el proceso termina (o se cancela la tarea en cola),
+        # no cuando la petición deja de esperar: si no, un timeout dejaría más
+        # trabajos en el pool que max_pendientes
+        futuro.add_done_callback(lambda _: self._cupos.release())
+        try:
+            # Al vencer el plazo, wait_for cancela el futuro: si seguía en cola no llega a ejecutarse
+            resultado = await asyncio.wait_for(asyncio.wrap_future(futuro), self.timeout)
+        except asyncio.TimeoutError:
+            # No es falta de cupo: el pool (o la máquina) está lento
+            self.vencidas += 1
+            raise TiempoAgotado()
+        except BrokenProcessPool:
+            # Un proceso murió: se descarta el pool y se crea otro en la próxima llamada
+            self.detener()
+            raise
+        self.completadas += 1
+        return resultado
+
+    async def hashear_async(self, password):
+        return await self._ejecutar_async(auth.get_password_hash, password)
+
+    async def verificar_async(self, password, password_hash):
+        return await self._ejecutar_async(auth.verify_password, password, password_hash)
+
+    def estadisticas(self):
+        return {
+            "procesos": self.procesos,
+            "max_pendientes": self.max_pendientes,
+            "completadas": self.completadas,
+            "rechazadas": self.rechazadas,
+            "vencidas": self.vencidas,
+        }
+
+
+password_pool = PoolContrasenas(
+    settings.password_pool_workers,
+    settings.password_pool_max_pending,
+    settings.password_pool_timeout_seconds,
+    settings.password_pool_nice,
+)
+
+metricas.contador(
+    "contrasenas_total",
+    "Operaciones del pool de contraseñas por resultado (rechazada = 429, vencida = 503)", ("resultado",),
+    funcion=lambda: {
+        ("completada",): password_pool.completadas,
+        ("rechazada",): password_pool.rechazadas,
+        ("vencida",): password_pool.vencidas,
+    },
+)
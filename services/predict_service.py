@@ -1,111 +1,541 @@
 import os
+import asyncio
+import contextvars
+import functools
+import logging
+import random
+import threading
+import time
+import uuid
+import warnings
+import numpy as np
 import pandas as pd
 import requests
-import xgboost as xgb 
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from sqlalchemy.orm import Session  
-from sqlalchemy import func         
-from datetime import date
+from sqlalchemy import func, and_, or_
+from sqlalchemy.exc import IntegrityError
+from datetime import date, datetime, timedelta
 from app import models              
+from app.config import settings
+from services.weather_cache import weather_cache
+from services.report_cache import reporte_materializado
+from services.history_service import actualizar_rollups
+from services.feature_store import feature_store
+from services.circuit_breaker import circuito_open_meteo, CircuitoAbierto
+from services.alert_service import generar_alertas
+from services.city_catalog import registro_cantones
+from services import fechas
+from app.database import SessionLocal, dialect_insert
+from services.model_registry import ModelRegistry, VERSION_BASE
+from services.metrics import metricas, etapa, traza
 
 # Ruta al modelo
 SERVICES_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.dirname(SERVICES_DIR)
 MODEL_PATH = os.path.join(PROJECT_ROOT, "app", "modelo_xgboost.json")
 
-print(f"Configuración de ruta del modelo: {MODEL_PATH}")
-
-# Lista de cantones 
-CANTONES_MUESTRA = [
-    # COSTA
-    {"canton": "Esmeraldas", "provincia": "Esmeraldas", "lat": 0.9682, "lon": -79.6517},
-    {"canton": "Atacames",   "provincia": "Esmeraldas", "lat": 0.8667, "lon": -79.8333},
-    {"canton": "Muisne",     "provincia": "Esmeraldas", "lat": 0.6000, "lon": -80.0167},
-    {"canton": "Pedernales", "provincia": "Manabí",     "lat": 0.0718, "lon": -80.0532},
-    {"canton": "Manta",      "provincia": "Manabí",     "lat": -0.9538, "lon": -80.7208},
-    {"canton": "Portoviejo", "provincia": "Manabí",     "lat": -1.0546, "lon": -80.4544},
-    {"canton": "Puerto López","provincia": "Manabí",    "lat": -1.5542, "lon": -80.8115},
-    {"canton": "Guayaquil",  "provincia": "Guayas",     "lat": -2.1709, "lon": -79.9223},
-    {"canton": "Salinas",    "provincia": "Santa Elena","lat": -2.2145, "lon": -80.9515},
-    {"canton": "Machala",    "provincia": "El Oro",     "lat": -3.2586, "lon": -79.9605},
-    
-    # SIERRA
-    {"canton": "Quito",      "provincia": "Pichincha",  "lat": -0.2299, "lon": -78.5249},
-    {"canton": "Latacunga",  "provincia": "Cotopaxi",   "lat": -0.9352, "lon": -78.6155},
-    {"canton": "Ambato",     "provincia": "Tungurahua", "lat": -1.2491, "lon": -78.6168},
-    {"canton": "Riobamba",   "provincia": "Chimborazo", "lat": -1.6635, "lon": -78.6546},
-    {"canton": "Cuenca",     "provincia": "Azuay",      "lat": -2.9001, "lon": -79.0059},
-    {"canton": "Tulcán",     "provincia": "Carchi",     "lat": 0.8119, "lon": -77.7173},
-    {"canton": "Loja",       "provincia": "Loja",       "lat": -3.9931, "lon": -79.2042},
-    
-    # ORIENTE
-    {"canton": "Puyo",       "provincia": "Pastaza",    "lat": -1.4924, "lon": -77.9992},
-    {"canton": "Tena",       "provincia": "Napo",       "lat": -0.9938, "lon": -77.8129},
-    {"canton": "Nueva Loja", "provincia": "Sucumbíos",  "lat": 0.0847,  "lon": -76.8828}
-]
+logger = logging.getLogger(__name__)
+logger.debug("Configuración de ruta del modelo: %s", MODEL_PATH)
+
+CLIMA_VARIABLES = ["precipitation_sum", "temperature_2m_mean", "pressure_msl_mean"]
+
+DURACION_OPEN_METEO = metricas.histograma(
+    "open_meteo_segundos", "Duración de cada consulta HTTP a Open-Meteo", ("modo",)
+)
+CONSULTAS_OPEN_METEO = metricas.contador(
+    "open_meteo_consultas_total", "Consultas HTTP a Open-Meteo por resultado", ("modo", "resultado")
+)
+DURACION_CLIMA_CANTON = metricas.histograma(
+    "clima_canton_segundos",
+    "Tiempo hasta obtener el clima de cada cantón (su consulta individual o el lote que lo trajo)",
+)
+REINTENTOS_OPEN_METEO = metricas.contador(
+    "open_meteo_reintentos_total", "Reintentos de consultas a Open-Meteo tras una falla transitoria", ("modo",)
+)
+FEATURES_ATRASADAS = metricas.contador(
+    "features_atrasadas_total", "Cantones calculados con las últimas features guardadas por falta de clima nuevo"
+)
+FILAS_INFERENCIA = metricas.contador(
+    "inferencia_filas_total", "Filas evaluadas por el modelo, por motor", ("motor",)
+)
+
+
+def es_falla_transitoria(error):
+    """Errores de Open-Meteo que vale la pena reintentar (y que cuentan para el circuito)."""
+    if isinstance(error, (requests.Timeout, requests.ConnectionError)):
+        return True
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return False
+
+
+def espera_reintento(intento, error=None):
+    """
+    Backoff exponencial con jitter completo: uniforme entre 0 y base * 2^(intento-1),
+    con tope en weather_backoff_max_seconds. Si la respuesta trae Retry-After, se espera al menos eso.
+    """
+    tope = min(settings.weather_backoff_max_seconds, settings.weather_backoff_base_seconds * 2 ** (intento - 1))
+    espera = random.uniform(0, tope)
+    respuesta = getattr(error, "response", None)
+    if respuesta is not None:
+        try:
+            espera = max(espera, float(respuesta.headers.get("Retry-After", 0)))
+        except ValueError:
+            pass  # Retry-After como fecha HTTP: se usa el backoff
+    return espera
+
+
+def crear_sesion_http(pool_size):
+    """Sesión HTTP compartida: reutiliza conexiones keep-alive (evita un TLS por consulta)."""
+    sesion = requests.Session()
+    adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    sesion.mount("https://", adaptador)
+    sesion.mount("http://", adaptador)
+    return sesion
+
+
+http_session = crear_sesion_http(settings.weather_max_concurrency)
+
+# Hilos propios para las consultas de clima: el executor por defecto de asyncio.to_thread
+# tiene un tope (min(32, cpus + 4)) que puede quedar por debajo de weather_max_concurrency
+hilos_clima = ThreadPoolExecutor(max_workers=settings.weather_max_concurrency, thread_name_prefix="clima")
+
+
+async def en_hilo_clima(funcion, *args):
+    """Como asyncio.to_thread, pero en hilos_clima (también copia los contextvars: traza y etapas)."""
+    contexto = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(hilos_clima, functools.partial(contexto.run, funcion, *args))
+
 
 class SismoService:
-    def __init__(self):
-        self.model = None
-        self.feature_names = []
-        self.load_model()
+    def __init__(self, cargar_modelo=True):
+        self.registro = ModelRegistry(MODEL_PATH, settings.model_dir)
+        if cargar_modelo:
+            self.load_model()
+
+    @property
+    def model(self):
+        activo = self.registro.activo
+        return activo.booster if activo else None
+
+    @property
+    def feature_names(self):
+        activo = self.registro.activo
+        return activo.feature_names if activo else []
+
+    @property
+    def version_modelo(self):
+        activo = self.registro.activo
+        return activo.version if activo else None
 
     def load_model(self):
+        """Carga todas las versiones disponibles y activa la base (o la primera que haya)."""
         if not os.path.exists(MODEL_PATH):
-            print(f"ERROR: No existe el archivo en {MODEL_PATH}")
-            return
+            logger.error("No existe el archivo del modelo en %s", MODEL_PATH)
 
-        print("Cargando motor XGBoost...")
-        try:
-            self.model = xgb.Booster()
-            self.model.load_model(MODEL_PATH)
-            self.feature_names = self.model.feature_names
-            print("Modelo cargado exitosamente.")
-            
-        except Exception as e:
-            print(f"Error cargando el JSON del modelo: {e}")
+        logger.info("Cargando motor XGBoost...")
+        self.registro.sincronizar()
+        if self.registro.activo is None and self.registro.versiones:
+            version = VERSION_BASE if VERSION_BASE in self.registro.versiones else min(self.registro.versiones)
+            self.registro.activar(version)
+            logger.info("Modelo cargado exitosamente.")
 
-    def generar_mapa_riesgo(self):
-        if not self.model:
+    def generar_mapa_riesgo(self, cantones=None):
+        # Se toma el modelo activo una sola vez: si se cambia de versión a mitad
+        # del cálculo, este mapa se termina con la versión con la que empezó
+        activo = self.registro.activo
+        if not activo:
             return {"error": "El modelo no está disponible."}
 
+        # Etapas 1 y 2: clima y features de todos los cantones (tabla cities) o de los indicados
+        if cantones is None:
+            cantones = registro_cantones.obtener().cantones()
+        if settings.feature_store_enabled:
+            features = self.features_incrementales(cantones, activo.feature_names)
+        else:
+            features = self.features_desde_clima(cantones, activo.feature_names)
+
+        # Fecha del último día de clima de cada cantón (anterior a hoy si se usaron features atrasadas)
+        hoy = fechas.hoy()
+        fechas_clima = {
+            item['canton']: (feature_store.ultimo_dia(item['canton']) if settings.feature_store_enabled else hoy)
+            for item in cantones
+        }
+
+        # Se arma una sola matriz con los cantones que tienen features
+        validos = []
+        filas = []
+        for item in cantones:
+            vector = features[item['canton']]
+            if isinstance(vector, Exception):
+                logger.warning("Error procesando %s: %s", item['canton'], vector)
+                continue
+            filas.append(vector)
+            validos.append(item)
+
+        if not filas:
+            return []
+
+        # Etapa 3: una sola inferencia para todos los cantones
+        with etapa("matriz"):
+            matriz = np.vstack(filas)
+        with etapa("inferencia"):
+            probabilidades = self.predecir_lote(matriz, activo)
+
         resultados = []
+        for item, probabilidad in zip(validos, probabilidades):
+            probabilidad = float(probabilidad)
+            nivel, color = self.calcular_semaforo(probabilidad)
+            fecha_clima = fechas_clima[item['canton']] or hoy
 
-        for item in CANTONES_MUESTRA:
-            try:
-                datos_clima = self.consultar_open_meteo(item['lat'], item['lon'])
-                df_input = self.preparar_datos(item, datos_clima)
-                
-                dmatrix_data = xgb.DMatrix(df_input)
-                
-                probabilidad = float(self.model.predict(dmatrix_data)[0])
-                
-                nivel, color = self.calcular_semaforo(probabilidad)
-
-                resultados.append({
-                    "canton": item['canton'],
-                    "lat": item['lat'],
-                    "lon": item['lon'],
-                    "probabilidad": round(probabilidad, 4),
-                    "nivel_riesgo": nivel,
-                    "color": color
+            resultados.append({
+                "canton": item['canton'],
+                "lat": item['lat'],
+                "lon": item['lon'],
+                "probabilidad": round(probabilidad, 4),
+                "nivel_riesgo": nivel,
+                "color": color,
+                "version_modelo": activo.version,
+                "fecha_clima": fecha_clima,
+                "datos_atrasados": fecha_clima < hoy,
+            })
+
+        return resultados
+
+    def features_desde_clima(self, cantones, feature_names=None):
+        """Pide la ventana completa de 30 días y calcula las features de cada cantón."""
+        climas = self.consultar_clima_cantones(cantones)
+        features = {}
+        with etapa("features"):
+            for item in cantones:
+                try:
+                    datos_clima = climas[item['canton']]
+                    if isinstance(datos_clima, Exception):
+                        raise datos_clima
+                    features[item['canton']] = self.calcular_features(item, datos_clima, feature_names)
+                except Exception as e:
+                    features[item['canton']] = e
+        return features
+
+    def features_incrementales(self, cantones, feature_names=None):
+        """
+        Features desde el almacén incremental: solo se piden a Open-Meteo los días
+        que faltan en cada cantón y las ventanas se actualizan en O(1) por día.
+        """
+        hoy = fechas.hoy()
+        db = SessionLocal()
+        try:
+            with etapa("feature_store_carga"):
+                feature_store.cargar(db, cantones, hoy)
+
+            # Agrupamos por cantidad de días faltantes para pedirlos en lote
+            grupos = {}
+            for item in cantones:
+                dias = feature_store.dias_a_pedir(item['canton'], hoy)
+                if dias:
+                    grupos.setdefault(dias, []).append(item)
+
+            errores = {}
+            for past_days, grupo in grupos.items():
+                climas = self.consultar_clima_cantones(grupo, past_days=past_days)
+                with etapa("feature_store_registro"):
+                    for item in grupo:
+                        datos_clima = climas[item['canton']]
+                        try:
+                            if isinstance(datos_clima, Exception):
+                                raise datos_clima
+                            feature_store.registrar(db, item['canton'], datos_clima)
+                        except Exception as e:
+                            errores[item['canton']] = e
+            with etapa("feature_store_commit"):
+                db.commit()
+        finally:
+            db.close()
+
+        features = {}
+        atrasados = 0
+        with etapa("features"):
+            for item in cantones:
+                try:
+                    if item['canton'] in errores:
+                        self.usar_features_atrasadas(item['canton'], errores[item['canton']], hoy)
+                        atrasados += 1
+                    features[item['canton']] = feature_store.vector(item, feature_names or self.feature_names)
+                except Exception as e:
+                    features[item['canton']] = e
+        if atrasados:
+            FEATURES_ATRASADAS.inc(atrasados)
+            logger.warning("%d cantones sin clima nuevo (%s): se usan sus últimas features guardadas",
+                           atrasados, next(iter(errores.values())))
+        return features
+
+    def usar_features_atrasadas(self, canton, error, hoy):
+        """
+        Sin clima nuevo para el cantón: se siguen usando sus últimas features
+        guardadas si no tienen más de weather_stale_max_days días (la respuesta
+        lo marca con datos_atrasados). Si no hay, se relanza el error.
+        """
+        ultimo = feature_store.ultimo_dia(canton)
+        if ultimo is None or (hoy - ultimo).days > settings.weather_stale_max_days:
+            raise error
+
+    def predecir_lote(self, matriz, activo=None, motor=None):
+        """
+        Probabilidades para una matriz (n_cantones x n_features) cuyas columnas
+        siguen el orden de self.feature_names. Una sola llamada al booster, o al
+        evaluador NumPy para lotes pequeños (ver settings.inference_engine).
+        """
+        activo = activo or self.registro.activo
+        matriz = np.asarray(matriz, dtype=np.float32)
+        motor = motor or settings.inference_engine
+        if motor == "auto":
+            motor = "numpy" if matriz.shape[0] <= settings.numpy_engine_max_rows else "xgboost"
+        if motor == "numpy" and activo.compilado is not None:
+            FILAS_INFERENCIA.inc(matriz.shape[0], motor="numpy")
+            return activo.compilado.predecir(matriz)
+        FILAS_INFERENCIA.inc(matriz.shape[0], motor="xgboost")
+        return activo.booster.inplace_predict(matriz)
+
+    def consultar_clima_cantones(self, cantones, modo=None, past_days=30):
+        """
+        Devuelve {canton: json de Open-Meteo} para cada cantón.
+        Si la consulta de un cantón falla, su valor es la excepción (no se corta el resto).
+        Primero se busca en la caché; solo los faltantes se piden a Open-Meteo.
+        """
+        if weather_cache is None:
+            with etapa("clima_red"):
+                return self.consultar_clima_red(cantones, modo, past_days)
+
+        variables = CLIMA_VARIABLES if past_days == 30 else CLIMA_VARIABLES + [f"past_days={past_days}"]
+        claves = {
+            item['canton']: weather_cache.clave(item['lat'], item['lon'], variables)
+            for item in cantones
+        }
+        with etapa("clima_cache"):
+            en_cache = weather_cache.obtener_varios(list(claves.values()))
+
+        climas = {}
+        pendientes = []
+        for item in cantones:
+            clave = claves[item['canton']]
+            if clave in en_cache:
+                climas[item['canton']] = en_cache[clave]
+            else:
+                pendientes.append(item)
+
+        if pendientes:
+            with etapa("clima_red"):
+                nuevos = self.consultar_clima_red(pendientes, modo, past_days)
+            climas.update(nuevos)
+            with etapa("clima_cache"):
+                weather_cache.guardar_varios({
+                    claves[canton]: datos for canton, datos in nuevos.items()
+                    if not isinstance(datos, Exception)
                 })
-                
+
+        return climas
+
+    def consultar_clima_red(self, cantones, modo=None, past_days=30):
+        modo = modo or settings.weather_fetch_mode
+
+        if modo in ("async", "lotes"):
+            consulta = (
+                self.consultar_clima_lotes(cantones, past_days=past_days) if modo == "lotes"
+                else self.consultar_clima_async(cantones, past_days=past_days)
+            )
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                return asyncio.run(consulta)
+            consulta.close()
+            # Ya hay un event loop en este hilo: no se puede anidar asyncio.run
+            logger.warning("Event loop activo, usando consulta secuencial.")
+
+        return self.consultar_clima_secuencial(cantones, past_days)
+
+    def consultar_clima_secuencial(self, cantones, past_days=30):
+        climas = {}
+        for item in cantones:
+            try:
+                climas[item['canton']] = self.consultar_open_meteo(item['lat'], item['lon'], past_days)
             except Exception as e:
-                print(f"Error procesando {item['canton']}: {e}")
+                climas[item['canton']] = e
+        return climas
+
+    async def consultar_clima_async(self, cantones, max_concurrencia=None, past_days=30):
+        # Limitamos cuántas consultas van en paralelo contra Open-Meteo
+        semaforo = asyncio.Semaphore(max_concurrencia or settings.weather_max_concurrency)
+
+        async def consultar(item):
+            async with semaforo:
+                return await en_hilo_clima(self.consultar_open_meteo, item['lat'], item['lon'], past_days)
+
+        respuestas = await asyncio.gather(
+            *(consultar(item) for item in cantones), return_exceptions=True
+        )
+        return {item['canton']: resp for item, resp in zip(cantones, respuestas)}
+
+    async def consultar_clima_lotes(self, cantones, tam_lote=None, max_concurrencia=None, past_days=30):
+        """
+        Agrupa los cantones en lotes y hace una sola consulta por lote
+        (Open-Meteo acepta listas de latitudes/longitudes separadas por coma).
+        Si un lote completo falla, sus cantones se consultan uno por uno, salvo que
+        la falla sea de Open-Meteo (ya reintentada) o el circuito esté abierto:
+        consultarlos por separado solo alargaría la espera.
+        """
+        tam_lote = tam_lote or settings.weather_batch_size
+        semaforo = asyncio.Semaphore(max_concurrencia or settings.weather_max_concurrency)
+        lotes = [cantones[i:i + tam_lote] for i in range(0, len(cantones), tam_lote)]
+
+        async def consultar_individual(item):
+            async with semaforo:
+                return await en_hilo_clima(self.consultar_open_meteo, item['lat'], item['lon'], past_days)
+
+        async def consultar_lote(lote):
+            async with semaforo:
+                try:
+                    coords = [(item['lat'], item['lon']) for item in lote]
+                    return await en_hilo_clima(self.consultar_open_meteo_lote, coords, past_days)
+                except Exception as e:
+                    if isinstance(e, CircuitoAbierto) or es_falla_transitoria(e):
+                        logger.warning("Falló el lote de %d cantones: %s", len(lote), e)
+                        return [e] * len(lote)
+                    logger.warning("Falló el lote de %d cantones (%s), consultando por separado.", len(lote), e)
+                    return None
+
+        climas = {}
+        respuestas_lotes = await asyncio.gather(*(consultar_lote(lote) for lote in lotes))
+
+        pendientes = []
+        for lote, respuestas in zip(lotes, respuestas_lotes):
+            if respuestas is None:
+                pendientes.extend(lote)
                 continue
-        
-        return resultados
+            for item, resp in zip(lote, respuestas):
+                climas[item['canton']] = resp
 
-    def consultar_open_meteo(self, lat, lon):
-        url = "https://api.open-meteo.com/v1/forecast"
-        params = {
+        if pendientes:
+            individuales = await asyncio.gather(
+                *(consultar_individual(item) for item in pendientes), return_exceptions=True
+            )
+            for item, resp in zip(pendientes, individuales):
+                climas[item['canton']] = resp
+
+        return climas
+
+    def parametros_clima(self, lat, lon, past_days=30):
+        return {
             "latitude": lat, "longitude": lon,
-            "daily": ["precipitation_sum", "temperature_2m_mean", "pressure_msl_mean"],
-            "timezone": "auto", "past_days": 30, "forecast_days": 1
+            "daily": CLIMA_VARIABLES,
+            "timezone": "auto", "past_days": past_days, "forecast_days": 1
+        }
+
+    def get_open_meteo(self, modo, ubicaciones, params, url=None):
+        """
+        GET a Open-Meteo con reintentos acotados: las fallas transitorias
+        (timeout, conexión, 429, 5xx) se reintentan con backoff exponencial y
+        jitter hasta weather_max_attempts intentos o weather_retry_deadline_seconds
+        en total. Con el circuito abierto falla en el acto (CircuitoAbierto).
+        `url` permite consultar otra API de Open-Meteo (p. ej. la de históricos).
+        """
+        limite = time.monotonic() + settings.weather_retry_deadline_seconds
+        intento = 1
+        while True:
+            circuito_open_meteo.permitir()
+            try:
+                # El último intento no puede pasarse del plazo total
+                lectura = min(settings.weather_read_timeout, max(limite - time.monotonic(), 0.1))
+                datos = self._get_open_meteo(modo, ubicaciones, params, lectura, url or settings.open_meteo_url)
+            except Exception as e:
+                if not es_falla_transitoria(e):
+                    # Open-Meteo respondió: para el circuito cuenta como disponible
+                    circuito_open_meteo.exito()
+                    raise
+                circuito_open_meteo.falla()
+                espera = espera_reintento(intento, e)
+                if intento >= settings.weather_max_attempts or time.monotonic() + espera >= limite:
+                    raise
+                REINTENTOS_OPEN_METEO.inc(modo=modo)
+                logger.info("Open-Meteo falló (%s, intento %d), reintentando en %.2fs", e, intento, espera)
+                time.sleep(espera)
+                intento += 1
+            else:
+                circuito_open_meteo.exito()
+                return datos
+
+    def _get_open_meteo(self, modo, ubicaciones, params, lectura, url):
+        """Un intento, con métricas: duración por consulta y por cantón, y resultado."""
+        inicio = time.perf_counter()
+        resultado = "error"
+        try:
+            resp = http_session.get(
+                url, params=params,
+                timeout=(settings.weather_connect_timeout, lectura)
+            )
+            resultado = str(resp.status_code)
+            resp.raise_for_status()
+            datos = resp.json()
+            resultado = "ok"
+            return datos
+        except requests.Timeout:
+            resultado = "timeout"
+            raise
+        finally:
+            segundos = time.perf_counter() - inicio
+            DURACION_OPEN_METEO.observar(segundos, modo=modo)
+            CONSULTAS_OPEN_METEO.inc(modo=modo, resultado=resultado)
+            for _ in range(ubicaciones):
+                DURACION_CLIMA_CANTON.observar(segundos)
+            logger.debug("open_meteo modo=%s ubicaciones=%d resultado=%s duracion_ms=%.1f",
+                         modo, ubicaciones, resultado, segundos * 1000)
+
+    def consultar_open_meteo(self, lat, lon, past_days=30):
+        return self.get_open_meteo("individual", 1, self.parametros_clima(lat, lon, past_days))
+
+    def consultar_open_meteo_lote(self, coords, past_days=30):
+        """
+        Una sola consulta para varias coordenadas [(lat, lon), ...].
+        Devuelve una lista alineada con coords; si una ubicación viene sin datos
+        diarios, en su posición queda una excepción en lugar del json.
+        """
+        lats = ",".join(str(lat) for lat, _ in coords)
+        lons = ",".join(str(lon) for _, lon in coords)
+        data = self.get_open_meteo("lote", len(coords), self.parametros_clima(lats, lons, past_days))
+        return self.separar_ubicaciones(data, coords)
+
+    def consultar_archivo_lote(self, coords, inicio, fin):
+        """
+        Clima diario histórico de varias coordenadas entre dos fechas (API de
+        archivo de Open-Meteo), en una sola consulta. Mismo formato que consultar_open_meteo_lote.
+        """
+        params = {
+            "latitude": ",".join(str(lat) for lat, _ in coords),
+            "longitude": ",".join(str(lon) for _, lon in coords),
+            "daily": CLIMA_VARIABLES, "timezone": "auto",
+            "start_date": inicio.isoformat(), "end_date": fin.isoformat(),
         }
-        resp = requests.get(url, params=params)
-        resp.raise_for_status()
-        return resp.json()
+        data = self.get_open_meteo("archivo", len(coords), params, url=settings.open_meteo_archive_url)
+        return self.separar_ubicaciones(data, coords)
+
+    def separar_ubicaciones(self, data, coords):
+        """Respuesta de una consulta con varias coordenadas -> lista alineada con coords."""
+        # Con una sola coordenada Open-Meteo devuelve un objeto, no una lista
+        if isinstance(data, dict):
+            data = [data]
+        if len(data) != len(coords):
+            raise ValueError(f"Se esperaban {len(coords)} ubicaciones y llegaron {len(data)}")
+
+        resultados = []
+        for ubicacion in data:
+            if not isinstance(ubicacion, dict) or ubicacion.get("error") or "daily" not in ubicacion:
+                motivo = ubicacion.get("reason") if isinstance(ubicacion, dict) else None
+                resultados.append(ValueError(f"Ubicación sin datos diarios: {motivo}"))
+            else:
+                resultados.append(ubicacion)
+        return resultados
 
     def preparar_datos(self, ubicacion, data_json):
         daily = pd.DataFrame(data_json['daily'])
@@ -129,77 +559,416 @@ class SismoService:
             
         return df
 
+    def calcular_features(self, ubicacion, data_json, feature_names=None):
+        """
+        Igual que preparar_datos pero con NumPy: devuelve un vector float32
+        en el orden de self.feature_names, listo para apilar en una matriz.
+        """
+        daily = data_json['daily']
+        precip = np.asarray(daily['precipitation_sum'], dtype=np.float64)[-31:]
+        temp = np.asarray(daily['temperature_2m_mean'], dtype=np.float64)[-31:]
+        pres = np.asarray(daily['pressure_msl_mean'], dtype=np.float64)[-31:]
+
+        # Mismas reglas que pandas: se ignoran los NaN y la std es muestral (ddof=1)
+        input_dict = {
+            'latitud': ubicacion['lat'],
+            'longitud': ubicacion['lon'],
+            'precip_sum': np.nansum(precip),
+            'temp_mean': np.nanmean(temp),
+            'temp_std': np.nanstd(temp, ddof=1),
+            'pres_mean': np.nanmean(pres),
+            'pres_delta': pres[-1] - pres[0]
+        }
+
+        nombres = feature_names or self.feature_names or list(input_dict)
+        return np.array([input_dict[n] for n in nombres], dtype=np.float32)
+
+    def calcular_features_por_dia(self, ubicacion, data_json, feature_names=None):
+        """
+        Features de cada día de una serie histórica larga, de una sola vez: la
+        fila de un día usa la ventana de 31 días que termina en él (igual que
+        calcular_features). Devuelve (fechas, matriz float32); los primeros 30
+        días de la serie solo sirven de ventana y los días sin ningún dato se omiten.
+        """
+        daily = data_json['daily']
+        fechas = np.array([date.fromisoformat(d) for d in daily['time']])
+        series = [
+            np.asarray(daily[variable], dtype=np.float64)
+            for variable in ("precipitation_sum", "temperature_2m_mean", "pressure_msl_mean")
+        ]
+        if len(fechas) < 31:
+            return fechas[:0], np.empty((0, len(feature_names or self.feature_names)), dtype=np.float32)
+        precip, temp, pres = (np.lib.stride_tricks.sliding_window_view(x, 31) for x in series)
+
+        with warnings.catch_warnings():
+            # Ventanas sin datos: NaN, como en pandas (sin el aviso de NumPy)
+            warnings.simplefilter("ignore", RuntimeWarning)
+            columnas = {
+                'latitud': np.full(len(precip), ubicacion['lat']),
+                'longitud': np.full(len(precip), ubicacion['lon']),
+                'precip_sum': np.nansum(precip, axis=1),
+                'temp_mean': np.nanmean(temp, axis=1),
+                'temp_std': np.nanstd(temp, axis=1, ddof=1),
+                'pres_mean': np.nanmean(pres, axis=1),
+                'pres_delta': pres[:, -1] - pres[:, 0],
+            }
+        nombres = feature_names or self.feature_names or list(columnas)
+        matriz = np.column_stack([columnas[n] for n in nombres]).astype(np.float32)
+
+        con_datos = ~np.all(np.isnan(np.column_stack([x[30:] for x in series])), axis=1)
+        return fechas[30:][con_datos], matriz[con_datos]
+
     def calcular_semaforo(self, prob):
         if prob < 0.30: return "BAJO", "#28a745"
         if prob < 0.70: return "MODERADO", "#ffc107"
         return "ALTO", "#dc3545"
 
-sismo_service = SismoService()
+# El modelo se carga al iniciar la aplicación (lifespan), no al importar el módulo
+sismo_service = SismoService(cargar_modelo=False)
 
 
-def obtener_reporte_con_historial(db: Session):
-    fecha_hoy = date.today()
-    print(f"Consultando historial para: {fecha_hoy}")
+# Un solo cálculo diario por proceso (los demás hilos esperan este lock)
+_lock_calculo_diario = threading.Lock()
 
-    # 1. Buscar en BD
-    registros_hoy = db.query(models.PredictionReport).filter(
-        func.date(models.PredictionReport.created_at) == fecha_hoy
+
+def buscar_registros_del_dia(db: Session, fecha):
+    return db.query(models.PredictionReport).filter(
+        models.PredictionReport.report_date == fecha
     ).all()
 
-    # 2. ESCENARIO A: YA EXISTEN (Retornar desde BD)
-    if registros_hoy:
-        print(f"Se encontraron {len(registros_hoy)} registros en BD.")
+
+def reconstruir_respuesta(registros):
+    # Reconstruir la respuesta para el frontend (agregando lat/lon/color)
+    resultados_reconstruidos = []
+    
+    # Registro de cantones para buscar lat/lon por nombre
+    indice = registro_cantones.obtener()
+    
+    for reporte in registros:
+        # Recuperar datos estáticos del mapa
+        info_geo = indice.buscar(reporte.location) or {"lat": 0, "lon": 0}
         
-        # Reconstruir la respuesta para el frontend (agregando lat/lon/color)
-        resultados_reconstruidos = []
+        # Recalcular color (es lógica visual, no se guarda en BD para ahorrar espacio)
+        _, color = sismo_service.calcular_semaforo(reporte.probability)
         
-        # Crear un mapa rápido de cantones para buscar lat/lon por nombre
-        mapa_cantones = {c['canton']: c for c in CANTONES_MUESTRA}
+        resultados_reconstruidos.append({
+            "canton": reporte.location,
+            "lat": info_geo["lat"],
+            "lon": info_geo["lon"],
+            "probabilidad": reporte.probability,
+            "nivel_riesgo": reporte.risk_level,
+            "color": color,
+            "version_modelo": reporte.model_version,
+            # Reportes anteriores a la columna weather_date: se asumen al día
+            "fecha_clima": reporte.weather_date or reporte.report_date,
+            "datos_atrasados": reporte.weather_date is not None and reporte.weather_date < reporte.report_date,
+            "fecha": reporte.created_at # Opcional
+        })
         
-        for reporte in registros_hoy:
-            # Recuperar datos estáticos del mapa
-            info_geo = mapa_cantones.get(reporte.location, {"lat": 0, "lon": 0})
-            
-            # Recalcular color (es lógica visual, no se guarda en BD para ahorrar espacio)
-            _, color = sismo_service.calcular_semaforo(reporte.probability)
-            
-            resultados_reconstruidos.append({
-                "canton": reporte.location,
-                "lat": info_geo["lat"],
-                "lon": info_geo["lon"],
-                "probabilidad": reporte.probability,
-                "nivel_riesgo": reporte.risk_level,
-                "color": color,
-                "fecha": reporte.created_at # Opcional
-            })
-            
-        return resultados_reconstruidos
+    return resultados_reconstruidos
+
+
+def reclamar_calculo_diario(db: Session, fecha, forzar=False):
+    """
+    Intenta quedarse con el cálculo del día entre todos los procesos.
+    Gana quien inserta la fila de DailyReportRun (clave primaria = fecha).
+    Si la marca existente falló o quedó abandonada, se puede retomar; con forzar
+    también una marca "listo" (para recalcular un reporte ya guardado).
+    Devuelve el token del reclamo (lo pide finalizar_calculo_diario) o None.
+    """
+    ahora = datetime.utcnow()
+    token = uuid.uuid4().hex
+    try:
+        db.add(models.DailyReportRun(report_date=fecha, status="calculando", started_at=ahora, token=token))
+        db.commit()
+        return token
+    except IntegrityError:
+        db.rollback()
+
+    # UPDATE condicional: es atómico, solo un proceso puede retomar la marca
+    limite = ahora - timedelta(seconds=settings.report_lock_timeout_seconds)
+    condiciones = [
+        models.DailyReportRun.status == "error",
+        and_(
+            models.DailyReportRun.status == "calculando",
+            models.DailyReportRun.started_at < limite,
+        ),
+    ]
+    if forzar:
+        condiciones.append(models.DailyReportRun.status == "listo")
+    retomadas = db.query(models.DailyReportRun).filter(
+        models.DailyReportRun.report_date == fecha,
+        or_(*condiciones),
+    ).update({"status": "calculando", "started_at": ahora, "token": token}, synchronize_session=False)
+    db.commit()
+    return token if retomadas == 1 else None
+
+
+def esperar_calculo_diario(db: Session, fecha):
+    """Espera a que otro proceso termine el cálculo del día. Devuelve sus registros o None."""
+    limite = time.monotonic() + settings.report_lock_timeout_seconds
+    while time.monotonic() < limite:
+        # Cerrar la transacción (para ver lo que confirmaron los demás) y no retener
+        # una conexión del pool mientras se espera
+        db.rollback()
+        time.sleep(settings.report_wait_poll_seconds)
+
+        registros = buscar_registros_del_dia(db, fecha)
+        if registros:
+            return registros
+
+        marca = db.get(models.DailyReportRun, fecha)
+        if marca is None or marca.status != "calculando":
+            return None
+    return None
+
 
-    # 3. ESCENARIO B: NO EXISTEN (Calcular y Guardar)
-    print("No hay registros de hoy. Iniciando cálculo con XGBoost...")
+def finalizar_calculo_diario(db: Session, fecha, token, status):
+    """
+    Cierra la marca solo si el reclamo sigue siendo de quien la cierra: si otro proceso
+    la retomó (por darla por abandonada), no se pisa su estado. Devuelve si se cerró.
+    """
+    cerradas = db.query(models.DailyReportRun).filter(
+        models.DailyReportRun.report_date == fecha,
+        models.DailyReportRun.token == token,
+    ).update({"status": status, "finished_at": datetime.utcnow()}, synchronize_session=False)
+    return cerradas == 1
+
+
+def calcular_y_guardar(db: Session, fecha, token, reemplazar=False):
+    # Traza propia en el programador; en una petición, las etapas van a la traza de la petición
+    with traza(f"reporte {fecha.isoformat()}"):
+        return _calcular_y_guardar(db, fecha, token, reemplazar)
+
+
+def _calcular_y_guardar(db: Session, fecha, token, reemplazar):
+    logger.info("Iniciando cálculo del reporte de %s con XGBoost...", fecha)
     
     # Calcular usando la clase existente
-    nuevas_predicciones = sismo_service.generar_mapa_riesgo()
+    with etapa("mapa"):
+        nuevas_predicciones = sismo_service.generar_mapa_riesgo()
     
     # Verificar si hubo error en el cálculo
-    if isinstance(nuevas_predicciones, list) and len(nuevas_predicciones) > 0 and "error" in nuevas_predicciones[0]:
-         print("Error en cálculo, no se guardará en BD.")
-         return nuevas_predicciones
+    if isinstance(nuevas_predicciones, dict) or not nuevas_predicciones:
+        logger.error("Error en cálculo, no se guardará en BD.")
+        finalizar_calculo_diario(db, fecha, token, "error")
+        db.commit()
+        return nuevas_predicciones
 
-    # Guardar en Postgres
+    # Guardar en Postgres (los registros y la marca "listo" en la misma transacción)
     try:
-        for item in nuevas_predicciones:
-            nuevo_registro = models.PredictionReport(
-                location=item['canton'],
-                probability=item['probabilidad'],
-                risk_level=item['nivel_riesgo']
-            )
-            db.add(nuevo_registro)
+        with etapa("bd_insercion"):
+            if reemplazar:
+                # El reporte anterior se sigue leyendo hasta el commit
+                db.query(models.PredictionReport).filter(
+                    models.PredictionReport.report_date == fecha
+                ).delete(synchronize_session=False)
+            for item in nuevas_predicciones:
+                nuevo_registro = models.PredictionReport(
+                    location=item['canton'],
+                    probability=item['probabilidad'],
+                    risk_level=item['nivel_riesgo'],
+                    report_date=fecha,
+                    model_version=item.get('version_modelo'),
+                    weather_date=item.get('fecha_clima')
+                )
+                db.add(nuevo_registro)
+            db.flush()
         
-        db.commit()
-        print("Nuevas predicciones guardadas exitosamente en la base Postgres.")
+        # Resúmenes semanal/mensual en la misma transacción
+        with etapa("rollups"):
+            actualizar_rollups(db, fecha)
+
+        if not finalizar_calculo_diario(db, fecha, token, "listo"):
+            logger.warning("Otro proceso retomó el cálculo de %s; este resultado no se guarda.", fecha)
+            db.rollback()
+            return nuevas_predicciones
+        with etapa("bd_commit"):
+            db.commit()
+        reporte_materializado.invalidar()
+        logger.info("Nuevas predicciones guardadas exitosamente en la base de datos.")
     except Exception as e:
-        print(f"Error guardando en BD: {e}")
+        logger.exception("Error guardando en BD: %s", e)
         db.rollback()
+        finalizar_calculo_diario(db, fecha, token, "error")
+        db.commit()
+        return nuevas_predicciones
+
+    # Alertas para los suscriptores de cantones en riesgo ALTO (no afecta al reporte)
+    if settings.alerts_enabled:
+        try:
+            with etapa("alertas"):
+                creadas = generar_alertas(db, fecha)
+            logger.info("Alertas nuevas en el outbox: %d", creadas)
+        except Exception as e:
+            logger.exception("Error generando alertas: %s", e)
+            db.rollback()
     
     return nuevas_predicciones
+
+
+def obtener_reporte_con_historial(db: Session):
+    fecha_hoy = fechas.hoy()
+    logger.debug("Consultando historial para: %s", fecha_hoy)
+
+    # 1. Buscar en BD
+    with etapa("bd_lectura"):
+        registros_hoy = buscar_registros_del_dia(db, fecha_hoy)
+
+    # 2. ESCENARIO A: YA EXISTEN (Retornar desde BD)
+    if registros_hoy:
+        logger.debug("Se encontraron %d registros en BD.", len(registros_hoy))
+        return reconstruir_respuesta(registros_hoy)
+
+    # 3. ESCENARIO B: NO EXISTEN (Calcular y Guardar una sola vez)
+    # Se devuelve la conexión al pool antes de esperar: el hilo que calcula puede necesitar otra
+    db.rollback()
+    with etapa("espera_lock"):
+        _lock_calculo_diario.acquire()
+    try:
+        # Otro hilo pudo haber terminado el cálculo mientras esperábamos el lock
+        db.rollback()
+        with etapa("bd_lectura"):
+            registros_hoy = buscar_registros_del_dia(db, fecha_hoy)
+        if registros_hoy:
+            return reconstruir_respuesta(registros_hoy)
+
+        token = reclamar_calculo_diario(db, fecha_hoy)
+        while token is None:
+            # Otro proceso está calculando: esperamos su resultado
+            logger.info("Otro proceso está calculando el reporte de hoy, esperando...")
+            with etapa("espera_otro_proceso"):
+                registros_hoy = esperar_calculo_diario(db, fecha_hoy)
+            if registros_hoy:
+                return reconstruir_respuesta(registros_hoy)
+
+            marca = db.get(models.DailyReportRun, fecha_hoy)
+            if marca is not None and marca.status == "listo":
+                # Marcado como listo pero sin registros visibles: se recalcula, pero solo
+                # quien logre pasar la marca a "calculando"; los demás vuelven a esperar
+                token = reclamar_recalculo(db, fecha_hoy)
+            else:
+                token = reclamar_calculo_diario(db, fecha_hoy)
+
+        return calcular_y_guardar(db, fecha_hoy, token)
+    finally:
+        _lock_calculo_diario.release()
+
+
+def obtener_reporte_guardado(db: Session):
+    """
+    Solo lee de la BD, nunca calcula (el cálculo lo hace el programador en segundo plano).
+    Si todavía no existe el reporte de hoy, devuelve el último día disponible.
+    """
+    registros = buscar_registros_del_dia(db, fechas.hoy())
+    if not registros:
+        ultimo = db.query(func.max(models.PredictionReport.report_date)).scalar()
+        if ultimo is None:
+            return []
+        registros = buscar_registros_del_dia(db, ultimo)
+    return reconstruir_respuesta(registros)
+
+
+def recalcular_reporte_del_dia(db: Session, fecha):
+    """
+    Vuelve a calcular el reporte de la fecha (p. ej. tras cambiar la versión del modelo)
+    y lo reemplaza en una sola transacción: mientras tanto se sigue sirviendo el anterior.
+    Devuelve None si otro proceso tiene el cálculo en curso.
+    """
+    with _lock_calculo_diario:
+        token = reclamar_calculo_diario(db, fecha, forzar=True)
+        if token is None:
+            return None
+        return calcular_y_guardar(db, fecha, token, reemplazar=True)
+
+
+def reclamar_recalculo(db: Session, fecha):
+    """
+    Reclama un reporte ya "listo" para recalcularlo (UPDATE condicional listo -> calculando):
+    solo un proceso lo consigue; mientras tanto los demás siguen leyendo los registros vigentes.
+    Devuelve el token del reclamo o None.
+    """
+    token = uuid.uuid4().hex
+    reclamadas = db.query(models.DailyReportRun).filter(
+        models.DailyReportRun.report_date == fecha,
+        models.DailyReportRun.status == "listo",
+    ).update({"status": "calculando", "started_at": datetime.utcnow(), "token": token}, synchronize_session=False)
+    db.commit()
+    return token if reclamadas == 1 else None
+
+
+def recalcular_atrasados(db: Session, fecha):
+    """
+    Recalcula solo los cantones del reporte de la fecha que se calcularon con features
+    atrasadas y los actualiza en su lugar (el resto del reporte no se toca ni se borra).
+    Devuelve la cantidad de cantones recalculados, o None si otro proceso tenía el reporte.
+    """
+    with _lock_calculo_diario:
+        token = reclamar_recalculo(db, fecha)
+        if token is None:
+            return None
+        try:
+            atrasados = {
+                r.location for r in buscar_registros_del_dia(db, fecha)
+                if r.weather_date is not None and r.weather_date < fecha
+            }
+            cantones = [c for c in registro_cantones.obtener().cantones() if c['canton'] in atrasados]
+            with etapa("mapa"):
+                predicciones = sismo_service.generar_mapa_riesgo(cantones=cantones) if cantones else []
+            if isinstance(predicciones, dict):
+                raise RuntimeError(predicciones["error"])
+
+            # Solo se reemplazan los que ahora tienen clima nuevo
+            nuevas = [p for p in predicciones if not p["datos_atrasados"]]
+            if nuevas:
+                with etapa("bd_insercion"):
+                    tabla = models.PredictionReport.__table__
+                    stmt = dialect_insert(tabla).values([
+                        {
+                            "location": p['canton'],
+                            "probability": p['probabilidad'],
+                            "risk_level": p['nivel_riesgo'],
+                            "report_date": fecha,
+                            "model_version": p.get('version_modelo'),
+                            "weather_date": p.get('fecha_clima'),
+                        }
+                        for p in nuevas
+                    ])
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=["report_date", "location"],
+                        set_={
+                            "probability": stmt.excluded.probability,
+                            "risk_level": stmt.excluded.risk_level,
+                            "model_version": stmt.excluded.model_version,
+                            "weather_date": stmt.excluded.weather_date,
+                        },
+                    )
+                    db.execute(stmt)
+                with etapa("rollups"):
+                    actualizar_rollups(db, fecha)
+
+            # Nueva marca "listo" (finished_at) -> nueva versión de la respuesta materializada
+            if not finalizar_calculo_diario(db, fecha, token, "listo"):
+                raise RuntimeError(f"Otro proceso retomó el reporte de {fecha}")
+            with etapa("bd_commit"):
+                db.commit()
+        except Exception:
+            # Los registros anteriores siguen siendo válidos: se devuelve la marca a "listo"
+            db.rollback()
+            db.query(models.DailyReportRun).filter(
+                models.DailyReportRun.report_date == fecha,
+                models.DailyReportRun.token == token,
+            ).update({"status": "listo"}, synchronize_session=False)
+            db.commit()
+            raise
+    reporte_materializado.invalidar()
+    logger.info("Cantones con datos atrasados recalculados: %d de %d", len(nuevas), len(atrasados))
+
+    if nuevas and settings.alerts_enabled:
+        try:
+            with etapa("alertas"):
+                generar_alertas(db, fecha)
+        except Exception as e:
+            logger.exception("Error generando alertas: %s", e)
+            db.rollback()
+    return len(nuevas)
@@ -0,0 +1,134 @@
+import hmac
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Funciones donde un hilo está esperando (sin trabajo): sus muestras se descartan
+ESPERAS = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("connection.py", "_recv_bytes"),
+    ("connection.py", "_poll"),
+}
+
+
+class PerfilMuestreo:
+    """
+    Perfil por muestreo de una sola petición: un hilo toma las pilas de todos
+    los hilos del proceso cada `intervalo` segundos mientras la petición está en
+    curso, descartando los que están en espera. El resultado queda en formato
+    "folded" (una línea por pila: `a;b;c conteo`), que leen flamegraph.pl y speedscope.
+
+    Como se muestrea el proceso entero, lo que hagan otras peticiones a la vez
+    también aparece: conviene perfilar con poca carga.
+    """
+
+    def __init__(self, ruta, intervalo):
+        self.ruta = ruta
+        self.intervalo = intervalo
+        self.pilas = Counter()
+        self.muestras = 0
+        self._fin = threading.Event()
+        self._hilo = threading.Thread(target=self._muestrear, name="perfilador", daemon=True)
+        self._inicio = time.perf_counter()
+
+    def cabecera(self):
+        return (b"x-perfil", os.path.basename(self.ruta).encode())
+
+    def iniciar(self):
+        self._hilo.start()
+        return self
+
+    def _muestrear(self):
+        propio = threading.get_ident()
+        while not self._fin.wait(self.intervalo):
+            for ident, marco in sys._current_frames().items():
+                if ident == propio:
+                    continue
+                codigo = marco.f_code
+                if (os.path.basename(codigo.co_filename), codigo.co_name) in ESPERAS:
+                    continue
+                pila = []
+                while marco is not None:
+                    codigo = marco.f_code
+                    pila.append(f"{os.path.basename(codigo.co_filename)}:{codigo.co_name}")
+                    marco = marco.f_back
+                self.pilas[";".join(reversed(pila))] += 1
+            self.muestras += 1
+
+    def terminar(self):
+        self._fin.set()
+        self._hilo.join()
+        duracion = time.perf_counter() - self._inicio
+        try:
+            os.makedirs(os.path.dirname(self.ruta) or ".", exist_ok=True)
+            with open(self.ruta, "w") as f:
+                for pila, conteo in self.pilas.most_common():
+                    f.write(f"{pila} {conteo}\n")
+        except OSError:
+            logger.exception("No se pudo guardar el perfil en %s", self.ruta)
+            return
+
+        hojas = Counter()
+        for pila, conteo in self.pilas.items():
+            hojas[pila.rsplit(";", 1)[-1]] += conteo
+        total = sum(hojas.values()) or 1
+        principales = ", ".join(f"{hoja} {conteo * 100 / total:.0f}%" for hoja, conteo in hojas.most_common(5))
+        logger.info(
+            "Perfil guardado en %s (%.0f ms, %d muestras): %s",
+            self.ruta, duracion * 1000, self.muestras, principales or "sin muestras activas",
+        )
+
+
+class Perfilador:
+    """
+    Perfilado a pedido (opt-in): con settings.profiler_enabled, una petición con
+    las cabeceras `X-Perfilar: 1` y `X-Admin-Token` válido se muestrea y su perfil
+    se guarda en profiler_dir (el nombre del archivo vuelve en la cabecera X-Perfil).
+    Solo un perfil a la vez por worker.
+    """
+
+    def __init__(self, directorio, intervalo_ms):
+        self.directorio = directorio
+        self.intervalo = intervalo_ms / 1000
+        self._ocupado = threading.Lock()
+
+    def pedido(self, scope):
+        if not settings.profiler_enabled or not settings.admin_token:
+            return False
+        cabeceras = dict(scope.get("headers") or [])
+        # En bytes: compare_digest no acepta str con caracteres no ASCII
+        token = cabeceras.get(b"x-admin-token", b"")
+        return cabeceras.get(b"x-perfilar") == b"1" and hmac.compare_digest(token, settings.admin_token.encode())
+
+    def iniciar_si_pedido(self, scope):
+        if not self.pedido(scope) or not self._ocupado.acquire(blocking=False):
+            return None
+        ruta = re.sub(r"[^A-Za-z0-9_-]+", "_", scope["path"]).strip("_") or "raiz"
+        nombre = f"perfil_{datetime.now():%Y%m%d_%H%M%S_%f}_{scope['method']}_{ruta}.txt"
+        perfil = PerfilMuestreo(os.path.join(self.directorio, nombre), self.intervalo)
+        terminar = perfil.terminar
+
+        def terminar_y_liberar():
+            try:
+                terminar()
+            finally:
+                self._ocupado.release()
+
+        perfil.terminar = terminar_y_liberar
+        return perfil.iniciar()
+
+
+perfilador = Perfilador(settings.profiler_dir, settings.profiler_interval_ms)
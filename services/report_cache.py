@@ -0,0 +1,88 @@
+import gzip
+import hashlib
+import json
+import threading
+import time
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.orm import Session
+
+from app import models
+from app.config import settings
+from services import fechas
+
+
+class RespuestaMaterializada:
+    def __init__(self, datos, version):
+        self.version = version
+        filas = jsonable_encoder(datos)
+        # Para /riesgo-sismico/punto: la fila de cada cantón sin recorrer la lista
+        self.por_canton = {fila["canton"]: fila for fila in filas}
+        self.cuerpo = json.dumps(filas, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.etag = '"' + hashlib.sha256(self.cuerpo).hexdigest()[:32] + '"'
+        # Solo vale la pena comprimir respuestas medianas
+        self.cuerpo_gzip = gzip.compress(self.cuerpo, compresslevel=6) if len(self.cuerpo) >= 1024 else None
+        self.validado = time.monotonic()
+
+
+class ReporteMaterializado:
+    """
+    Guarda en memoria la respuesta de /riesgo-sismico ya serializada (y comprimida)
+    junto con su ETag. El reporte cambia una vez al día, así que casi todas
+    las peticiones se responden sin consultar la BD ni volver a serializar.
+
+    Invalidación:
+    - en este proceso, inmediata al guardar un reporte nuevo (invalidar());
+    - entre workers, cada `revalidar_cada` segundos se compara la versión
+      del reporte del día (marca de DailyReportRun, búsqueda por clave primaria).
+    """
+
+    def __init__(self, revalidar_cada):
+        self.revalidar_cada = revalidar_cada
+        self._respuesta = None
+        self._lock = threading.Lock()
+
+    def invalidar(self):
+        self._respuesta = None
+
+    @staticmethod
+    def version_actual(db: Session):
+        hoy = fechas.hoy()
+        marca = db.get(models.DailyReportRun, hoy)
+        terminado = marca.finished_at if marca is not None and marca.status == "listo" else None
+        return (hoy, terminado)
+
+    def vigente(self):
+        """La respuesta guardada si todavía no toca revalidarla (sin tocar la BD), o None."""
+        respuesta = self._respuesta
+        if respuesta is not None and respuesta.version[0] == fechas.hoy() \
+                and time.monotonic() - respuesta.validado < self.revalidar_cada:
+            return respuesta
+        return None
+
+    def obtener(self, db: Session, construir):
+        """
+        Devuelve la respuesta materializada, reconstruyéndola con construir(db)
+        solo si cambió la versión. Si construir no devuelve datos, no se guarda nada.
+        """
+        respuesta = self.vigente()
+        if respuesta is not None:
+            return respuesta
+
+        with self._lock:
+            version = self.version_actual(db)
+            respuesta = self._respuesta
+            if respuesta is not None and respuesta.version == version:
+                respuesta.validado = time.monotonic()
+                return respuesta
+
+            datos = construir(db)
+            if not datos or isinstance(datos, dict):
+                return None
+            # Si el reporte se calculó dentro de construir(), la versión cambió
+            respuesta = RespuestaMaterializada(datos, self.version_actual(db))
+            self._respuesta = respuesta
+            return respuesta
+
+
+reporte_materializado = ReporteMaterializado(settings.riesgo_cache_revalidate_seconds)
@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+
+from app.config import settings
+from app.database import SessionLocal
+from services.predict_service import (
+    buscar_registros_del_dia,
+    obtener_reporte_con_historial,
+    recalcular_atrasados,
+    recalcular_reporte_del_dia,
+    sismo_service,
+)
+from services.grid_service import grilla_riesgo
+from services.city_catalog import registro_cantones
+from services import fechas
+from services.metrics import traza
+
+logger = logging.getLogger(__name__)
+
+
+def parsear_horarios(texto):
+    """ "00:05,12:00" -> [(0, 5), (12, 0)] """
+    horarios = []
+    for parte in texto.split(","):
+        parte = parte.strip()
+        if not parte:
+            continue
+        hora, minuto = parte.split(":")
+        horarios.append((int(hora), int(minuto)))
+    return sorted(horarios)
+
+
+def proxima_ejecucion(horarios, ahora):
+    for dias in (0, 1):
+        dia = (ahora + timedelta(days=dias)).date()
+        for hora, minuto in horarios:
+            candidato = datetime.combine(dia, datetime.min.time()).replace(hour=hora, minute=minuto)
+            if candidato > ahora:
+                return candidato
+    return None
+
+
+class ProgramadorReporte:
+    """
+    Precalcula el reporte diario fuera del camino de las peticiones.
+    Se inicia desde el lifespan de FastAPI. Si hay varios workers, cada uno
+    tiene su programador, pero el cálculo sigue siendo único por día
+    (ver obtener_reporte_con_historial).
+    """
+
+    def __init__(self):
+        self.horarios = parsear_horarios(settings.scheduler_run_times)
+        self._tarea = None
+        self._ejecucion = None
+        self.estado = {
+            "ultima_ejecucion": None,
+            "duracion_segundos": None,
+            "resultado": None,
+            "cantones_calculados": None,
+            "cantones_fallidos": None,
+            "cantones_atrasados": None,
+            "intentos": 0,
+            "error": None,
+            "grilla": None,
+            "proxima_ejecucion": None,
+        }
+
+    @property
+    def ejecutando(self):
+        return self._ejecucion is not None and not self._ejecucion.done()
+
+    def iniciar(self):
+        self._tarea = asyncio.create_task(self._bucle())
+
+    async def detener(self):
+        for tarea in (self._tarea, self._ejecucion):
+            if tarea is not None and not tarea.done():
+                tarea.cancel()
+                try:
+                    await tarea
+                except asyncio.CancelledError:
+                    pass
+
+    def disparar(self, forzar=False):
+        """Ejecución manual (operadores). Devuelve False si ya hay una en curso."""
+        if self.ejecutando:
+            return False
+        self._ejecucion = asyncio.create_task(self.ejecutar_con_reintentos(forzar))
+        return True
+
+    async def _bucle(self):
+        if settings.scheduler_run_on_startup:
+            self.disparar()
+
+        while True:
+            siguiente = proxima_ejecucion(self.horarios, fechas.ahora())
+            if siguiente is None:
+                logger.warning("Programador sin horarios configurados.")
+                return
+            self.estado["proxima_ejecucion"] = siguiente.isoformat()
+            await asyncio.sleep((siguiente - fechas.ahora()).total_seconds())
+
+            if self.ejecutando:
+                await self._ejecucion
+            self.disparar()
+
+    async def ejecutar_con_reintentos(self, forzar=False):
+        """
+        Reintenta si el cálculo falla. Si terminó pero con cantones calculados con
+        features atrasadas (Open-Meteo caído), más tarde se recalculan solo esos cantones.
+        """
+        ok = False
+        for intento in range(1, settings.scheduler_max_retries + 1):
+            self.estado["intentos"] = intento
+            if ok:
+                await self.ejecutar_atrasados()
+            else:
+                ok = await self.ejecutar(forzar)
+            if ok and not self.estado["cantones_atrasados"]:
+                return True
+            if intento == settings.scheduler_max_retries:
+                break
+            if ok:
+                logger.warning("Reporte diario con %d cantones con datos atrasados (intento %d), recalculando en %ss",
+                               self.estado["cantones_atrasados"], intento, settings.scheduler_retry_seconds)
+            else:
+                logger.warning("Reporte diario falló (intento %d), reintentando en %ss",
+                               intento, settings.scheduler_retry_seconds)
+            await asyncio.sleep(settings.scheduler_retry_seconds)
+        return ok
+
+    async def ejecutar_atrasados(self):
+        """Recalcula los cantones atrasados del reporte de hoy (la grilla no se rehace)."""
+        inicio = time.perf_counter()
+        self.estado["ultima_ejecucion"] = fechas.ahora().isoformat()
+        try:
+            self.estado["cantones_atrasados"] = await asyncio.to_thread(self._recalcular_atrasados)
+            self.estado["error"] = None
+        except Exception as e:
+            logger.exception("Error recalculando cantones atrasados: %s", e)
+            self.estado["error"] = str(e)
+        finally:
+            self.estado["duracion_segundos"] = round(time.perf_counter() - inicio, 3)
+
+    async def ejecutar(self, forzar=False):
+        inicio = time.perf_counter()
+        self.estado["ultima_ejecucion"] = fechas.ahora().isoformat()
+        try:
+            # El cálculo es bloqueante (requests, xgboost, sqlalchemy): va en un hilo
+            calculados, atrasados = await asyncio.to_thread(self._calcular_reporte, forzar)
+            self.estado["cantones_calculados"] = calculados
+            self.estado["cantones_fallidos"] = max(len(registro_cantones.obtener()) - calculados, 0)
+            self.estado["cantones_atrasados"] = atrasados
+            self.estado["error"] = None
+            ok = calculados > 0
+            self.estado["resultado"] = "ok" if ok else "error"
+            if ok and settings.grid_enabled:
+                await self.ejecutar_grilla(forzar)
+            return ok
+        except Exception as e:
+            logger.exception("Error en el cálculo programado: %s", e)
+            self.estado["resultado"] = "error"
+            self.estado["error"] = str(e)
+            return False
+        finally:
+            self.estado["duracion_segundos"] = round(time.perf_counter() - inicio, 3)
+
+    async def ejecutar_grilla(self, forzar=False):
+        # Un fallo en la grilla no invalida el reporte por cantón
+        try:
+            inicio = time.perf_counter()
+            resultado = await asyncio.to_thread(self._calcular_grilla, forzar)
+            if resultado == "calculada":
+                resultado = f"ok ({time.perf_counter() - inicio:.1f}s)"
+            self.estado["grilla"] = resultado
+        except Exception as e:
+            logger.exception("Error calculando la grilla de riesgo: %s", e)
+            self.estado["grilla"] = f"error: {e}"
+
+    def _calcular_reporte(self, forzar):
+        hoy = fechas.hoy()
+        db = SessionLocal()
+        try:
+            with traza(f"reporte programado {hoy.isoformat()}"):
+                if forzar:
+                    # Se reemplaza el reporte de hoy (p. ej. con otra versión del modelo)
+                    resultado = recalcular_reporte_del_dia(db, hoy)
+                    if resultado is None:
+                        raise RuntimeError("Otro proceso está calculando el reporte de hoy")
+                    if isinstance(resultado, dict) or not resultado:
+                        raise RuntimeError("No se pudo recalcular el reporte de hoy")
+                obtener_reporte_con_historial(db)
+            db.rollback()
+            # Contamos lo guardado (puede haberlo calculado otro worker)
+            registros = buscar_registros_del_dia(db, hoy)
+            atrasados = sum(1 for r in registros if r.weather_date is not None and r.weather_date < hoy)
+            return len(registros), atrasados
+        finally:
+            db.close()
+
+    def _recalcular_atrasados(self):
+        hoy = fechas.hoy()
+        db = SessionLocal()
+        try:
+            with traza(f"atrasados {hoy.isoformat()}"):
+                if recalcular_atrasados(db, hoy) is None:
+                    logger.info("Otro proceso está recalculando el reporte de hoy")
+            db.rollback()
+            registros = buscar_registros_del_dia(db, hoy)
+            return sum(1 for r in registros if r.weather_date is not None and r.weather_date < hoy)
+        finally:
+            db.close()
+
+    def _calcular_grilla(self, forzar=False):
+        hoy = fechas.hoy()
+        if not forzar and grilla_riesgo.existe(hoy):
+            return "ok (ya existía)"
+        # Una sola grilla por día entre todos los workers
+        if not grilla_riesgo.reclamar(hoy):
+            logger.info("Otro worker está calculando la grilla de hoy")
+            return "ok (en curso en otro worker)"
+        try:
+            # Pudo terminarla otro worker justo antes de reclamarla
+            if not forzar and grilla_riesgo.existe(hoy):
+                return "ok (ya existía)"
+            with traza(f"grilla {hoy.isoformat()}"):
+                grilla_riesgo.calcular(sismo_service, hoy)
+            return "calculada"
+        finally:
+            grilla_riesgo.liberar(hoy)
+
+
+programador_reporte = ProgramadorReporte()
@@ -0,0 +1,140 @@
+import json
+import re
+
+import numpy as np
+
+
+def _sigmoide(margen):
+    return 1.0 / (1.0 + np.exp(-margen))
+
+
+class ModeloNoSoportado(ValueError):
+    """El modelo usa algo que el evaluador NumPy no implementa (se usa XGBoost para él)."""
+
+
+# objetivo -> (función de enlace, base_score a margen)
+OBJETIVOS = {
+    "binary:logistic": (_sigmoide, lambda p: np.log(p / (1.0 - p))),
+    "reg:logistic": (_sigmoide, lambda p: np.log(p / (1.0 - p))),
+    "reg:squarederror": (lambda m: m, lambda p: p),
+}
+
+
+class EnsambleCompilado:
+    """
+    Los árboles de un booster de XGBoost aplanados en arreglos NumPy, para
+    evaluar lotes pequeños sin construir DMatrix ni llamar a Booster.predict.
+
+    Todos los nodos de todos los árboles están en los mismos arreglos (índices
+    globales). Las hojas apuntan a sí mismas, así que basta avanzar
+    `profundidad` pasos para que cada (fila, árbol) termine en su hoja, sin ramas.
+    Booster.predict sigue siendo la referencia.
+    """
+
+    def __init__(self, feature, umbral, izquierda, derecha, defecto_izquierda, hoja,
+                 raices, profundidad, margen_base, enlace):
+        self.feature = feature
+        self.umbral = umbral
+        self.defecto_derecha = ~defecto_izquierda
+        # hijos[2 * nodo + va_derecha]: un solo take por paso para bajar de nivel
+        self.hijos = np.stack([izquierda, derecha], axis=1).ravel()
+        self.hoja = hoja
+        self.raices = raices
+        self.profundidad = profundidad
+        self.margen_base = margen_base
+        self.enlace = enlace
+
+    @classmethod
+    def desde_booster(cls, booster):
+        return cls.desde_json(json.loads(booster.save_raw("json")))
+
+    @classmethod
+    def desde_json(cls, modelo):
+        learner = modelo["learner"]
+        objetivo = learner["objective"]["name"]
+        if objetivo not in OBJETIVOS:
+            raise ModeloNoSoportado(f"Objetivo no soportado: {objetivo}")
+        booster = learner["gradient_booster"]
+        if booster["name"] != "gbtree":
+            raise ModeloNoSoportado(f"Booster no soportado: {booster['name']}")
+        parametros = learner["learner_model_param"]
+        if int(parametros.get("num_class", "0")) > 1 or int(parametros.get("num_target", "1")) > 1:
+            raise ModeloNoSoportado("Modelos multiclase/multisalida no soportados")
+
+        arboles = booster["model"]["trees"]
+        features, umbrales, izquierdas, derechas, defectos, hojas, raices = [], [], [], [], [], [], []
+        profundidad = 0
+        desplazamiento = 0
+        for arbol in arboles:
+            if any(arbol.get("split_type", [])):
+                raise ModeloNoSoportado("Splits categóricos no soportados")
+            izq = np.asarray(arbol["left_children"], dtype=np.int64)
+            der = np.asarray(arbol["right_children"], dtype=np.int64)
+            condiciones = np.asarray(arbol["split_conditions"], dtype=np.float32)
+            n = len(izq)
+            es_hoja = izq == -1
+            propios = np.arange(n)
+
+            # Las hojas apuntan a sí mismas; los demás nodos a índices globales
+            features.append(np.where(es_hoja, 0, np.asarray(arbol["split_indices"], dtype=np.int64)))
+            umbrales.append(condiciones)
+            izquierdas.append(np.where(es_hoja, propios, izq) + desplazamiento)
+            derechas.append(np.where(es_hoja, propios, der) + desplazamiento)
+            defectos.append(np.asarray(arbol["default_left"], dtype=bool))
+            # En las hojas, split_conditions guarda el valor de la hoja
+            hojas.append(np.where(es_hoja, condiciones, 0.0).astype(np.float32))
+            raices.append(desplazamiento)
+            profundidad = max(profundidad, cls._profundidad(izq, der))
+            desplazamiento += n
+
+        enlace, a_margen = OBJETIVOS[objetivo]
+        base_score = float(re.sub(r"[\[\]]", "", parametros["base_score"]))
+        return cls(
+            feature=np.concatenate(features).astype(np.intp),
+            umbral=np.concatenate(umbrales),
+            izquierda=np.concatenate(izquierdas).astype(np.intp),
+            derecha=np.concatenate(derechas).astype(np.intp),
+            defecto_izquierda=np.concatenate(defectos),
+            hoja=np.concatenate(hojas),
+            raices=np.asarray(raices, dtype=np.intp),
+            profundidad=profundidad,
+            margen_base=float(a_margen(base_score)),
+            enlace=enlace,
+        )
+
+    @staticmethod
+    def _profundidad(izq, der):
+        profundidad, nivel = 0, [0]
+        while True:
+            hijos = [h for nodo in nivel for h in (izq[nodo], der[nodo]) if h != -1]
+            if not hijos:
+                return profundidad
+            profundidad += 1
+            nivel = hijos
+
+    def margen(self, matriz, filas_por_bloque=4096):
+        matriz = np.asarray(matriz, dtype=np.float32)
+        if matriz.ndim == 1:
+            matriz = matriz[None, :]
+        resultado = np.empty(matriz.shape[0], dtype=np.float64)
+        for inicio in range(0, matriz.shape[0], filas_por_bloque):
+            bloque = matriz[inicio:inicio + filas_por_bloque]
+            resultado[inicio:inicio + len(bloque)] = self._margen_bloque(bloque)
+        return resultado
+
+    def _margen_bloque(self, bloque):
+        n, n_features = bloque.shape
+        valores = np.ascontiguousarray(bloque).ravel()
+        inicio_fila = (np.arange(n, dtype=np.intp) * n_features)[:, None]
+        nodo = np.broadcast_to(self.raices, (n, len(self.raices))).copy()
+        for _ in range(self.profundidad):
+            x = valores.take(inicio_fila + self.feature.take(nodo))
+            va_derecha = ~(x < self.umbral.take(nodo))
+            faltante = np.isnan(x)
+            if faltante.any():
+                va_derecha = np.where(faltante, self.defecto_derecha.take(nodo), va_derecha)
+            nodo = self.hijos.take(2 * nodo + va_derecha)
+        return self.margen_base + self.hoja.take(nodo).sum(axis=1, dtype=np.float64)
+
+    def predecir(self, matriz):
+        return self.enlace(self.margen(matriz)).astype(np.float32)
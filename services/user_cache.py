@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+
+from app import auth, models
+from app.config import settings
+from services.metrics import metricas
+
+
+class CacheLRU:
+    """Diccionario acotado: vence cada entrada en su instante y descarta la menos usada."""
+
+    def __init__(self, max_entradas):
+        self.max_entradas = max_entradas
+        self.hits = 0
+        self.misses = 0
+        self._datos = OrderedDict()  # clave -> (valor, vence)
+        self._lock = threading.Lock()
+
+    def obtener(self, clave):
+        ahora = time.time()
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None or entrada[1] <= ahora:
+                if entrada is not None:
+                    del self._datos[clave]
+                self.misses += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.hits += 1
+            return entrada[0]
+
+    def guardar(self, clave, valor, vence):
+        with self._lock:
+            self._datos[clave] = (valor, vence)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def eliminar_si(self, condicion):
+        with self._lock:
+            descartar = [clave for clave, (valor, _) in self._datos.items() if condicion(clave, valor)]
+            for clave in descartar:
+                del self._datos[clave]
+
+    def estadisticas(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else None,
+            "entradas": len(self._datos),
+            "max_entradas": self.max_entradas,
+        }
+
+
+class UsuarioActual:
+    """Copia de los datos del usuario, independiente de la sesión de BD."""
+
+    __slots__ = ("id", "first_name", "last_name", "email", "username", "created_at")
+
+    def __init__(self, user):
+        self.id = user.id
+        self.first_name = user.first_name
+        self.last_name = user.last_name
+        self.email = user.email
+        self.username = user.username
+        self.created_at = user.created_at
+
+
+class CacheUsuarios:
+    """
+    Resolución token -> usuario sin ir a la BD en cada petición autenticada.
+
+    - Tokens: el resultado de decodificar el JWT, hasta que vence el token.
+    - Usuarios: los datos del usuario por id (o por email en tokens sin "uid"),
+      a lo sumo `ttl` segundos y nunca más allá del vencimiento del token.
+    - Al modificarse o borrarse un User en este proceso se descarta su entrada;
+      en los demás workers dura como máximo `ttl`.
+    """
+
+    def __init__(self, max_entradas, ttl):
+        self.ttl = ttl
+        self.tokens = CacheLRU(max_entradas)
+        self.usuarios = CacheLRU(max_entradas)
+
+    def decodificar(self, token):
+        token_data = self.tokens.obtener(token)
+        if token_data is None:
+            token_data = auth.decode_access_token(token)
+            if token_data is not None and token_data.exp:
+                self.tokens.guardar(token, token_data, token_data.exp)
+        return token_data
+
+    @staticmethod
+    def clave_usuario(token_data):
+        return ("id", token_data.user_id) if token_data.user_id is not None else ("email", token_data.email)
+
+    def obtener_usuario(self, token_data):
+        return self.usuarios.obtener(self.clave_usuario(token_data))
+
+    def guardar_usuario(self, token_data, user):
+        usuario = UsuarioActual(user)
+        vence = time.time() + self.ttl
+        if token_data.exp:
+            vence = min(vence, token_data.exp)
+        self.usuarios.guardar(self.clave_usuario(token_data), usuario, vence)
+        return usuario
+
+    def invalidar_usuario(self, user_id=None, email=None):
+        self.usuarios.eliminar_si(lambda clave, usuario: usuario.id == user_id or usuario.email == email)
+
+    def estadisticas(self):
+        return {
+            "tokens": self.tokens.estadisticas(),
+            "usuarios": self.usuarios.estadisticas(),
+            "ttl_segundos": self.ttl,
+        }
+
+
+cache_usuarios = CacheUsuarios(settings.user_cache_max_entries, settings.user_cache_ttl_seconds)
+
+metricas.contador(
+    "cache_usuarios_total", "Consultas a la caché de get_current_user por nivel y resultado", ("nivel", "resultado"),
+    funcion=lambda: {
+        clave: valor
+        for nivel, cache in (("token", cache_usuarios.tokens), ("usuario", cache_usuarios.usuarios))
+        for clave, valor in (((nivel, "hit"), cache.hits), ((nivel, "miss"), cache.misses))
+    },
+)
+
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _usuario_modificado(mapper, connection, target):
+    cache_usuarios.invalidar_usuario(target.id, target.email)
@@ -0,0 +1,136 @@
+import json
+import sqlite3
+import threading
+import time
+
+from app.config import settings
+from services import fechas
+from services.metrics import metricas
+
+
+class WeatherCache:
+    """
+    Caché de respuestas de Open-Meteo en un archivo SQLite.
+    Al ser un archivo en disco lo comparten todos los workers de uvicorn
+    y sobrevive a los reinicios.
+
+    Clave: (lat, lon, variables, fecha). Cada entrada vence a los ttl segundos
+    y, si se supera max_entradas, se eliminan primero las más antiguas.
+    """
+
+    def __init__(self, ruta, ttl, max_entradas):
+        self.ruta = ruta
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._tabla_lista = False
+
+    def _conectar(self):
+        conn = sqlite3.connect(self.ruta, timeout=10)
+        # WAL permite lecturas concurrentes desde varios procesos mientras uno escribe
+        conn.execute("PRAGMA journal_mode=WAL")
+        # El archivo se crea en el primer uso, no al importar el módulo
+        if not self._tabla_lista:
+            self._crear_tabla(conn)
+            self._tabla_lista = True
+        return conn
+
+    def _crear_tabla(self, conn):
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS weather_cache (
+                    clave TEXT PRIMARY KEY,
+                    respuesta TEXT NOT NULL,
+                    creado REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_weather_cache_creado ON weather_cache (creado)")
+
+    @staticmethod
+    def clave(lat, lon, variables, fecha=None):
+        fecha = fecha or fechas.hoy()
+        return f"{float(lat):.4f},{float(lon):.4f}|{','.join(variables)}|{fecha.isoformat()}"
+
+    def obtener_varios(self, claves):
+        """Devuelve {clave: json} solo para las claves vigentes en la caché."""
+        if not claves:
+            return {}
+        limite = time.time() - self.ttl
+        encontrados = {}
+        conn = self._conectar()
+        try:
+            # SQLite limita la cantidad de parámetros por consulta
+            for i in range(0, len(claves), 500):
+                parte = claves[i:i + 500]
+                marcas = ",".join("?" * len(parte))
+                filas = conn.execute(
+                    f"SELECT clave, respuesta FROM weather_cache WHERE creado >= ? AND clave IN ({marcas})",
+                    [limite, *parte],
+                ).fetchall()
+                for clave, respuesta in filas:
+                    encontrados[clave] = json.loads(respuesta)
+        finally:
+            conn.close()
+
+        with self._lock:
+            self.hits += len(encontrados)
+            self.misses += len(claves) - len(encontrados)
+        return encontrados
+
+    def guardar_varios(self, entradas):
+        """entradas: {clave: json}. Inserta/reemplaza y aplica el límite de tamaño."""
+        if not entradas:
+            return
+        ahora = time.time()
+        conn = self._conectar()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO weather_cache (clave, respuesta, creado) VALUES (?, ?, ?)",
+                    [(clave, json.dumps(respuesta), ahora) for clave, respuesta in entradas.items()],
+                )
+                conn.execute("DELETE FROM weather_cache WHERE creado < ?", (ahora - self.ttl,))
+                conn.execute(
+                    """
+                    DELETE FROM weather_cache WHERE clave IN (
+                        SELECT clave FROM weather_cache ORDER BY creado DESC LIMIT -1 OFFSET ?
+                    )
+                    """,
+                    (self.max_entradas,),
+                )
+        finally:
+            conn.close()
+
+    def estadisticas(self):
+        conn = self._conectar()
+        try:
+            entradas = conn.execute("SELECT COUNT(*) FROM weather_cache").fetchone()[0]
+        finally:
+            conn.close()
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else None,
+            "entradas": entradas,
+            "max_entradas": self.max_entradas,
+            "ttl_segundos": self.ttl,
+        }
+
+
+weather_cache = (
+    WeatherCache(
+        settings.weather_cache_path,
+        settings.weather_cache_ttl_seconds,
+        settings.weather_cache_max_entries,
+    )
+    if settings.weather_cache_enabled else None
+)
+
+if weather_cache is not None:
+    metricas.contador(
+        "cache_clima_total", "Consultas a la caché de Open-Meteo por resultado", ("resultado",),
+        funcion=lambda: {("hit",): weather_cache.hits, ("miss",): weather_cache.misses},
+    )